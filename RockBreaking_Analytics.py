@@ -28,46 +28,34 @@ def __(mo):
 
 @app.cell
 def __():
-    #Importing relevant libraries
+    #Importing relevant libraries (only what the cells use; the charts module loads plotly when the first chart is drawn)
     import os
     import marimo as mo
     import polars as pl
-    import numpy as np
-    import pandas as pd
     import datetime as dt
     from datetime import date
-    import plotly.express as px
-    import seaborn as sns
-    import matplotlib.pyplot as plt
-    import plotly.graph_objects as go
-    from plotly.subplots import make_subplots
-    from sklearn.model_selection import train_test_split, GridSearchCV
-    from sklearn.linear_model import LinearRegression
-    from sklearn.metrics import mean_squared_error, r2_score
-    from sklearn.ensemble import RandomForestRegressor
-    from sklearn.datasets import make_regression 
-    from sklearn.svm import SVR
+    from rockbreaking import anomaly, areas, attribution, cache, charts, incremental, instrument, join, memo, model, recalibration, rolling, shifts, timeline, window
     return (
-        GridSearchCV,
-        LinearRegression,
-        RandomForestRegressor,
-        SVR,
+        anomaly,
+        areas,
+        attribution,
+        cache,
+        charts,
         date,
         dt,
-        go,
-        make_regression,
-        make_subplots,
-        mean_squared_error,
+        incremental,
+        instrument,
+        join,
+        memo,
         mo,
-        np,
+        model,
         os,
-        pd,
         pl,
-        plt,
-        px,
-        r2_score,
-        sns,
-        train_test_split,
+        recalibration,
+        rolling,
+        shifts,
+        timeline,
+        window,
     )
 
 
@@ -100,16 +88,38 @@ def __(mo):
 
 
 @app.cell
-def __(__file__, os, pl):
-    #Reading files into dataframes
+def __(__file__, os):
+    #Folder of the CSV files
     script_dir = os.path.dirname(os.path.abspath(__file__))
+    return script_dir,
 
-    data_a = pl.read_csv(os.path.join(script_dir, "A_DATA.csv")) #Reading CSV file for Primary Crushing area A
 
-    data_b = pl.read_csv(os.path.join(script_dir, "B_DATA.csv")) #Reading CSV file for Primary Crushing area B
+@app.cell
+def __(cache, memo, os, script_dir):
+    #Results of the expensive steps (join, cube, attribution, zone figures) keyed by the content of their inputs, kept in memory and in .rb_cache/memo - re-running a cell whose inputs did not change reuses them
+    rb_memo = memo.Memo(cache_dir=os.path.join(script_dir, cache.CACHE_DIRNAME, 'memo'))
+    return rb_memo,
+
+
+@app.cell
+def __(incremental, mo, rb_memo, roster, script_dir):
+    #The CSVs and the frames derived from them (join, cube) - reloading parses only the rows appended to the CSVs since the last load, and the derived frames are redone from the first production day those rows touch
+    rb_pipeline = incremental.Pipeline(script_dir, roster, memo=rb_memo)
+    reload_data = mo.ui.run_button(label='Reload the CSVs')
+    reload_data
+    return rb_pipeline, reload_data
+
+
+@app.cell
+def __(rb_pipeline, reload_data):
+    #Reading files into dataframes - the typed data is read from the cache in .rb_cache (rebuilt only when a CSV is rewritten, appended rows are merged in)
+    reload_data.value
 
-    data_rb = pl.read_csv(os.path.join(script_dir, "RB_DATA.csv")) #Reading CSV file for Downtime in the primary crushing areas and plant
-    return data_a, data_b, data_rb, script_dir
+    #Tips of every primary crushing area (A_DATA.csv, B_DATA.csv, ...) stacked with an AREA column, and the rockbreaking events of all areas (RB_DATA.csv)
+    #The production day and shift of every tip and event (SHIFT_DATE, SHIFT and SHIFT_ID) are added once here
+    #The full history is loaded once, sorted by time - the study period is cut out of it further below
+    data_tips, data_rb = rb_pipeline.load()
+    return data_rb, data_tips
 
 
 @app.cell
@@ -133,30 +143,20 @@ def __(data_rb):
 
 @app.cell
 def __(mo):
-    mo.md(r"""## Primary Crusher Area A data""")
+    mo.md(r"""## Primary Crusher Areas data""")
     return
 
 
 @app.cell
-def __(data_a):
-    data_a.describe()
-    return
-
+def __(areas, data_tips, mo):
+    for _area, _df in areas.partition(data_tips).items():
+        print('\n',f'Dataframe for Area {areas.area_label(_area)} data','\n',
+             _df.shape, _df.columns, _df.describe(),'\n')
 
-@app.cell
-def __(mo):
-    mo.md(r"""## Primary Crusher Area B data""")
-    return
-
-
-@app.cell
-def __(data_a, data_b):
-    print('\n','Dataframe for Area A data','\n',
-         data_a.shape, data_a.columns, data_a.describe(),'\n')
-
-    print('\n','Dataframe for Area B data','\n',
-         data_b.shape, data_b.columns, data_b.describe(),'\n')
-    data_b.describe()
+    mo.vstack([
+        mo.vstack([mo.md(f"### Area {areas.area_label(_area)}"), _df.drop('AREA').describe()])
+        for _area, _df in areas.partition(data_tips).items()
+    ])
     return
 
 
@@ -167,7 +167,7 @@ def __(mo):
         ##Initial Exploration findings
         During the initial exploration the following issues were identified.
 
-        * Incorrect data type for date-time: data that is supposed to be represented in datetime is currently stored as a string. This currently affects: data_rb (EVENT_START and EVENT_END) and data_a + data_b (TIP_DATETIME)
+        * Incorrect data type for date-time: data that is supposed to be represented in datetime is stored as a string in the CSV files. This affects: data_rb (EVENT_START and EVENT_END) and data_a + data_b (TIP_DATETIME). These columns are now typed as datetimes when the files are scanned and cached (see rockbreaking/ingest.py and rockbreaking/cache.py).
 
         * Event's length represented in seconds: the mean length of events is 685 seconds and the median being 409 seconds, which impacts the ability to swiftly grasp the impact of the event. It is recommended to convert the data according to the appropriate analysis (sum of downtimes use hours and mean/median of downtimes use minutes).
         """
@@ -188,132 +188,79 @@ def __(mo):
 
 
 @app.cell
-def __(pl):
-    # Start and end time of the study period
-    start_time = pl.datetime(2024,7,24,6,0,0)
-    end_time = pl.datetime(2024,7,31,6,0,0)
-    return end_time, start_time
+def __(data_rb, date, dt, mo):
+    # Study period (production days) and day to drill into, defaulting to 24/07/2024 - 30/07/2024 and each area's busiest day
+    _first, _last = data_rb['SHIFT_DATE'].min(), data_rb['SHIFT_DATE'].max()
+    study_period = mo.ui.date_range(
+        start=_first,
+        stop=_last,
+        value=(max(_first, date(2024,7,24)), min(_last, date(2024,7,30))),
+        label='Study period (production days)'
+    )
+    drill_down_day = mo.ui.dropdown(
+        options={'Busiest day of each area': None} | {
+            f'{_first + dt.timedelta(days=_i):%d/%m/%Y}': _first + dt.timedelta(days=_i)
+            for _i in range((_last - _first).days + 1)
+        },
+        value='Busiest day of each area',
+        label='Drill-down day'
+    )
+    mo.hstack([study_period, drill_down_day], justify='start')
+    return drill_down_day, study_period
 
 
 @app.cell
-def __(data_a, data_b, data_rb, end_time, pl, start_time):
-    #Splitting the downtime events into area 'A' and 'B', changing the datetime columns from string type to datetime and adjusting the Length columns from seconds to minutes
-
-    _df_rba = data_rb.filter(
-        pl.col('AREA') == "Primary Crushing - A"
-    ).with_columns(
-        pl.col('EVENT_START').str.strptime(pl.Datetime),
-        pl.col('EVENT_END').str.strptime(pl.Datetime),
-        (pl.col('LENGTH')/60).round(3).alias('LENGTH')
-    ).sort('EVENT_START')
-
-    _df_rbb = data_rb.filter(
-        pl.col('AREA') == "Primary Crushing - B"
-    ).with_columns(
-        pl.col('EVENT_START').str.strptime(pl.Datetime),
-        pl.col('EVENT_END').str.strptime(pl.Datetime),
-        (pl.col('LENGTH')/60).alias('LENGTH')
-    ).sort('EVENT_START')
-
-    _df_a = data_a.with_columns(
-        pl.col('TIP_DATETIME').str.strptime(pl.Datetime)
-    ).sort('TIP_DATETIME')
+def __(roster, study_period, window):
+    # Start and end time of the study period (from the first shift of the first day to the first shift after the last day), bounds of the study period in the rollup cube and label used in the chart titles
+    _window = window.study_window(roster, *study_period.value)
+    start_time, end_time = _window['start_time'], _window['end_time']
+    study_days, period_label = _window['study_days'], _window['period_label']
+    return end_time, period_label, start_time, study_days
 
-    _df_b = data_b.with_columns(
-        pl.col('TIP_DATETIME').str.strptime(pl.Datetime)
-    ).sort('TIP_DATETIME')
 
-    #Filter the dataframes to the period 24/07/2024 to 31/07/2024
+@app.cell
+def __(dt, shifts):
+    # Shift roster of the site - production days start with the first shift of the roster (6 am)
+    roster = shifts.ROSTERS['2x12']
 
-    df_rba = _df_rba.filter(
-        (pl.col('EVENT_START') >= start_time) &
-        (pl.col('EVENT_END') <= end_time)
-    )
+    # Longest time between a truck tip and a rockbreaking event for the tip to be blamed for the event (the longest gaps between tips in the data are just over 3 hours)
+    tip_tolerance = "4h"
 
-    df_rbb = _df_rbb.filter(
-        (pl.col('EVENT_START') >= start_time) &
-        (pl.col('EVENT_END') <= end_time)
+    # Look-back window and weighting ('recency', 'mass' or 'uniform') used to share an event between the trucks that tipped before it
+    attribution_window = dt.timedelta(minutes=30)
+    attribution_weights = 'recency'
+    return (
+        attribution_weights,
+        attribution_window,
+        roster,
+        tip_tolerance,
     )
 
-    df_a = _df_a.filter(
-        (pl.col('TIP_DATETIME') >= start_time) &
-        (pl.col('TIP_DATETIME') <= end_time)
-    )
 
-    df_b = _df_b.filter(
-        (pl.col('TIP_DATETIME') >= start_time) &
-        (pl.col('TIP_DATETIME') <= end_time)
-    )
-    return df_a, df_b, df_rba, df_rbb
-
-
-@app.cell
-def __(df_rba, df_rbb, go, pl):
-    #Adjusting the 
-    _dfa = df_rba.group_by('LOCATION').agg(pl.col('LENGTH').sum()/60)
-    _dfb = df_rbb.group_by('LOCATION').agg(pl.col('LENGTH').sum()/60)
-
-    # Generate the bar chart, ensuring the category order is respected
-    _fig = go.Figure(data=[
-        go.Bar(
-            x=_dfa['LOCATION'],
-            y=_dfa['LENGTH'],
-            name='Primary Crushing - A',
-            marker=dict(color='lightblue')
-        ),
-        go.Bar(
-            x=_dfb['LOCATION'],
-            y=_dfb['LENGTH'],
-            name='Primary Crushing - B',
-            marker=dict(color='lightcoral')
-        )
-    ])
+@app.cell
+def __(data_rb, end_time, pl, start_time, window):
+    #Adjusting the Length column of the downtime events from seconds to minutes
+    #All areas are kept in the same dataframe (AREA column)
 
-    _fig.update_layout(
-        title=f'24/07 - 31/07 2024 Comparison of total time (hours) rockbreaking per Location',
-        xaxis=dict(
-            title='Location' # X-axis label
-        ),
-        yaxis=dict(
-            title='Downtime (hours)' # Y-axis label
-            )
+    df_rb = data_rb.with_columns(
+        (pl.col('LENGTH')/60).alias('LENGTH')
     )
 
-    _fig
-    return
+    #Events of the study period, cut out of the sorted history by binary search
+    df_rb_window = window.slice_events(df_rb, start_time, end_time)
+    return df_rb, df_rb_window
 
 
 @app.cell
-def __(df_rba, df_rbb, go, pl):
-    _dfa = df_rba.group_by('LOCATION').agg(pl.col('LENGTH').mean())
-    _dfb = df_rbb.group_by('LOCATION').agg(pl.col('LENGTH').mean())
+def __(charts, period_label, rb_cube, study_days):
+    #Total time per area and location, converted from minutes to hours
+    charts.location_totals(rb_cube, study_days, period_label)
+    return
 
-    # Generate the bar chart, ensuring the category order is respected
-    _fig = go.Figure(data=[
-        go.Bar(
-            x=_dfa['LOCATION'],
-            y=_dfa['LENGTH'],
-            name='Primary Crushing - A',
-            marker=dict(color='lightblue')
-        ),
-        go.Bar(
-            x=_dfb['LOCATION'],
-            y=_dfb['LENGTH'],
-            name='Primary Crushing - B',
-            marker=dict(color='lightcoral')
-        )
-    ])
 
-    _fig.update_layout(
-        title=f'24/07 - 31/07 2024 Comparison of mean rockbreaking time (hours) per Location',
-        xaxis=dict(
-            title='Location' # X-axis label
-        ),
-        yaxis=dict(
-            title='Downtime (hours)' # Y-axis label
-            )
-    )
-    _fig
+@app.cell
+def __(charts, period_label, rb_cube, study_days):
+    charts.location_means(rb_cube, study_days, period_label)
     return
 
 
@@ -330,161 +277,67 @@ def __(mo):
 
 
 @app.cell
-def __(df_a, df_b, df_rba, df_rbb, pl):
-    df_a_all = df_rba.join_asof(df_a, left_on='EVENT_START',right_on='TIP_DATETIME',strategy='backward')
-    df_b_all = df_rbb.join_asof(df_b, left_on='EVENT_START',right_on='TIP_DATETIME',strategy='backward')
+def __(mo):
+    mo.md(
+        r"""
+        ### Overlapping rockbreaking events
+        The Grizzly and Crusher rockbreakers of an area can be working at the same time, in which case adding their times up counts the same lost production twice. The chart below splits the true downtime of each area (time with at least one rockbreaker working, based on the event start and end times) into the time each location was the only one working and the time both were working at once.
+        """
+    )
+    return
 
-    _df = df_rbb.filter(pl.col('LOCATION')=='Grizzly')
-    df_bg = _df.join_asof(df_b, left_on='EVENT_START',right_on='TIP_DATETIME',strategy='backward')
 
-    _df = df_rba.filter(pl.col('LOCATION')=='Grizzly')
-    df_ag = _df.join_asof(df_a, left_on='EVENT_START',right_on='TIP_DATETIME',strategy='backward')
-    return df_a_all, df_ag, df_b_all, df_bg
+@app.cell
+def __(charts, df_rb_window, period_label):
+    # Stacked bars per area: exclusive time of every location and overlap time
+    charts.true_downtime(df_rb_window, period_label)
+    return
 
 
 @app.cell
-def __(df_a_all, pl, px):
-    _df = df_a_all.group_by('LOCATION').agg(pl.col('LENGTH').sum()/60,pl.col('ROCKY_RATIO').mean()
-        ).sort(
-        pl.col('LOCATION'),descending=True
-        )
+def __(data_tips, df_rb, end_time, pl, rb_pipeline, start_time, tip_tolerance, window):
+    #Matching every rockbreaking event to the last truck that tipped in the same area before the event started (one as-of join for all areas and locations, over the full history, redone from the first day touched by reloaded rows)
+    df_all = rb_pipeline.joined(df_rb, data_tips, tip_tolerance)
 
-    # Generate the bar chart, ensuring the category order is respected
-    _fig = px.bar(
-        _df,
-        x="LOCATION", 
-        y="LENGTH", 
-        color='ROCKY_RATIO')
+    #Grizzly events of the study period
+    df_grizzly = window.slice_events(df_all, start_time, end_time).filter(pl.col('LOCATION')=='Grizzly')
+    return df_all, df_grizzly
 
-    _fig.update_layout(
-        title=f'24/07 - 31/07 2024 Total RB time (hours) and mean rocky ratio per Location in Area A',
-        xaxis=dict(
-            title='Location' # X-axis label
-        ),
-        yaxis=dict(
-            title='Downtime (hours)' # Y-axis label
-            )
-    )
 
-    _fig
+@app.cell
+def __(df_all, join, mo, tip_tolerance):
+    #Events with no tip in their area within the tolerance have no truck, zone, mass or rocky ratio - they still count as events and downtime, but the zone and mass figures leave them out
+    _unmatched = join.unmatched(df_all)
+    mo.md(
+        f"**{_unmatched.height} of {df_all.height} rockbreaking events** had no tip in their area within {tip_tolerance} before them "
+        "and are left out of the zone, mass and rocky ratio figures."
+    ) if not _unmatched.is_empty() else None
     return
 
 
 @app.cell
-def __(df_b_all, pl, px):
-    _df = df_b_all.group_by('LOCATION').agg(pl.col('LENGTH').sum()/60,pl.col('ROCKY_RATIO').mean()
-        ).sort(
-        pl.col('LOCATION'),descending=True
-        )
-
-    # Generate the bar chart, ensuring the category order is respected
-    _fig = px.bar(
-        _df,
-        x="LOCATION", 
-        y="LENGTH", 
-        color='ROCKY_RATIO')
+def __(df_all, rb_pipeline):
+    #Pre-aggregating the joined events once per hour, shift, day and week, area, location and zone - the charts below read the totals and means of the study period from this cube (after a reload, only the weeks touched by the new rows are aggregated again)
+    rb_cube = rb_pipeline.cube(df_all)
+    return rb_cube,
 
-    _fig.update_layout(
-        title=f'24/07 - 31/07 2024 Total rockbreaking time (hours) and mean rocky ratio per Location in Area B',
-        xaxis=dict(
-            title='Location' # X-axis label
-        ),
-        yaxis=dict(
-            title='Downtime (hours)' # Y-axis label
-            )
-    )
 
-    _fig
-    return
-
-
-@app.cell
-def __(df_ag, go, pl):
-    _df = df_ag.with_columns(
-        (pl.col("EVENT_START") - pl.duration(hours=6)).dt.date().alias("DATE")
-    ).group_by('DATE').agg(pl.col('LENGTH').sum(), pl.col('MASS').count())
-
-    # Generate the bar chart, ensuring the category order is respected
-    _fig = go.Figure(data=[
-        go.Bar(
-            x=_df['DATE'],
-            y=_df['LENGTH'],
-            name='Total hours rockbreaking',
-            marker=dict(color='lightblue'),
-            text=[round(val, 2) for val in _df['LENGTH']],  # Round values to 2 decimals
-            textposition='outside'  # Position the values outside the bars
-        ),
-        go.Bar(
-            x=_df['DATE'],
-            y=_df['MASS'],
-            name='Number of Rockbreaking events',
-            marker=dict(color='lightcoral'),
-            text=[round(val, 2) for val in _df['MASS']],  # Round values to 2 decimals
-            textposition='outside'  # Position the values outside the bars
-        )
-    ])
+@app.cell
+def __(charts, mo, period_label, rb_cube, study_days):
+    mo.vstack(charts.location_rocky_ratio(rb_cube, study_days, period_label))
+    return
 
-    _fig.update_layout(
-        title='24/07 - 31/07 2024 Analysis of Rockbreaking events and length - Location A',
-        xaxis=dict(
-            title='Date'  # X-axis label
-        ),
-        yaxis=dict(
-            title='',
-            showticklabels=False# Primary Y-axis label
-        ),
-        yaxis2=dict(
-            title='Mass (count)', overlaying='y', side='right'  # Secondary Y-axis
-        ),
-        barmode='group'  # Ensures bars are grouped side by side
-    )
 
-    _fig
-    return
-
-
-@app.cell
-def __(df_bg, go, pl):
-    _df = df_bg.with_columns(
-        (pl.col("EVENT_START") - pl.duration(hours=6)).dt.date().alias("DATE")
-    ).group_by('DATE').agg(pl.col('LENGTH').sum(), pl.col('MASS').count())
-
-    # Generate the bar chart, ensuring the category order is respected
-    _fig = go.Figure(data=[
-        go.Bar(
-            x=_df['DATE'],
-            y=_df['LENGTH'],
-            name='Total hours rockbreaking',
-            marker=dict(color='lightblue'),
-            text=[round(val, 2) for val in _df['LENGTH']],  # Round values to 2 decimals
-            textposition='outside'  # Position the values outside the bars
-        ),
-        go.Bar(
-            x=_df['DATE'],
-            y=_df['MASS'],
-            name='Number of Rockbreaking events',
-            marker=dict(color='lightcoral'),
-            text=[round(val, 2) for val in _df['MASS']],  # Round values to 2 decimals
-            textposition='outside'  # Position the values outside the bars
-        )
-    ])
+@app.cell
+def __(charts, rb_cube, study_days):
+    #Rockbreaking time and number of events at the grizzly per area and production day
+    df_daily = charts.grizzly_daily(rb_cube, study_days)
+    return df_daily,
 
-    _fig.update_layout(
-        title='24/07 - 31/07 2024 Analysis of Rockbreaking events and length - Location B',
-        xaxis=dict(
-            title='Date'  # X-axis label
-        ),
-        yaxis=dict(
-            title='',
-            showticklabels=False# Primary Y-axis label
-        ),
-        yaxis2=dict(
-            title='Mass (count)', overlaying='y', side='right'  # Secondary Y-axis
-        ),
-        barmode='group'  # Ensures bars are grouped side by side
-    )
 
-    _fig
+@app.cell
+def __(charts, df_daily, mo, period_label):
+    mo.vstack(charts.daily(df_daily, period_label))
     return
 
 
@@ -495,54 +348,68 @@ def __(mo):
 
 
 @app.cell
-def __(df_ag, pl, px):
-    _start_time = pl.datetime(2024,7,28,6,0,0)
-    _end_time = pl.datetime(2024,7,29,6,0,0)
+def __(charts, df_all, df_daily, df_grizzly, drill_down_day, dt, mo, pl, roster, shifts, window):
+    #Drilling down into the chosen day, or the day with the most rockbreaking time in each area
+    if drill_down_day.value is None:
+        _df = charts.busiest_days(df_grizzly, df_daily)
+    else:
+        #Grizzly events starting on that production day, cut out of the sorted history by binary search
+        _df = window.sorted_slice(
+            df_all,
+            'EVENT_START',
+            shifts.day_start(roster, drill_down_day.value),
+            shifts.day_start(roster, drill_down_day.value + dt.timedelta(days=1))
+        ).filter(pl.col('LOCATION')=='Grizzly')
 
-    _df = df_ag.filter(
-        (pl.col('EVENT_START')<=_end_time) & 
-        (pl.col('EVENT_START')>=_start_time)
-    )
+    mo.vstack(charts.drill_down(_df))
+    return
 
-    _fig = px.bar(_df, x="EVENT_START", y="LENGTH", color='ROCKY_RATIO')
 
-    _fig.update_layout(
-        title=f'29/07/24 rockbreaking time (hours) and mean rocky ratio per Location in Area A',
-        xaxis=dict(
-            title='Location' # X-axis label
-        ),
-        yaxis=dict(
-            title='Downtime (hours)' # Y-axis label
-            )
-    )
+@app.cell
+def __(mo):
+    mo.md(
+        r"""
+        ## Daily analysis
+        ### Location A - 28th of July
+        A total of 12 rockbreaking events ocurred on this day. 9 out of these 12 events had a rocky ratio of ~2.3 which whilst 2.3 is not a high number, having 12 events throughout the day would indicate that a revision of the RR for this location should be revised.
 
-    _fig
+        ### Location B - 26th of July
+        A total of 24 rockbreaking events ocurred on this day. 13 out of 24 events had a rocky ratio of ~1 which would mean that this is an accurate ratio for said location. whilst other events had rocky ratios of ~2 it is not as frequent as the lower ratio ones.
+        """
+    )
     return
 
 
 @app.cell
-def __(df_bg, pl, px):
-    _start_time = pl.datetime(2024,7,26,6,0,0)
-    _end_time = pl.datetime(2024,7,27,6,0,0)
-
-    _df = df_bg.filter(
-        (pl.col('EVENT_START')<=_end_time) & 
-        (pl.col('EVENT_START')>=_start_time)
+def __(mo):
+    mo.md(
+        r"""
+        ### Event timeline
+        Every rockbreaking event of the study period, with its length (minutes) over time. Over long periods the events are grouped into time buckets showing the longest and shortest event of each bucket; drag over the timeline to select a time range and see its events in the chart below it.
+        """
     )
+    return
 
-    _fig = px.bar(_df, x="EVENT_START", y="LENGTH", color='ROCKY_RATIO')
 
-    _fig.update_layout(
-        title=f'29/07/24 rockbreaking time (hours) and mean rocky ratio per Location in Area B',
-        xaxis=dict(
-            title='Location' # X-axis label
-        ),
-        yaxis=dict(
-            title='Downtime (hours)' # Y-axis label
-            )
+@app.cell
+def __(df_all, end_time, mo, period_label, start_time, timeline):
+    #Timeline of the study period, drawn from at most a few thousand markers whatever the number of events
+    event_timeline = mo.ui.plotly(
+        timeline.timeline(df_all, start_time, end_time, title=f'{period_label} Rockbreaking events')
     )
+    event_timeline
+    return event_timeline,
 
-    _fig
+
+@app.cell
+def __(df_all, event_timeline, mo, timeline):
+    #Events of the time range selected on the timeline, re-queried from the sorted history
+    _start, _end = timeline.zoom_range(event_timeline.ranges)
+    if _start is None:
+        _out = mo.md('_Select a time range on the timeline to zoom in._')
+    else:
+        _out = timeline.timeline(df_all, _start, _end, title=f'{_start:%d/%m %H:%M} - {_end:%d/%m %H:%M} Rockbreaking events')
+    _out
     return
 
 
@@ -550,36 +417,64 @@ def __(df_bg, pl, px):
 def __(mo):
     mo.md(
         r"""
-        ## Daily analysis
-        ### Location A - 28th of July
-        A total of 12 rockbreaking events ocurred on this day. 9 out of these 12 events had a rocky ratio of ~2.3 which whilst 2.3 is not a high number, having 12 events throughout the day would indicate that a revision of the RR for this location should be revised.
-
-        ### Location B - 26th of July
-        A total of 24 rockbreaking events ocurred on this day. 13 out of 24 events had a rocky ratio of ~1 which would mean that this is an accurate ratio for said location. whilst other events had rocky ratios of ~2 it is not as frequent as the lower ratio ones.
+        ### Rolling metrics
+        Rockbreaking downtime (minutes) and events per hour over the last two hours, per location, every 15 minutes of the study period. Hover over a point for the tonnes tipped in those two hours and the tonnes tipped per minute of downtime.
         """
     )
     return
 
 
 @app.cell
-def __(df_ag, df_bg, end_time, pl, start_time):
-    # Location A data filtered by start and time, sorted by downtime length and calculating mass/downtime ratio
-    df_week_a = df_ag.filter(
-        (pl.col('EVENT_START')<=end_time) & 
-        (pl.col('EVENT_START')>=start_time)
-    ).sort("LENGTH", descending=False).with_columns(
-        (pl.col("MASS")/pl.col('LENGTH')).alias("MASS_DT_RATIO"),
-        (pl.col('LENGTH')).alias('LENGTH')
-    )
+def __(data_tips, df_rb, rb_memo, rolling):
+    #Rolling sums over the full history, so that the first windows of the period are complete
+    rb_rolling = rb_memo(rolling.metrics, df_rb, data_tips)
+    return rb_rolling,
+
+
+@app.cell
+def __(end_time, rb_rolling, start_time, window):
+    #The series are sorted by TIME, so the period is a slice found by binary search rather than a scan
+    df_rolling = window.sorted_slice(rb_rolling, 'TIME', start_time, end_time)
+    return df_rolling,
+
+
+@app.cell
+def __(charts, df_rolling, mo, period_label):
+    mo.vstack(charts.rolling_downtime(df_rolling, period_label))
+    return
+
 
-    # Location B data filtered by start and time, sorted by downtime length and calculating mass/downtime ratio
-    df_week_b = df_bg.filter(
-        (pl.col('EVENT_START')<=end_time) & 
-        (pl.col('EVENT_START')>=start_time)
-    ).sort("LENGTH", descending=False).with_columns(
-        (pl.col("MASS")/pl.col('LENGTH')).alias("MASS_DT_RATIO")
+@app.cell
+def __(mo):
+    mo.md(
+        r"""
+        ### Abnormal days, shifts and zones
+        Instead of spotting them by eye in the daily bars, every production day, shift and zone of the period is compared with the last 90 days of its area and location: it is flagged when its rockbreaking time is far above the usual (robust z-score over 3.5) or when a run of high days pushes the moving average over its control limit. Flagged days and shifts list the zones behind most of their rockbreaking.
+        """
     )
-    return df_week_a, df_week_b
+    return
+
+
+@app.cell
+def __(anomaly, rb_cube, roster, study_days):
+    #Every day of the period scored against its history, and the flagged days, shifts and zones
+    df_day_scores = anomaly.detect(rb_cube, **study_days, roster=roster)
+    rb_anomalies = anomaly.anomalies(rb_cube, **study_days, roster=roster)
+    return df_day_scores, rb_anomalies
+
+
+@app.cell
+def __(charts, df_day_scores, mo, period_label, rb_anomalies):
+    _cols = {
+        'day': ['AREA', 'LOCATION', 'BUCKET', 'VALUE', 'Z', 'ORIGINS', 'SHARES'],
+        'shift': ['AREA', 'LOCATION', 'SHIFT_DATE', 'SHIFT', 'VALUE', 'Z', 'ORIGINS', 'SHARES'],
+        'zone': ['AREA', 'LOCATION', 'ORIGIN', 'BUCKET', 'VALUE', 'Z'],
+    }
+    mo.vstack(charts.anomalies(df_day_scores, period_label) + [
+        mo.vstack([mo.md(f"#### Abnormal {_level}s"), mo.ui.table(_df.select(_cols[_level]), selection=None)])
+        for _level, _df in rb_anomalies.items()
+    ])
+    return
 
 
 @app.cell
@@ -588,163 +483,172 @@ def __():
 
 
 @app.cell
-def __(df_week_a, make_subplots, pl, px):
-    # Arrange the zones by by grouping by origin and calculating total dt length
-    _total_length = df_week_a.group_by("ORIGIN").agg(pl.col("LENGTH").sum().alias("TOTAL_LENGTH"))
-    _total_massdt = df_week_a.group_by("ORIGIN").agg(
-        (pl.col("MASS_DT_RATIO").sum()).alias("TOTAL_MASS_DT")
-    )
-    # Sort by total length in descending order
-    _total_length = _total_length.sort("TOTAL_LENGTH", descending=True)
-    _total_massdt = _total_massdt.sort("TOTAL_MASS_DT", descending=True)
-
-    # Convert the sorted order to a list
-    _ordered_length= _total_length["ORIGIN"].to_list()
-    _ordered_massdt = _total_massdt["ORIGIN"].to_list()
-
-    # Create the first figure (Total length)
-    _fig1 = px.bar(
-        df_week_a,
-        x="ORIGIN",
-        y="LENGTH",
-        color="ROCKY_RATIO",
-        category_orders={"ORIGIN": _ordered_length},
-        title="Rockbreaking Time (Minutes) per Zone"
-    )
+def __(charts, mo, period_label, rb_cube, rb_memo, study_days):
+    # Total grizzly dt length, total mass/downtime ratio and rocky ratio of the top 10 zones of every area, read from the cube
+    mo.vstack(rb_memo(charts.zone_metrics, rb_cube, study_days, period_label))
+    return
 
-    # Create the second figure (Total Mass/Downtime Ratio)
-    _fig2 = px.bar(
-        df_week_a,
-        x="ORIGIN",
-        y="MASS_DT_RATIO",
-        color="ROCKY_RATIO",
-        category_orders={"ORIGIN": _ordered_massdt},
-        title="Downtime (Minutes) per Zone"
-    )
 
-    # Create a subplot figure to place both figures
-    _combined_fig = make_subplots(
-        rows=2, cols=1, 
-        shared_xaxes=False, 
-        vertical_spacing=0.2,
-        subplot_titles=[
-            "Rockbreaking Time (Minutes) per Zone",
-            "Mass dumped per Downtime (T/min) per Zone"
-        ]
+@app.cell
+def __(mo):
+    mo.md(
+        r"""
+        ## Zones with multi-tip attribution
+        Blaming each rockbreaking event on the last truck only can be misleading, as oversize material often comes from one of the previous loads. The charts below share each grizzly event between all the trucks that tipped in the look-back window before it (weighted towards the most recent ones) and compare the resulting downtime per zone with the last-truck totals used above.
+        """
     )
+    return
+
 
-    # Add the first chart to the subplot
-    for _trace in _fig1.data:
-        _combined_fig.add_trace(_trace, row=1, col=1)
-
-    # Add the second chart to the subplot
-    for _trace in _fig2.data:
-        _combined_fig.add_trace(_trace, row=2, col=1)
-
-    # Update layout for combined figure
-    _combined_fig.update_layout(
-        title="Location A - Metrics per top 10 Zones (24/07 - 31/07 2024)",
-        xaxis=dict(
-            title="Origin",
-            categoryorder="array",
-            categoryarray=_ordered_length
-        ),
-        xaxis2=dict(
-            title="Origin",
-            categoryorder="array",
-            categoryarray=_ordered_massdt
-        ),
-        yaxis=dict(title="Rockbreaking Time (Hours)"),
-        yaxis2=dict(title="Mass dumped per downtime (T/min)"),
-        height=800
+@app.cell
+def __(attribution, attribution_weights, attribution_window, data_tips, df_rb_window, pl, rb_memo):
+    #Linking every grizzly rockbreaking event to all the trucks that tipped in the same area within the look-back window
+    df_links = rb_memo(
+        attribution.attribute_events,
+        df_rb_window.filter(pl.col('LOCATION')=='Grizzly'),
+        data_tips,
+        window=attribution_window,
+        weights=attribution_weights
     )
+    return df_links,
 
-    _combined_fig
+
+@app.cell
+def __(charts, df_links, mo, period_label, rb_cube, study_days):
+    # Downtime per zone when each event is shared between trucks, and when it is blamed on the last truck only
+    mo.vstack(charts.attribution_comparison(df_links, rb_cube, study_days, period_label))
     return
 
 
 @app.cell
-def __(df_week_b, make_subplots, pl, px):
-    # Arrange the zones by by grouping by origin and calculating total dt length
-    _total_length = df_week_b.group_by("ORIGIN").agg(pl.col("LENGTH").sum().alias("TOTAL_LENGTH"))
-    _total_massdt = df_week_b.group_by("ORIGIN").agg(
-        (pl.col("MASS_DT_RATIO").sum()).alias("TOTAL_MASS_DT")
+def __(mo):
+    mo.md(
+        r"""
+        ## Truck accountability
+        The same sharing of the grizzly events is rolled up per truck over the full history, together with the loads and tonnes each truck tipped, so trucks (and shifts, which stand in for the loading crews) can be compared by the rockbreaking they cause per tonne delivered. The charts rank the trucks of the period by grizzly events per 1000 t, shared between trucks and blamed on the last truck only.
+        """
     )
-    # Sort by total length in descending order
-    _total_length = _total_length.sort("TOTAL_LENGTH", descending=True)
-    _total_massdt = _total_massdt.sort("TOTAL_MASS_DT", descending=True)
+    return
 
-    _total_length = _total_length.head(10)
-    _total_massdt = _total_massdt.head(10)
 
+@app.cell
+def __(attribution_weights, attribution_window, data_tips, df_all, rb_pipeline):
+    #Index of every truck's tips, tonnes, shared events and downtime per production day and shift
+    truck_index = rb_pipeline.trucks(data_tips, df_all, window=attribution_window, weights=attribution_weights)
+    return truck_index,
 
-    # Convert the sorted order to a list
-    _ordered_length= _total_length["ORIGIN"].to_list()
-    _ordered_massdt = _total_massdt["ORIGIN"].to_list()
 
-    df_top_10_length = df_week_b.filter(pl.col("ORIGIN").is_in(_ordered_length))
-    df_top_10_massdt = df_week_b.filter(pl.col("ORIGIN").is_in(_ordered_massdt))
+@app.cell
+def __(charts, mo, period_label, study_days, truck_index):
+    mo.vstack(charts.truck_ranking(truck_index, study_days, period_label))
+    return
 
 
-    # Create the first figure (Total length)
-    _fig1 = px.bar(
-        df_top_10_length,
-        x="ORIGIN",
-        y="LENGTH",
-        color="ROCKY_RATIO",
-        category_orders={"ORIGIN": _ordered_length},
-        title="Rockbreaking Time (Minutes) per Zone"
+@app.cell
+def __(mo):
+    mo.md(
+        r"""
+        ## Rocky ratio recalibration
+        If the rocky ratios were right, the grizzly events per tonne tipped of each zone would fall as its ratio goes up (1 is rocky, 5 not rocky). The rate is fitted per area as log-linear in the ratio, and the ratio each zone would need to explain its own events is shown below, clipped to the 1-5 scale, with a 95% confidence interval from the number of events; zones whose assigned ratio falls outside that interval (in red) are candidates for reclassification.
+        """
     )
+    return
+
 
-    # Create the second figure (Total Mass/Downtime Ratio)
-    _fig2 = px.bar(
-        df_top_10_massdt,
-        x="ORIGIN",
-        y="MASS_DT_RATIO",
-        color="ROCKY_RATIO",
-        category_orders={"ORIGIN": _ordered_massdt},
-        title="Downtime (Hours) per Zone"
+@app.cell
+def __(data_tips, df_grizzly, end_time, rb_memo, recalibration, start_time, window):
+    #Rocky ratio implied by the grizzly events and downtime of every zone tipped during the period
+    df_recalibration = rb_memo(
+        recalibration.recalibrate, df_grizzly, window.slice_tips(data_tips, start_time, end_time)
     )
+    return df_recalibration,
+
+
+@app.cell
+def __(charts, df_recalibration, mo, period_label):
+    mo.vstack(charts.recalibration(df_recalibration, period_label))
+    return
+
 
-    # Create a subplot figure to place both figures
-    _combined_fig = make_subplots(
-        rows=2, cols=1, 
-        shared_xaxes=False, 
-        vertical_spacing=0.2,
-        subplot_titles=[
-            "Rockbreaking Time (Minutes)",
-            "Mass dumped per Downtime (T/min)"
-        ]
+@app.cell
+def __(mo):
+    mo.md(
+        r"""
+        ## Downtime prediction
+        A model of the grizzly downtime per hour is trained on the full history, from the tonnes tipped, the zone mix and rocky ratio of the material, the rockbreaking of the previous hours and the shift. Candidate regressors are compared with time-series cross-validation (each fold is scored on hours after the ones it was trained on), and the chart below (once the model is trained) compares the downtime predicted by the best one with the actual downtime of the period.
+        """
     )
+    return
+
+
+@app.cell
+def __(mo):
+    #Training loads scikit-learn and takes a few seconds, so it only runs on demand
+    train_model = mo.ui.run_button(label="Train the downtime model")
+    train_model
+    return train_model,
+
+
+@app.cell
+def __(data_tips, df_all, mo, model, rb_memo, roster, train_model):
+    mo.stop(not train_model.value, mo.md('_Press the button above to train the downtime model._'))
+
+    #Training the downtime model on the full history (cached with its feature schema, so it is only retrained when the data changes)
+    downtime_model = rb_memo(model.train, df_all, data_tips, roster=roster)
+    return downtime_model,
+
+
+@app.cell
+def __(data_tips, df_all, downtime_model, rb_memo):
+    #Features of the full history, built once per model and data rather than on every move of the study period
+    df_features = rb_memo(downtime_model.frame, df_all, data_tips)
+    return df_features,
 
-    # Add the first chart to the subplot
-    for _trace in _fig1.data:
-        _combined_fig.add_trace(_trace, row=1, col=1)
-
-    # Add the second chart to the subplot
-    for _trace in _fig2.data:
-        _combined_fig.add_trace(_trace, row=2, col=1)
-
-    # Update layout for combined figure
-    _combined_fig.update_layout(
-        title="Location B - Metrics per per top 10 Zones (24/07 - 31/07 2024)",
-        xaxis=dict(
-            title="Origin",
-            categoryorder="array",
-            categoryarray=_ordered_length
-        ),
-        xaxis2=dict(
-            title="Origin",
-            categoryorder="array",
-            categoryarray=_ordered_massdt
-        ),
-        yaxis=dict(title="Rockbreaking Time (Minutes)"),
-        yaxis2=dict(title="Mass dumped per downtime (T/min)"),
-        height=800
+
+@app.cell
+def __(df_features, downtime_model, dt, end_time, start_time, window):
+    #Predicted and actual downtime of every hour of the study period (the features are sorted by BUCKET, and the last hour starts before end_time)
+    _frame = window.sorted_slice(df_features, 'BUCKET', start_time, end_time - dt.timedelta.resolution)
+    df_prediction = downtime_model.predict(_frame).with_columns(_frame['DOWNTIME'])
+    return df_prediction,
+
+
+@app.cell
+def __(charts, df_prediction, downtime_model, mo, period_label):
+    mo.vstack(charts.downtime_prediction(df_prediction, downtime_model.cv_rmse, period_label))
+    return
+
+
+@app.cell
+def __(mo):
+    mo.md(
+        r"""
+        ## Profiling
+        The notebook can be run again in a separate process with every cell traced: its wall and CPU time, the memory it added, the rows of the frames it defines and the polars queries it collected, with their query plans. The table below lists the cells slowest first, and the trace can be downloaded and opened in chrome://tracing or Perfetto.
+        """
     )
+    return
+
 
-    _combined_fig
-    return df_top_10_length, df_top_10_massdt
+@app.cell
+def __(mo):
+    #Profiling runs the whole notebook again, so it only runs on demand
+    profile_notebook = mo.ui.run_button(label="Profile the notebook")
+    profile_notebook
+    return profile_notebook,
+
+
+@app.cell
+def __(instrument, mo, profile_notebook):
+    mo.stop(not profile_notebook.value, mo.md('_Press the button above to profile the notebook._'))
+
+    notebook_trace = instrument.profile()
+    df_profile = instrument.summary(notebook_trace)
+    mo.vstack([
+        mo.ui.table(df_profile, selection=None),
+        mo.download(data=instrument.dumps(notebook_trace).encode(), filename='trace.json', label='Chrome trace'),
+    ])
+    return df_profile, notebook_trace
 
 
 @app.cell
@@ -779,6 +683,5 @@ def __(mo):
 def __():
     return
 
-
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,26 @@
+"""Data pipeline behind the RockBreaking_Analytics.py marimo notebook."""
+from .areas import EVENT_FILE, TIP_FILES, area_label
+from .cache import cached_events, cached_tips, refresh
+from .ingest import (
+    EVENT_SCHEMA,
+    TIP_SCHEMA,
+    filter_events,
+    filter_tips,
+    scan_events,
+    scan_tips,
+)
+
+__all__ = [
+    "EVENT_FILE",
+    "EVENT_SCHEMA",
+    "TIP_FILES",
+    "TIP_SCHEMA",
+    "area_label",
+    "cached_events",
+    "cached_tips",
+    "filter_events",
+    "filter_tips",
+    "refresh",
+    "scan_events",
+    "scan_tips",
+]
@@ -0,0 +1,174 @@
+"""Flagging of abnormal rockbreaking days, shifts and zones from the rollup cube.
+
+Every series of the cube is scored at once (one polars query, windows over the group
+keys), at three levels:
+
+* day: downtime of each area and location per production day
+* shift: the same per shift (SHIFT_ID)
+* zone: downtime of each area, location and ORIGIN per production day
+
+Buckets without events count as no downtime. Each series is compared with its reference:
+its buckets from reference before the end of the period to the end of the period. Two
+tests flag a bucket, both only on the high side (less rockbreaking than usual is no
+concern):
+
+* robust z-score: (value - median) / (1.4826 * MAD) above Z_LIMIT, the modified z-score
+  of Iglewicz and Hoaglin. When more than half the buckets are equal (the MAD is 0, as
+  for a zone with no events on most days) the scale is the mean size of the departures
+  from the median instead: the usual mean absolute deviation would shrink with the
+  number of quiet days, flagging every day a rarely seen zone has any rockbreaking
+* EWMA control chart: the exponentially weighted moving average of the series (weight
+  ALPHA on the latest bucket) above the median plus EWMA_LIMIT standard deviations of the
+  average, catching a run of moderately high buckets no single z-score flags
+
+Day and shift anomalies list the ORIGINs of most of their downtime (ORIGINS, with their
+SHARES). The cube has one row per bucket and zone at most, so a year of history scores in
+well under a second:
+
+    anomaly.anomalies(rb_cube, **study_days)          # {"day": ..., "shift": ..., "zone": ...}
+"""
+import datetime as dt
+import math
+
+import polars as pl
+
+from . import shifts
+
+# Robust z-score above which a bucket is flagged
+Z_LIMIT = 3.5
+
+# Weight of the latest bucket in the moving average
+ALPHA = 0.3
+
+# Standard deviations of the moving average above the median at which it is flagged
+EWMA_LIMIT = 3.0
+
+# History each series is compared with, up to the end of the period
+REFERENCE = dt.timedelta(days=90)
+
+# Cube measure scored (its sum per bucket)
+MEASURE = "LENGTH"
+
+# ORIGINs listed per flagged day or shift
+TOP_ORIGINS = 3
+
+# Cube grain and keys of each level
+LEVELS = {
+    "day": ("day", ("AREA", "LOCATION")),
+    "shift": ("shift", ("AREA", "LOCATION")),
+    "zone": ("day", ("AREA", "LOCATION", "ORIGIN")),
+}
+
+
+def _bucket_bounds(grain, start, end, roster):
+    # Buckets of a grain covering production days start to end (exclusive)
+    if grain == "shift":
+        per_day = len(roster.starts)
+        return [(day - dt.date(1970, 1, 1)).days * per_day for day in (start, end)]
+    return [start, end]
+
+
+def _grid(grain, first, end):
+    # Every bucket from first to end (exclusive)
+    if grain == "shift":
+        return pl.int_range(first, end, dtype=pl.Int64, eager=True)
+    return pl.date_range(first, end, "1d", closed="left", eager=True)
+
+
+def series(rb_cube, start, end, level="day", measure=MEASURE, reference=REFERENCE, roster=shifts.DEFAULT_ROSTER):
+    """VALUE per group of the level and BUCKET, over the reference before end and the period.
+
+    Every group found in the cube gets every bucket from the first of the reference (or
+    of the cube) to end, with 0 where it had no events.
+    """
+    grain, by = LEVELS[level]
+    df = rb_cube[grain]
+    lo, hi = _bucket_bounds(grain, end - reference, end, roster)
+    first = max(lo, df["BUCKET"].min()) if not df.is_empty() else lo
+    value = pl.col("EVENTS") if measure == "EVENTS" else pl.col(f"{measure}_SUM")
+    totals = df.filter(pl.col("BUCKET").is_between(first, hi, closed="left")).group_by(*by, "BUCKET").agg(
+        value.sum().cast(pl.Float64).alias("VALUE")
+    )
+    grid = df.select(by).unique().join(_grid(grain, first, hi).alias("BUCKET").to_frame(), how="cross")
+    return grid.join(totals, on=[*by, "BUCKET"], how="left").with_columns(
+        pl.col("VALUE").fill_null(0.0)
+    ).sort(*by, "BUCKET")
+
+
+def score(df, by, z_limit=Z_LIMIT, alpha=ALPHA, ewma_limit=EWMA_LIMIT):
+    """Robust z-scores and EWMA control limits of every series of a series() frame.
+
+    Adds MEDIAN, SCALE (robust standard deviation), Z, EWMA, UCL (upper control limit of
+    the EWMA), Z_FLAG, EWMA_FLAG and ANOMALY (either flag).
+    """
+    value = pl.col("VALUE")
+    median = value.median().over(by)
+    deviation = (value - median).abs()
+    mad = deviation.median().over(by)
+    scale = pl.when(mad > 0).then(1.4826 * mad).otherwise(deviation.filter(deviation > 0).mean().over(by))
+    df = df.sort(*by, "BUCKET").with_columns(
+        median.alias("MEDIAN"),
+        scale.alias("SCALE"),
+        value.ewm_mean(alpha=alpha, adjust=False).over(by).alias("EWMA"),
+    )
+    return df.with_columns(
+        pl.when(pl.col("SCALE") > 0).then((value - pl.col("MEDIAN")) / pl.col("SCALE")).alias("Z"),
+        (pl.col("MEDIAN") + ewma_limit * pl.col("SCALE") * math.sqrt(alpha / (2 - alpha))).alias("UCL"),
+    ).with_columns(
+        (pl.col("Z") > z_limit).fill_null(False).alias("Z_FLAG"),
+        # A bucket below the median only keeps up an average raised by the buckets before it
+        ((pl.col("EWMA") > pl.col("UCL")) & (value > pl.col("MEDIAN"))).alias("EWMA_FLAG"),
+    ).with_columns(
+        (pl.col("Z_FLAG") | pl.col("EWMA_FLAG")).alias("ANOMALY")
+    )
+
+
+def origins(rb_cube, flagged, grain, by, measure=MEASURE, top=TOP_ORIGINS):
+    """ORIGINS and SHARES of the value of every row of flagged (keys by and BUCKET), largest first."""
+    value = pl.col("EVENTS") if measure == "EVENTS" else pl.col(f"{measure}_SUM")
+    keys = [*by, "BUCKET"]
+    parts = rb_cube[grain].join(flagged.select(keys), on=keys, how="semi").group_by(*keys, "ORIGIN").agg(
+        value.sum().cast(pl.Float64).alias("PART")
+    )
+    return parts.with_columns(
+        (pl.col("PART") / pl.col("PART").sum().over(keys)).alias("SHARE")
+    ).sort("PART", descending=True).group_by(keys, maintain_order=True).agg(
+        pl.col("ORIGIN").cast(pl.String).head(top).alias("ORIGINS"),
+        pl.col("SHARE").head(top).alias("SHARES"),
+    )
+
+
+def detect(rb_cube, start, end, level="day", measure=MEASURE, reference=REFERENCE, roster=shifts.DEFAULT_ROSTER,
+           z_limit=Z_LIMIT, alpha=ALPHA, ewma_limit=EWMA_LIMIT):
+    """Scored buckets of the production days start to end (exclusive) at one level.
+
+    Day and shift rows carry the ORIGINS and SHARES of their value (null when they have
+    no events); shift rows also their SHIFT_DATE and SHIFT.
+    """
+    grain, by = LEVELS[level]
+    lo, hi = _bucket_bounds(grain, start, end, roster)
+    df = score(series(rb_cube, start, end, level, measure, reference, roster), by, z_limit, alpha, ewma_limit)
+    df = df.filter(pl.col("BUCKET").is_between(lo, hi, closed="left"))
+    if "ORIGIN" not in by:
+        df = df.join(origins(rb_cube, df.filter(pl.col("VALUE") > 0), grain, by, measure), on=[*by, "BUCKET"],
+                     how="left")
+    if grain == "shift":
+        per_day = len(roster.starts)
+        df = df.with_columns(
+            (pl.lit(dt.date(1970, 1, 1)) + pl.duration(days=pl.col("BUCKET") // per_day)).cast(pl.Date)
+            .alias("SHIFT_DATE"),
+            (pl.col("BUCKET") % per_day).alias("SHIFT"),
+        )
+    return df
+
+
+def anomalies(rb_cube, start, end, measure=MEASURE, reference=REFERENCE, roster=shifts.DEFAULT_ROSTER, **limits):
+    """Flagged buckets of the production days start to end (exclusive): {level: frame}.
+
+    limits are the z_limit, alpha and ewma_limit of detect.
+    """
+    return {
+        level: detect(rb_cube, start, end, level, measure, reference, roster, **limits)
+        .filter(pl.col("ANOMALY")).sort("VALUE", descending=True)
+        for level in LEVELS
+    }
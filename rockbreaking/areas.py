@@ -0,0 +1,61 @@
+"""All primary crushing areas in one set of frames.
+
+Each area has its own tip log but shares the event log, so the tip logs are stacked into a
+single frame with an AREA column matching the AREA column of RB_DATA.csv. Everything
+downstream then works on every area at once by grouping on AREA, and adding a crusher is
+one more entry in TIP_FILES.
+"""
+import os
+
+import polars as pl
+
+from . import cache, shifts
+
+# Tip log of each primary crushing area, keyed by the AREA name used in RB_DATA.csv
+TIP_FILES = {
+    "Primary Crushing - A": "A_DATA.csv",
+    "Primary Crushing - B": "B_DATA.csv",
+}
+
+# Rockbreaking event log shared by all areas
+EVENT_FILE = "RB_DATA.csv"
+
+
+def area_label(area):
+    """Short name of an area used in chart titles ('Primary Crushing - A' -> 'A')."""
+    return str(area).rsplit(" - ", 1)[-1]
+
+
+def scan_tips(data_dir, start_time=None, end_time=None, tip_files=None):
+    """Lazily stack the tip logs of all areas, tagging every tip with its AREA."""
+    tip_files = TIP_FILES if tip_files is None else tip_files
+    frames = [
+        cache.cached_tips(os.path.join(data_dir, name), start_time, end_time).with_columns(
+            pl.lit(area).cast(pl.Categorical).alias("AREA")
+        )
+        for area, name in tip_files.items()
+    ]
+    return pl.concat(frames).sort("TIP_DATETIME")
+
+
+def load(data_dir, start_time=None, end_time=None, tip_files=None, event_file=EVENT_FILE,
+         roster=None):
+    """Collect the tips of all areas and the shared event log in one go.
+
+    Returns (tips, events), both sorted by time and carrying an AREA column. LENGTH is left
+    in seconds, as recorded in RB_DATA.csv. With a shifts.Roster, the SHIFT_DATE, SHIFT and
+    SHIFT_ID keys of every tip (TIP_DATETIME) and event (EVENT_START) are added as well.
+    """
+    tips = scan_tips(data_dir, start_time, end_time, tip_files)
+    events = cache.cached_events(os.path.join(data_dir, event_file), start_time, end_time)
+    if roster is not None:
+        tips = shifts.add_shift_keys(tips, "TIP_DATETIME", roster)
+        events = shifts.add_shift_keys(events, "EVENT_START", roster)
+    tips, events = pl.collect_all([tips, events])
+    return tips, events
+
+
+def partition(df):
+    """Split a frame by AREA once, returning {area: frame} in area order."""
+    parts = df.partition_by("AREA", as_dict=True)
+    return {key[0] if isinstance(key, tuple) else key: part for key, part in sorted(parts.items())}
@@ -0,0 +1,112 @@
+"""Sharing each rockbreaking event between all the tips that could have caused it.
+
+The as-of join in join.py blames an event on the last truck only, but oversize material
+often comes from one of the previous few loads. Here every event is linked to all tips in
+the same area within a look-back window before it started, and each link gets a weight
+(the weights of an event add up to 1) so that downtime can be shared between zones.
+
+The links are found with two binary searches per event on the sorted tip times, which
+gives the first and last tip in the window; the pairs are then expanded with numpy, so
+the cost is O((events + links) log tips) with no Python loop over events and no cross
+join.
+"""
+import datetime as dt
+
+import numpy as np
+import polars as pl
+
+from . import areas, join
+
+# How far back from the start of an event tips are considered
+WINDOW = dt.timedelta(minutes=30)
+
+# Half-life of the "recency" weights: a tip this much older than another weighs half as much
+HALF_LIFE = dt.timedelta(minutes=10)
+
+WEIGHTS = ("recency", "mass", "uniform")
+
+
+def _micros(col):
+    return col.cast(pl.Int64).to_numpy()
+
+
+def link_ranges(event_times, tip_times, window, max_tips=None):
+    """Index range [lo, hi) of the tips within the window before each event.
+
+    Both arrays are sorted int64 microsecond timestamps; window is in microseconds. A tip
+    at exactly the event start is included. max_tips keeps only the latest tips.
+    """
+    lo = np.searchsorted(tip_times, event_times - window, side="left")
+    hi = np.searchsorted(tip_times, event_times, side="right")
+    if max_tips is not None:
+        lo = np.maximum(lo, hi - max_tips)
+    return lo, hi
+
+
+def expand_ranges(lo, hi):
+    """Turn index ranges into flat (event index, tip index) pairs."""
+    counts = hi - lo
+    event_idx = np.repeat(np.arange(len(lo)), counts)
+    # Position of each pair within its event's range, added to the start of the range
+    starts = np.cumsum(counts) - counts
+    tip_idx = np.arange(counts.sum()) - np.repeat(starts, counts) + np.repeat(lo, counts)
+    return event_idx, tip_idx
+
+
+def _link_area(events, tips, window, max_tips):
+    lo, hi = link_ranges(
+        _micros(events["EVENT_START"]), _micros(tips["TIP_DATETIME"]),
+        window // dt.timedelta(microseconds=1), max_tips,
+    )
+    event_idx, tip_idx = expand_ranges(lo, hi)
+    return pl.concat(
+        [events[event_idx], join.tip_columns(tips, events, keep=())[tip_idx]], how="horizontal"
+    )
+
+
+def attribute_events(events, tips, window=WINDOW, weights="recency", half_life=HALF_LIFE,
+                     max_tips=None):
+    """Link every event to the tips of its area in the window before it.
+
+    events and tips must be sorted by time and carry an AREA column. Returns one row per
+    (event, tip) link with the event columns, an EVENT_ID (row number of the event in
+    events), the tip columns (those not already in events) and a WEIGHT column. weights
+    is one of:
+
+    * "recency": exponential decay with the tip age, halving every half_life
+    * "mass": proportional to the MASS of each tip
+    * "uniform": every tip in the window weighs the same
+
+    Events with no tip in the window have no links and are left out; without any event
+    the frame is empty.
+    """
+    if weights not in WEIGHTS:
+        raise ValueError(f"weights must be one of {WEIGHTS}, got {weights!r}")
+    events = events.with_row_index("EVENT_ID")
+    tips_by_area = areas.partition(tips)
+
+    parts = [
+        _link_area(_events, tips_by_area[area], window, max_tips)
+        for area, _events in areas.partition(events).items()
+        if area in tips_by_area
+    ]
+    # No event with a tip of its area (a window without events): no links, with their columns
+    links = pl.concat(parts) if parts else _link_area(events.clear(), tips.clear(), window, max_tips)
+
+    if weights == "recency":
+        age = (pl.col("EVENT_START") - pl.col("TIP_DATETIME")).dt.total_microseconds()
+        raw = (-np.log(2) * age / (half_life // dt.timedelta(microseconds=1))).exp()
+        weight = raw / raw.sum().over("EVENT_ID")
+    elif weights == "mass":
+        weight = pl.col("MASS") / pl.col("MASS").sum().over("EVENT_ID")
+    else:
+        weight = 1 / pl.len().over("EVENT_ID")
+    return links.with_columns(weight.alias("WEIGHT")).sort("EVENT_ID", "TIP_DATETIME")
+
+
+def attributed_totals(links, by=("AREA", "ORIGIN")):
+    """Weighted number of events and downtime per group (ORIGIN per AREA by default)."""
+    return links.group_by(*by).agg(
+        pl.col("WEIGHT").sum().alias("EVENTS"),
+        (pl.col("LENGTH") * pl.col("WEIGHT")).sum().alias("LENGTH"),
+    )
@@ -0,0 +1,271 @@
+"""Benchmarks of the notebook pipeline at multiples of the shipped data size.
+
+The stages of RockBreaking_Analytics.py are run outside marimo, on the modules the notebook
+cells call, in notebook order:
+
+* parse_csv: scanning the CSVs with the typed schema (datetimes parsed by the CSV reader)
+* load: areas.load from the Arrow cache, with the shift keys (the cache is built first)
+* window: slicing the last week out of the sorted history
+* join: the as-of join of every event onto the last tip of its area
+* attribution: linking the grizzly events of the week to all the trucks before them
+* cube: the hour/shift/day/week rollups of the joined events
+* aggregate: the per location, per day and per zone totals of the week read from the cube
+* figures: building the plotly figures of the report for the week
+
+The data is drawn by synthetic.py at every scale (1 is the size of the shipped logs) and
+kept in .rb_cache/bench, so later runs only time the pipeline. Every stage reports its
+wall time (the best of --repeat runs), the peak memory it added to the process (sampled
+from /proc/self/statm) and the rows it read per second. Results are written as JSON, and
+two result files are compared stage by stage:
+
+    python -m rockbreaking.bench --scales 1 10 100 1000 -o bench.json
+    python -m rockbreaking.bench compare base.json bench.json --threshold 0.2
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import polars as pl
+
+from . import areas, attribution, cache, charts, cube, ingest, instrument, join, recalibration, shifts, synthetic, window
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = (1, 10, 100, 1000)
+
+# Relative slow-down of a stage flagged as a regression by compare
+THRESHOLD = 0.2
+
+# Stages faster than this (seconds) are too noisy to be flagged
+MIN_SECONDS = 0.05
+
+# Seed of the synthetic data, fixed so that every run times the same rows
+SEED = 0
+
+
+def dataset(scale, seed=SEED, root=None):
+    """Directory of synthetic logs scale times the size of the shipped ones, drawn once."""
+    root = os.path.join(REPO, cache.CACHE_DIRNAME, "bench") if root is None else root
+    out_dir = os.path.join(root, f"scale-{scale:g}-seed-{seed}")
+    if not os.path.exists(os.path.join(out_dir, areas.EVENT_FILE)):
+        tips, events = areas.load(REPO)
+        first = tips["TIP_DATETIME"].min()
+        days = max(1, round((tips["TIP_DATETIME"].max() - first).total_seconds() / 86400 * scale))
+        synthetic.generate(out_dir, synthetic.profile(tips, events), dt.datetime.combine(first.date(), dt.time()),
+                           days, seed)
+    return out_dir
+
+
+def _parse_csv(ctx):
+    paths = [os.path.join(ctx["data_dir"], name) for name in areas.TIP_FILES.values()]
+    frames = pl.collect_all(
+        [ingest.scan_tips(path) for path in paths]
+        + [ingest.scan_events(os.path.join(ctx["data_dir"], areas.EVENT_FILE))]
+    )
+    return sum(len(df) for df in frames)
+
+
+def _load(ctx):
+    ctx["tips"], events = areas.load(ctx["data_dir"], roster=ctx["roster"])
+    ctx["events"] = events.with_columns(pl.col("LENGTH") / 60)
+    return len(ctx["tips"]) + len(ctx["events"])
+
+
+def _window(ctx):
+    roster = ctx["roster"]
+    last_day = ctx["events"]["SHIFT_DATE"][-1]
+    ctx["study"] = study = window.study_window(roster, last_day - dt.timedelta(days=7), last_day - dt.timedelta(days=1))
+    ctx["events_window"] = window.slice_events(ctx["events"], study["start_time"], study["end_time"])
+    ctx["tips_window"] = window.slice_tips(ctx["tips"], study["start_time"], study["end_time"])
+    return len(ctx["tips"]) + len(ctx["events"])
+
+
+def _join(ctx):
+    ctx["joined"] = join.attach_last_tip(ctx["events"], ctx["tips"])
+    return len(ctx["tips"]) + len(ctx["events"])
+
+
+def _attribution(ctx):
+    grizzly = ctx["events_window"].filter(pl.col("LOCATION") == "Grizzly")
+    ctx["links"] = attribution.attribute_events(grizzly, ctx["tips"])
+    return len(grizzly)
+
+
+def _cube(ctx):
+    ctx["cube"] = cube.build_cube(ctx["joined"])
+    return len(ctx["joined"])
+
+
+def _aggregate(ctx):
+    study_days = ctx["study"]["study_days"]
+    frames = [
+        cube.query(ctx["cube"], "day", by=("AREA", "LOCATION"), **study_days),
+        charts.grizzly_daily(ctx["cube"], study_days),
+        cube.query(ctx["cube"], "day", by=("AREA", "ORIGIN"), **study_days, LOCATION="Grizzly"),
+    ]
+    ctx["daily"] = frames[1]
+    return len(ctx["cube"]["day"])
+
+
+def _figures(ctx):
+    study = ctx["study"]
+    rb_cube, study_days, label = ctx["cube"], study["study_days"], study["period_label"]
+    grizzly = window.slice_events(ctx["joined"], study["start_time"], study["end_time"]).filter(
+        pl.col("LOCATION") == "Grizzly"
+    )
+    figs = [
+        charts.location_totals(rb_cube, study_days, label),
+        charts.location_means(rb_cube, study_days, label),
+        charts.true_downtime(ctx["events_window"], label),
+        *charts.location_rocky_ratio(rb_cube, study_days, label),
+        *charts.daily(ctx["daily"], label),
+        *charts.drill_down(charts.busiest_days(grizzly, ctx["daily"])),
+        *charts.zone_metrics(rb_cube, study_days, label),
+        *charts.attribution_comparison(ctx["links"], rb_cube, study_days, label),
+        *charts.recalibration(recalibration.recalibrate(grizzly, ctx["tips_window"]), label),
+    ]
+    # Serialising makes plotly validate every trace, as displaying the figure would
+    for fig in figs:
+        fig.to_json()
+    return len(ctx["events_window"])
+
+
+STAGES = {
+    "parse_csv": _parse_csv,
+    "load": _load,
+    "window": _window,
+    "join": _join,
+    "attribution": _attribution,
+    "cube": _cube,
+    "aggregate": _aggregate,
+    "figures": _figures,
+}
+
+
+def run(scale, repeat=3, stages=tuple(STAGES), seed=SEED, roster=shifts.DEFAULT_ROSTER):
+    """Results of every stage at one scale: a list of dicts with the timings and memory.
+
+    Every stage runs after the ones before it (their output is its input); the stages not
+    selected still run, untimed, when a later stage needs them.
+    """
+    data_dir = dataset(scale, seed)
+    # Build the Arrow cache, so that load times the cached read the notebook does
+    areas.load(data_dir)
+    ctx = {"data_dir": data_dir, "roster": roster}
+    results = []
+    last = max(list(STAGES).index(name) for name in stages)
+    for name, stage in list(STAGES.items())[:last + 1]:
+        if name not in stages:
+            stage(ctx)
+            continue
+        best, peak = None, 0
+        for _ in range(repeat):
+            with instrument.PeakRss() as rss:
+                started = time.perf_counter()
+                rows = stage(ctx)
+                seconds = time.perf_counter() - started
+            best = seconds if best is None else min(best, seconds)
+            peak = max(peak, rss.peak - rss.base)
+        results.append({
+            "scale": scale,
+            "stage": name,
+            "rows": rows,
+            "seconds": best,
+            "peak_rss_mb": peak / 1024 ** 2,
+            "rows_per_s": rows / best if best else None,
+        })
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base, new, threshold=THRESHOLD, min_seconds=MIN_SECONDS):
+    """Stage timings of two result dicts side by side, flagging slow-downs over threshold."""
+    before = {(r["scale"], r["stage"]): r for r in base["results"]}
+    rows = []
+    for r in new["results"]:
+        old = before.get((r["scale"], r["stage"]))
+        if old is None:
+            continue
+        change = r["seconds"] / old["seconds"] - 1 if old["seconds"] else 0.0
+        rows.append({
+            "scale": r["scale"],
+            "stage": r["stage"],
+            "base_seconds": old["seconds"],
+            "seconds": r["seconds"],
+            "change": change,
+            "regression": change > threshold and r["seconds"] >= min_seconds,
+        })
+    return rows
+
+
+def _print_results(results):
+    print(f"{'scale':>6} {'stage':<12} {'rows':>10} {'seconds':>9} {'peak MB':>8} {'rows/s':>12}")
+    for r in results:
+        print(f"{r['scale']:>6g} {r['stage']:<12} {r['rows']:>10} {r['seconds']:>9.4f} "
+              f"{r['peak_rss_mb']:>8.1f} {r['rows_per_s'] or 0:>12,.0f}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["compare"]:
+        parser = argparse.ArgumentParser(prog="python -m rockbreaking.bench compare",
+                                         description="Compare two benchmark result files")
+        parser.add_argument("base")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                            help="relative slow-down flagged as a regression (default %(default)s)")
+        args = parser.parse_args(argv[1:])
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows = compare(base, new, args.threshold)
+        print(f"{base.get('commit')} -> {new.get('commit')}")
+        for r in rows:
+            flag = "  REGRESSION" if r["regression"] else ""
+            print(f"{r['scale']:>6g} {r['stage']:<12} {r['base_seconds']:>9.4f} -> {r['seconds']:>9.4f} "
+                  f"({r['change']:+.0%}){flag}")
+        return 1 if any(r["regression"] for r in rows) else 0
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", type=float, default=SCALES,
+                        help="multiples of the shipped data size (default %(default)s)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="stages to time (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best is kept (default %(default)s)")
+    parser.add_argument("-o", "--out", default="bench.json", help="result file (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for scale in args.scales:
+        results += run(scale, args.repeat, args.stages)
+        _print_results([r for r in results if r["scale"] == scale])
+    report = {
+        "commit": _commit(),
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
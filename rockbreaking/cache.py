@@ -0,0 +1,220 @@
+"""On-disk cache of the typed and sorted tip and event frames.
+
+Parsing the timestamp strings of the CSVs is the slowest part of loading the data, so the
+full typed history of every CSV is stored as an uncompressed Arrow IPC file, which polars
+memory-maps on read. Each cache file has a small JSON sidecar holding the path, size and
+modification time of the CSV it was built from; a CSV is only re-parsed when one of these
+changes, so editing B_DATA.csv does not invalidate the cache of A_DATA.csv.
+
+The dispatch system only ever appends rows to the CSVs, so the sidecar also remembers how
+many bytes of the CSV are already in the cache and the last timestamp ingested. When a CSV
+has grown and the bytes already ingested are unchanged, only the new tail is parsed and
+merged into the cached frame; anything else (a truncated or rewritten file) rebuilds it.
+The stored offset only ever moves past complete lines: a last line without a newline is
+cached when it parses, but the next append rebuilds the cache rather than read it twice.
+"""
+import hashlib
+import io
+import json
+import os
+
+import polars as pl
+
+from . import ingest
+
+# Bump when the cached layout changes (schema, sort order) so old caches are rebuilt
+CACHE_VERSION = 3
+
+# Default cache folder, created next to the CSV files
+CACHE_DIRNAME = ".rb_cache"
+
+# Number of bytes before the ingested offset hashed to detect a rewritten file
+CHECK_BYTES = 4096
+
+# Schema and sort column of each kind of CSV
+KINDS = {
+    "tips": (ingest.TIP_SCHEMA, "TIP_DATETIME"),
+    "events": (ingest.EVENT_SCHEMA, "EVENT_START"),
+}
+
+
+def source_fingerprint(path):
+    """Return the key the cache of a CSV is validated against."""
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "version": CACHE_VERSION,
+    }
+
+
+def cache_paths(path, cache_dir=None):
+    """Return the (arrow file, metadata file) paths used to cache a CSV."""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRNAME)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (
+        os.path.join(cache_dir, name + ".arrow"),
+        os.path.join(cache_dir, name + ".meta.json"),
+    )
+
+
+def read_meta(path, cache_dir=None):
+    """Return the metadata stored with the cache of a CSV, or None if there is no cache."""
+    arrow_path, meta_path = cache_paths(path, cache_dir)
+    if not (os.path.exists(arrow_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def is_fresh(path, cache_dir=None):
+    """True if the cache of a CSV exists and was built from the current version of the file."""
+    meta = read_meta(path, cache_dir)
+    return meta is not None and meta["source"] == source_fingerprint(path)
+
+
+def write_cache(path, df, cache_dir=None, source=None, **extra):
+    """Store a typed frame as the cache of a CSV, along with the CSV fingerprint.
+
+    source is the fingerprint of the CSV taken before it was read (source_fingerprint), so
+    that rows appended while it was read make the cache stale; by default it is taken now.
+    The files are written to temporary names first and then moved into place, so a run
+    that is interrupted half way never leaves a cache that looks valid.
+    """
+    arrow_path, meta_path = cache_paths(path, cache_dir)
+    os.makedirs(os.path.dirname(arrow_path), exist_ok=True)
+    df.write_ipc(arrow_path + ".tmp", compression="uncompressed")
+    meta = {"source": source_fingerprint(path) if source is None else source, "rows": df.height}
+    meta.update(extra)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(arrow_path + ".tmp", arrow_path)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _check_hash(f, offset):
+    # Hash of the last CHECK_BYTES already ingested, used to tell an append from a rewrite
+    start = max(offset - CHECK_BYTES, 0)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+def read_rows(path, schema, offset=0):
+    """Parse the lines of a CSV from a byte offset onwards, through the end of the file.
+
+    Returns the typed rows, the offset just after the last complete line and the number of
+    rows read past it. A last line without a newline is kept when it parses (a file that
+    does not end with a newline); a line the dispatch system is still writing does not,
+    and is left for the next read. An offset of 0 reads the whole file; any other offset
+    must be the start of a line.
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        start = max(offset, len(header))
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    rows = pl.read_csv(io.BytesIO(header + data[:end]), schema=schema)
+    partial = 0
+    last = data[end:]
+    # A line cut short while it is written has fewer fields, or values that do not parse
+    if last.strip() and last.count(b",") == header.count(b","):
+        try:
+            rows = pl.concat([rows, pl.read_csv(io.BytesIO(header + last), schema=schema)])
+            partial = 1
+        except pl.exceptions.PolarsError:
+            pass
+    return rows, start + end, partial
+
+
+def _ingest_meta(path, df, sort_col, offset, partial):
+    # Position and last timestamp ingested, stored in the sidecar for the next append
+    with open(path, "rb") as f:
+        check = _check_hash(f, offset)
+    last = df[sort_col].max()
+    return {
+        "offset": offset,
+        "partial": partial,
+        "check": check,
+        "last": None if last is None else last.isoformat(),
+    }
+
+
+def append_tail(path, kind, cache_dir=None):
+    """Bring the cache of an appended CSV up to date by parsing only its new tail.
+
+    Returns the new rows that were merged into the cache, or None if the CSV was not a
+    plain append of the cached one (the caller should then rebuild the cache). The tail
+    is sorted on its own and merged into the already sorted cache, so the history is never
+    re-sorted. A cache holding a last line without a newline is rebuilt too, as the
+    appended rows continue that line.
+    """
+    schema, sort_col = KINDS[kind]
+    meta = read_meta(path, cache_dir)
+    if meta is None or meta["source"]["version"] != CACHE_VERSION or meta.get("partial"):
+        return None
+    offset = meta["offset"]
+    # Taken before the tail is read: rows appended meanwhile are left for the next refresh
+    source = source_fingerprint(path)
+    if source["size"] < offset:
+        return None
+    with open(path, "rb") as f:
+        if _check_hash(f, offset) != meta["check"]:
+            return None
+
+    tail, end, partial = read_rows(path, schema, offset)
+    tail = tail.sort(sort_col)
+    arrow_path, _ = cache_paths(path, cache_dir)
+    cached = pl.read_ipc(arrow_path)
+    if meta["last"] is None or tail.is_empty() or tail[sort_col][0] >= cached[sort_col][-1]:
+        # Rows arriving in order are simply stacked after the cached history
+        df = pl.concat([cached, tail])
+    else:
+        df = cached.merge_sorted(tail, key=sort_col)
+    write_cache(path, df, cache_dir, source, **_ingest_meta(path, df, sort_col, end, partial))
+    return tail
+
+
+def rebuild(path, kind, cache_dir=None):
+    """Parse a whole CSV and replace its cache. Returns the typed, sorted frame."""
+    schema, sort_col = KINDS[kind]
+    source = source_fingerprint(path)
+    df, end, partial = read_rows(path, schema)
+    df = df.sort(sort_col)
+    write_cache(path, df, cache_dir, source, **_ingest_meta(path, df, sort_col, end, partial))
+    return df
+
+
+def refresh(path, kind, cache_dir=None, incremental=True):
+    """Make sure the cache of a CSV is up to date.
+
+    Returns None if the cache was already fresh, the appended rows if only the tail of the
+    CSV was ingested, or the whole frame if the cache had to be rebuilt.
+    """
+    if is_fresh(path, cache_dir):
+        return None
+    if incremental:
+        tail = append_tail(path, kind, cache_dir)
+        if tail is not None:
+            return tail
+    return rebuild(path, kind, cache_dir)
+
+
+def _cached(path, kind, cache_dir, incremental):
+    refresh(path, kind, cache_dir, incremental)
+    arrow_path, _ = cache_paths(path, cache_dir)
+    return pl.scan_ipc(arrow_path).set_sorted(KINDS[kind][1])
+
+
+def cached_tips(path, start_time=None, end_time=None, cache_dir=None, incremental=True):
+    """Lazily read a tip log from its cache (sorted by TIP_DATETIME), refreshing it if stale."""
+    lf = _cached(path, "tips", cache_dir, incremental)
+    return ingest.filter_tips(lf, start_time, end_time)
+
+
+def cached_events(path, start_time=None, end_time=None, cache_dir=None, incremental=True):
+    """Lazily read the event log from its cache (sorted by EVENT_START), refreshing it if stale."""
+    lf = _cached(path, "events", cache_dir, incremental)
+    return ingest.filter_events(lf, start_time, end_time)
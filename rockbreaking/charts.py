@@ -0,0 +1,459 @@
+"""Figures of the rockbreaking report.
+
+The notebook cells and the batch report generator (report.py) draw the same charts, so
+the figures are built here from the rollup cube and the event frames. Functions drawing
+one chart per area return a list of figures in area order. Plotly is loaded on first use
+(startup.lazy_import), so importing this module stays cheap.
+"""
+import polars as pl
+
+from . import areas, attribution, cube, downtime, rolling, startup
+from .recalibration import RR_SCALE
+
+go = startup.lazy_import("plotly.graph_objects")
+px = startup.lazy_import("plotly.express")
+subplots = startup.lazy_import("plotly.subplots")
+
+# Colour of each area in the comparison charts
+AREA_COLORS = dict(zip(areas.TIP_FILES, ["lightblue", "lightcoral", "lightgreen", "plum", "khaki", "lightsalmon"]))
+
+
+def _area_bars(df, area_colors):
+    # One bar trace per area of a frame with AREA, LOCATION and LENGTH
+    return [
+        go.Bar(
+            x=dfa["LOCATION"],
+            y=dfa["LENGTH"],
+            name=area,
+            marker=dict(color=area_colors.get(area))
+        )
+        for area, dfa in areas.partition(df).items()
+    ]
+
+
+def location_totals(rb_cube, study_days, period_label, area_colors=AREA_COLORS):
+    """Total rockbreaking time (hours) per area and location."""
+    # Converted from minutes to hours
+    df = cube.query(rb_cube, "day", by=("AREA", "LOCATION"), **study_days).with_columns(
+        (pl.col("LENGTH_SUM") / 60).alias("LENGTH")
+    )
+    fig = go.Figure(data=_area_bars(df, area_colors))
+    fig.update_layout(
+        title=f"{period_label} Comparison of total time (hours) rockbreaking per Location",
+        xaxis=dict(title="Location"),
+        yaxis=dict(title="Downtime (hours)")
+    )
+    return fig
+
+
+def location_means(rb_cube, study_days, period_label, area_colors=AREA_COLORS):
+    """Mean rockbreaking time per event per area and location."""
+    df = cube.query(rb_cube, "day", by=("AREA", "LOCATION"), **study_days).with_columns(
+        pl.col("LENGTH_MEAN").alias("LENGTH")
+    )
+    fig = go.Figure(data=_area_bars(df, area_colors))
+    fig.update_layout(
+        title=f"{period_label} Comparison of mean rockbreaking time (hours) per Location",
+        xaxis=dict(title="Location"),
+        yaxis=dict(title="Downtime (hours)")
+    )
+    return fig
+
+
+def true_downtime(events, period_label):
+    """Downtime per area split into exclusive time per location and overlap (hours)."""
+    summary = downtime.downtime_summary(events)
+    exclusive = downtime.exclusive_time(events)
+    labels = [areas.area_label(area) for area in summary["AREA"]]
+
+    # Stacked bars per area: exclusive time of every location and overlap time, converted from minutes to hours
+    fig = go.Figure(data=[
+        go.Bar(
+            x=[areas.area_label(area) for area in df["AREA"]],
+            y=df["EXCLUSIVE"] / 60,
+            name=f"{location} only"
+        )
+        for (location,), df in exclusive.sort("AREA").partition_by("LOCATION", as_dict=True).items()
+    ] + [
+        go.Bar(
+            x=labels,
+            y=summary["OVERLAP"] / 60,
+            name="Overlap",
+            marker=dict(color="grey")
+        ),
+        go.Scatter(
+            x=labels,
+            y=summary["EVENT_TIME"] / 60,
+            name="Sum of event times",
+            mode="markers",
+            marker=dict(color="black", symbol="line-ew-open", size=40)
+        )
+    ])
+    fig.update_layout(
+        title=f"{period_label} True downtime (hours) per Area without double counting overlapping events",
+        xaxis=dict(title="Area"),
+        yaxis=dict(title="Downtime (hours)"),
+        barmode="stack"
+    )
+    return fig
+
+
+def location_rocky_ratio(rb_cube, study_days, period_label):
+    """Total rockbreaking time (hours) per location coloured by mean rocky ratio, per area."""
+    df = cube.query(rb_cube, "day", by=("AREA", "LOCATION"), **study_days).select(
+        "AREA", "LOCATION", (pl.col("LENGTH_SUM") / 60).alias("LENGTH"), pl.col("ROCKY_RATIO_MEAN").alias("ROCKY_RATIO")
+    ).sort(pl.col("LOCATION"), descending=True)
+
+    figs = []
+    for area, dfa in areas.partition(df).items():
+        fig = px.bar(dfa, x="LOCATION", y="LENGTH", color="ROCKY_RATIO")
+        fig.update_layout(
+            title=f"{period_label} Total rockbreaking time (hours) and mean rocky ratio per Location in Area {areas.area_label(area)}",
+            xaxis=dict(title="Location"),
+            yaxis=dict(title="Downtime (hours)")
+        )
+        figs.append(fig)
+    return figs
+
+
+def grizzly_daily(rb_cube, study_days):
+    """Rockbreaking time (LENGTH) and number of events (EVENTS) at the grizzly per area and production day.
+
+    EVENTS counts every event, including those left without a tip by the join.
+    """
+    return cube.query(rb_cube, "day", by=("AREA", "BUCKET"), **study_days, LOCATION="Grizzly").select(
+        "AREA", pl.col("BUCKET").alias("SHIFT_DATE"), pl.col("LENGTH_SUM").alias("LENGTH"), "EVENTS"
+    )
+
+
+def daily(df_daily, period_label):
+    """Grizzly rockbreaking time and number of events per production day, per area."""
+    figs = []
+    for area, df in areas.partition(df_daily).items():
+        fig = go.Figure(data=[
+            go.Bar(
+                x=df["SHIFT_DATE"],
+                y=df["LENGTH"],
+                name="Total hours rockbreaking",
+                marker=dict(color="lightblue"),
+                texttemplate="%{y:.2~f}",  # Values rounded to 2 decimals, drawn from y instead of a second array
+                textposition="outside"  # Position the values outside the bars
+            ),
+            go.Bar(
+                x=df["SHIFT_DATE"],
+                y=df["EVENTS"],
+                name="Number of Rockbreaking events",
+                marker=dict(color="lightcoral"),
+                texttemplate="%{y:.2~f}",
+                textposition="outside"
+            )
+        ])
+        fig.update_layout(
+            title=f"{period_label} Analysis of Rockbreaking events and length - Location {areas.area_label(area)}",
+            xaxis=dict(title="Date"),
+            yaxis=dict(title="", showticklabels=False),
+            yaxis2=dict(title="Events (count)", overlaying="y", side="right"),  # Secondary Y-axis
+            barmode="group"  # Ensures bars are grouped side by side
+        )
+        figs.append(fig)
+    return figs
+
+
+def rolling_downtime(df_rolling, period_label, period=rolling.PERIODS[-1]):
+    """Downtime and event rate over the trailing period per location (rolling.metrics), per area."""
+    label = rolling.period_label(period)
+    figs = []
+    for area, df in areas.partition(df_rolling).items():
+        fig = go.Figure()
+        for (location,), dfl in sorted(df.partition_by("LOCATION", as_dict=True).items()):
+            fig.add_trace(go.Scatter(
+                x=dfl["TIME"],
+                y=dfl[f"DOWNTIME_{label}"],
+                name=f"{location} downtime",
+                mode="lines",
+                customdata=dfl.select(f"MASS_{label}", f"MASS_DT_RATIO_{label}").to_numpy(),
+                hovertemplate="%{x}: %{y:.0f} min<br>%{customdata[0]:.0f} t, %{customdata[1]:.0f} t per minute"
+                              "<extra></extra>"
+            ))
+            fig.add_trace(go.Scatter(
+                x=dfl["TIME"],
+                y=dfl[f"EVENTS_PER_HOUR_{label}"],
+                name=f"{location} events per hour",
+                mode="lines",
+                line=dict(dash="dot"),
+                yaxis="y2"
+            ))
+        fig.update_layout(
+            title=f"Location {areas.area_label(area)} - Rockbreaking in the last {label} ({period_label})",
+            xaxis=dict(title="Time"),
+            yaxis=dict(title=f"Downtime in the last {label} (minutes)"),
+            yaxis2=dict(title="Events per hour", overlaying="y", side="right", showgrid=False)
+        )
+        figs.append(fig)
+    return figs
+
+
+def anomalies(df_scores, period_label):
+    """Downtime per production day and location with the days flagged by anomaly.detect, per area."""
+    figs = []
+    for area, df in areas.partition(df_scores).items():
+        df = df.with_columns(pl.col("LOCATION").cast(pl.String))
+        flagged = df.filter(pl.col("ANOMALY")).with_columns(
+            pl.col("ORIGINS").list.join(", ").fill_null("")
+        )
+        fig = go.Figure(data=[
+            go.Bar(
+                x=dfl["BUCKET"],
+                y=dfl["VALUE"],
+                name=location,
+                customdata=dfl.select("Z", "UCL").to_numpy(),
+                hovertemplate="%{x}: %{y:.0f} min<br>z-score %{customdata[0]:.1f}, EWMA limit %{customdata[1]:.0f}"
+                              "<extra></extra>"
+            )
+            for (location,), dfl in sorted(df.partition_by("LOCATION", as_dict=True).items())
+        ] + [
+            go.Scatter(
+                x=flagged["BUCKET"],
+                y=flagged["VALUE"],
+                name="Anomaly",
+                mode="markers",
+                marker=dict(color="red", symbol="x", size=12),
+                customdata=flagged.select("LOCATION", "ORIGINS").to_numpy(),
+                hovertemplate="%{x} %{customdata[0]}: %{y:.0f} min<br>%{customdata[1]}<extra></extra>"
+            )
+        ])
+        fig.update_layout(
+            title=f"Location {areas.area_label(area)} - Rockbreaking time (minutes) per day and abnormal days ({period_label})",
+            xaxis=dict(title="Date"),
+            yaxis=dict(title="Rockbreaking Time (Minutes)"),
+            barmode="group"
+        )
+        figs.append(fig)
+    return figs
+
+
+def busiest_days(grizzly, df_daily):
+    """Grizzly events of the production day with the most rockbreaking time in each area."""
+    busiest = df_daily.group_by("AREA").agg(pl.col("SHIFT_DATE").sort_by("LENGTH").last())
+    return grizzly.join(busiest, on=["AREA", "SHIFT_DATE"])
+
+
+def drill_down(events, every=None):
+    """Rockbreaking time of each event of a day coloured by rocky ratio, per area.
+
+    With every (e.g. "1h"), the events are pre-aggregated into one bar per period with
+    the total LENGTH and the mean ROCKY_RATIO of its events, so the figure grows with the
+    number of periods instead of the number of events.
+    """
+    if every is not None:
+        events = events.group_by(
+            "AREA", "SHIFT_DATE", pl.col("EVENT_START").dt.truncate(every), maintain_order=True
+        ).agg(pl.col("LENGTH").sum(), pl.col("ROCKY_RATIO").mean())
+    figs = []
+    for area, dfa in areas.partition(events).items():
+        fig = px.bar(dfa, x="EVENT_START", y="LENGTH", color="ROCKY_RATIO")
+        fig.update_layout(
+            title=f"{dfa['SHIFT_DATE'][0]:%d/%m/%y} rockbreaking time (hours) and mean rocky ratio per Location in Area {areas.area_label(area)}",
+            xaxis=dict(title="Location"),
+            yaxis=dict(title="Downtime (hours)")
+        )
+        figs.append(fig)
+    return figs
+
+
+def zone_metrics(rb_cube, study_days, period_label, top=10):
+    """Grizzly time and mass dumped per downtime of the top zones, per area."""
+    # Total grizzly dt length, total mass/downtime ratio and rocky ratio of the zones of every area, read from the cube
+    totals = areas.partition(
+        cube.query(rb_cube, "day", by=("AREA", "ORIGIN"), **study_days, LOCATION="Grizzly").drop_nulls("ORIGIN").select(
+            "AREA",
+            pl.col("ORIGIN").cast(pl.String),
+            pl.col("LENGTH_SUM").alias("TOTAL_LENGTH"),
+            pl.col("MASS_DT_RATIO_SUM").alias("TOTAL_MASS_DT"),
+            pl.col("ROCKY_RATIO_MEAN").alias("ROCKY_RATIO")
+        )
+    )
+
+    figs = []
+    for area, df in totals.items():
+        # Sort by total length in descending order, keeping the top zones, and convert the sorted order to a list
+        df_top_length = df.sort("TOTAL_LENGTH", descending=True).head(top)
+        df_top_massdt = df.sort("TOTAL_MASS_DT", descending=True).head(top)
+        ordered_length = df_top_length["ORIGIN"].to_list()
+        ordered_massdt = df_top_massdt["ORIGIN"].to_list()
+
+        fig_length = px.bar(
+            df_top_length,
+            x="ORIGIN",
+            y="TOTAL_LENGTH",
+            color="ROCKY_RATIO",
+            category_orders={"ORIGIN": ordered_length},
+            title="Rockbreaking Time (Minutes) per Zone"
+        )
+        fig_massdt = px.bar(
+            df_top_massdt,
+            x="ORIGIN",
+            y="TOTAL_MASS_DT",
+            color="ROCKY_RATIO",
+            category_orders={"ORIGIN": ordered_massdt},
+            title="Downtime (Minutes) per Zone"
+        )
+
+        # Both charts stacked in one figure
+        fig = subplots.make_subplots(
+            rows=2, cols=1,
+            shared_xaxes=False,
+            vertical_spacing=0.2,
+            subplot_titles=[
+                "Rockbreaking Time (Minutes) per Zone",
+                "Mass dumped per Downtime (T/min) per Zone"
+            ]
+        )
+        for trace in fig_length.data:
+            fig.add_trace(trace, row=1, col=1)
+        for trace in fig_massdt.data:
+            fig.add_trace(trace, row=2, col=1)
+
+        fig.update_layout(
+            title=f"Location {areas.area_label(area)} - Metrics per top {top} Zones ({period_label})",
+            xaxis=dict(title="Origin", categoryorder="array", categoryarray=ordered_length),
+            xaxis2=dict(title="Origin", categoryorder="array", categoryarray=ordered_massdt),
+            yaxis=dict(title="Rockbreaking Time (Minutes)"),
+            yaxis2=dict(title="Mass dumped per downtime (T/min)"),
+            height=800
+        )
+        figs.append(fig)
+    return figs
+
+
+def attribution_comparison(links, rb_cube, study_days, period_label):
+    """Grizzly time per zone shared between trucks vs. blamed on the last truck, per area."""
+    shared = areas.partition(attribution.attributed_totals(links).sort("LENGTH", descending=True))
+    last = areas.partition(
+        cube.query(rb_cube, "day", by=("AREA", "ORIGIN"), **study_days, LOCATION="Grizzly").select(
+            "AREA", "ORIGIN", pl.col("LENGTH_SUM").alias("LENGTH")
+        )
+    )
+
+    figs = []
+    for area, df in shared.items():
+        fig = go.Figure(data=[
+            go.Bar(
+                x=last[area]["ORIGIN"] if area in last else [],
+                y=last[area]["LENGTH"] if area in last else [],
+                name="Last truck only",
+                marker=dict(color="lightblue")
+            ),
+            go.Bar(
+                x=df["ORIGIN"],
+                y=df["LENGTH"],
+                name="Shared between trucks",
+                marker=dict(color="lightcoral")
+            )
+        ])
+        fig.update_layout(
+            title=f"Location {areas.area_label(area)} - Rockbreaking time (minutes) per Zone with multi-tip attribution ({period_label})",
+            xaxis=dict(title="Origin", categoryorder="array", categoryarray=df["ORIGIN"].to_list()),
+            yaxis=dict(title="Rockbreaking Time (Minutes)"),
+            barmode="group"
+        )
+        figs.append(fig)
+    return figs
+
+
+def truck_ranking(truck_index, study_days, period_label, top=10):
+    """Trucks with the most grizzly events per 1000 t tipped (trucks.TruckIndex), per area."""
+    figs = []
+    for area in areas.TIP_FILES:
+        df = truck_index.top(top, **study_days, AREA=area).with_columns(pl.col("TRUCK_ID").cast(pl.String))
+        if df.is_empty():
+            continue
+        fig = go.Figure(data=[
+            go.Bar(
+                x=df["TRUCK_ID"],
+                y=df["EVENTS_PER_KT"],
+                name="Shared between trucks",
+                marker=dict(color="lightcoral"),
+                customdata=df.select("TIPS", "MASS", "RR_MEAN").to_numpy(),
+                hovertemplate="%{x}: %{y:.2f} events per kt<br>%{customdata[0]} tips, %{customdata[1]:.0f} t, "
+                              "rocky ratio %{customdata[2]:.2f}<extra></extra>"
+            ),
+            go.Bar(
+                x=df["TRUCK_ID"],
+                y=df["BLAMED_PER_KT"],
+                name="Last truck only",
+                marker=dict(color="lightblue")
+            )
+        ])
+        fig.update_layout(
+            title=f"Location {areas.area_label(area)} - Grizzly events per 1000 t tipped, top {top} trucks ({period_label})",
+            xaxis=dict(title="Truck", categoryorder="array", categoryarray=df["TRUCK_ID"].to_list()),
+            yaxis=dict(title="Events per 1000 t"),
+            barmode="group"
+        )
+        figs.append(fig)
+    return figs
+
+
+def recalibration(df_recalibration, period_label):
+    """Assigned rocky ratio vs. the ratio implied by the events of every zone, per area."""
+    figs = []
+    for area, df in areas.partition(df_recalibration.drop_nulls("ROCKY_RATIO")).items():
+        df = df.with_columns(pl.col("ORIGIN").cast(pl.String)).sort("ROCKY_RATIO", descending=True)
+        fig = go.Figure(data=[
+            go.Bar(
+                x=df["ORIGIN"],
+                y=df["ROCKY_RATIO"],
+                name="Assigned",
+                # Zones whose assigned ratio is outside the interval implied by their events
+                marker=dict(color=["lightcoral" if flagged else "lightblue" for flagged in df["MISCLASSIFIED"]])
+            ),
+            go.Scatter(
+                x=df["ORIGIN"],
+                y=df["RR_EVENTS"],
+                name="Implied by the events",
+                mode="markers",
+                marker=dict(color="black"),
+                error_y=dict(type="data", symmetric=False, array=df["RR_EVENTS_HI"] - df["RR_EVENTS"],
+                             arrayminus=df["RR_EVENTS"] - df["RR_EVENTS_LO"]),
+                customdata=df.select("EVENTS", "TONNES", "EVENTS_PER_KT").to_numpy(),
+                hovertemplate="%{x}: %{y:.2f}<br>%{customdata[0]} events, %{customdata[1]:.0f} t"
+                              " (%{customdata[2]:.2f} per 1000 t)<extra></extra>"
+            )
+        ])
+        fig.update_layout(
+            title=f"Location {areas.area_label(area)} - Assigned and implied rocky ratio per Zone ({period_label})",
+            xaxis=dict(title="Origin", categoryorder="array", categoryarray=df["ORIGIN"].to_list()),
+            # Implied ratios are clipped to the scale, 1 being rocky and 5 not rocky
+            yaxis=dict(title="Rocky ratio", range=[0, RR_SCALE[1] + 0.5])
+        )
+        figs.append(fig)
+    return figs
+
+
+def downtime_prediction(df_prediction, cv_rmse, period_label):
+    """Grizzly downtime per time bucket against the downtime predicted by the model, per area."""
+    figs = []
+    for area, df in areas.partition(df_prediction).items():
+        fig = go.Figure(data=[
+            go.Bar(
+                x=df["BUCKET"],
+                y=df["DOWNTIME"],
+                name="Actual",
+                marker=dict(color="lightblue")
+            ),
+            go.Scatter(
+                x=df["BUCKET"],
+                y=df["PREDICTED"],
+                name="Predicted",
+                mode="lines",
+                line=dict(color="black")
+            )
+        ])
+        fig.update_layout(
+            title=f"Location {areas.area_label(area)} - Predicted grizzly downtime per hour (cross-validated RMSE {cv_rmse:.0f}) ({period_label})",
+            xaxis=dict(title="Time"),
+            yaxis=dict(title="Downtime")
+        )
+        figs.append(fig)
+    return figs
@@ -0,0 +1,130 @@
+"""Pre-aggregated rollup cube of the joined rockbreaking events.
+
+The events (joined to their tips) are aggregated once per time bucket, AREA, LOCATION and
+ORIGIN, keeping for every measure the number of non-null values, their sum and their sum
+of squares. Counts, totals, means and standard deviations for any coarser grouping can
+then be derived from the cube by adding these up, without going back to the events:
+
+    cube = build_cube(df_all)
+    query(cube, "day", by=("AREA", "LOCATION"))            # totals per area and location
+    query(cube, "day", by=("AREA", "BUCKET"), LOCATION="Grizzly")  # grizzly time per day
+
+The time buckets are the hour (start of the hour), the shift (SHIFT_ID), the production
+day (SHIFT_DATE) and the week (Monday of the week of the production day). After rows were
+appended to the logs, update_cube rebuilds the buckets from the week of the first day they
+touch and keeps the rest.
+"""
+import datetime as dt
+
+import polars as pl
+
+from . import shifts
+
+# Event columns aggregated in the cube
+MEASURES = ("LENGTH", "MASS", "ROCKY_RATIO", "MASS_DT_RATIO")
+
+# Non-time keys of the cube
+DIMENSIONS = ("AREA", "LOCATION", "ORIGIN")
+
+# Time bucket of each grain, computed from the event columns
+GRAINS = {
+    "hour": pl.col("EVENT_START").dt.truncate("1h"),
+    "shift": pl.col("SHIFT_ID"),
+    "day": pl.col("SHIFT_DATE"),
+    "week": pl.col("SHIFT_DATE").dt.truncate("1w"),
+}
+
+
+def _sums(measures):
+    # Columns of the cube that are added up when rolling up
+    return ["EVENTS"] + [f"{m}_{stat}" for m in measures for stat in ("N", "SUM", "SQ")]
+
+
+def build_cube(joined, grains=tuple(GRAINS), measures=MEASURES):
+    """Aggregate joined events into {grain: frame} with one row per bucket and dimensions.
+
+    joined needs EVENT_START, the shift keys (shifts.add_shift_keys), the dimensions and
+    LENGTH, MASS and ROCKY_RATIO; MASS_DT_RATIO (tonnes per minute of rockbreaking) is
+    computed when missing. The events are grouped once at the finest grain (hour within
+    shift) and every grain is rolled up from that.
+    """
+    if "MASS_DT_RATIO" not in joined.columns:
+        joined = joined.with_columns((pl.col("MASS") / pl.col("LENGTH")).alias("MASS_DT_RATIO"))
+    keys = [expr.alias(f"_{grain}") for grain, expr in GRAINS.items() if grain in grains]
+    base = joined.group_by(*keys, *DIMENSIONS).agg(
+        pl.len().alias("EVENTS"),
+        *[
+            agg
+            for m in measures
+            for agg in (
+                pl.col(m).count().alias(f"{m}_N"),
+                pl.col(m).sum().alias(f"{m}_SUM"),
+                (pl.col(m) ** 2).sum().alias(f"{m}_SQ"),
+            )
+        ],
+    )
+    return {
+        grain: base.group_by(f"_{grain}", *DIMENSIONS).agg(pl.col(_sums(measures)).sum())
+        .rename({f"_{grain}": "BUCKET"})
+        .sort("BUCKET", *DIMENSIONS)
+        for grain in grains
+    }
+
+
+def update_cube(cube, joined, first_day, roster=shifts.DEFAULT_ROSTER, measures=MEASURES):
+    """Cube with the buckets from the week of first_day onwards rebuilt from the joined events.
+
+    joined is the whole joined frame after the append and first_day the earliest
+    production day whose events changed (incremental.first_affected_day).
+    """
+    if first_day is None:
+        return cube
+    # A week bucket holds the days before first_day too, so the rebuild starts on its Monday
+    since = first_day - dt.timedelta(days=first_day.weekday())
+    hour = shifts.day_start(roster, since).replace(minute=0, second=0, microsecond=0)
+    bounds = {
+        "hour": hour,
+        "shift": (since - dt.date(1970, 1, 1)).days * len(roster.starts),
+        "day": since,
+        "week": since,
+    }
+    rebuilt = build_cube(joined.filter(pl.col("EVENT_START") >= hour), tuple(cube), measures)
+    return {
+        grain: pl.concat([
+            df.filter(pl.col("BUCKET") < bounds[grain]),
+            rebuilt[grain].filter(pl.col("BUCKET") >= bounds[grain]),
+        ])
+        for grain, df in cube.items()
+    }
+
+
+def query(cube, grain="day", by=("AREA", "LOCATION"), start=None, end=None, **filters):
+    """Roll the cube up to the columns in by, with derived means and standard deviations.
+
+    start and end limit the buckets (start <= BUCKET < end) and must match the bucket
+    type of the grain (datetime for hours, SHIFT_ID for shifts, date for days and weeks).
+    Keyword filters select dimension values, e.g. LOCATION="Grizzly" or
+    ORIGIN=["ZONE1", "ZONE2"]. Returns EVENTS and, per measure, <m>_N (non-null values),
+    <m>_SUM, <m>_MEAN and <m>_STD (sample standard deviation), sorted by the by columns.
+    """
+    df = cube[grain]
+    if start is not None:
+        df = df.filter(pl.col("BUCKET") >= start)
+    if end is not None:
+        df = df.filter(pl.col("BUCKET") < end)
+    for col, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            df = df.filter(pl.col(col).cast(pl.String).is_in(list(value)))
+        else:
+            df = df.filter(pl.col(col) == value)
+
+    measures = [col[:-4] for col in df.columns if col.endswith("_SUM")]
+    df = df.group_by(*by).agg(pl.col(_sums(measures)).sum())
+    return df.with_columns(
+        *[(pl.col(f"{m}_SUM") / pl.col(f"{m}_N")).alias(f"{m}_MEAN") for m in measures],
+        *[
+            ((pl.col(f"{m}_SQ") - pl.col(f"{m}_SUM") ** 2 / pl.col(f"{m}_N"))
+             / (pl.col(f"{m}_N") - 1)).clip(lower_bound=0).sqrt().alias(f"{m}_STD")
+            for m in measures
+        ],
+    ).drop([f"{m}_SQ" for m in measures]).sort(*by)
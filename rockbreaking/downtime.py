@@ -0,0 +1,78 @@
+"""Downtime of each crushing area without double counting overlapping events.
+
+The Grizzly and Crusher rockbreakers of an area can be working at the same time, and the
+production lost while both are stopped is only lost once. Summing LENGTH per location
+and adding the locations up therefore overstates the downtime of the area. This module
+works on the EVENT_START/EVENT_END intervals instead: downtime_summary and exclusive_time
+sweep over the sorted start and end times once, keeping the number of events running
+overall and per location, to split the downtime into time with events running at several
+locations at once (overlap) and the time each location was the only one stopped.
+
+All durations are returned in minutes, like LENGTH in the notebook.
+"""
+import polars as pl
+
+
+def _minutes(expr):
+    return expr.dt.total_microseconds() / 60e6
+
+
+def _sweep(events, by):
+    # One row per event start (+1) or end (-1), sorted by time within the group, with the
+    # number of events running overall and per location after each step, the number of
+    # locations with an event running, and the length of the segment until the next step
+    locations = events["LOCATION"].unique().sort().to_list()
+    steps = pl.concat([
+        events.select(by, "LOCATION", pl.col("EVENT_START").alias("T"), pl.lit(1).alias("STEP")),
+        events.select(by, "LOCATION", pl.col("EVENT_END").alias("T"), pl.lit(-1).alias("STEP")),
+    ]).sort(by, "T")
+    steps = steps.with_columns(
+        pl.col("STEP").cum_sum().over(by).alias("RUNNING"),
+        *[
+            pl.when(pl.col("LOCATION") == location).then(pl.col("STEP")).otherwise(0)
+            .cum_sum().over(by).alias(f"RUNNING_{location}")
+            for location in locations
+        ],
+        _minutes(pl.col("T").shift(-1).over(by) - pl.col("T")).fill_null(0).alias("SEGMENT"),
+    )
+    return steps.with_columns(
+        pl.sum_horizontal(
+            (pl.col(f"RUNNING_{location}") > 0).cast(pl.Int32) for location in locations
+        ).alias("LOCATIONS_RUNNING")
+    ), locations
+
+
+def downtime_summary(events, by="AREA"):
+    """Total downtime of each group with overlapping events counted once.
+
+    Returns per group:
+
+    * EVENT_TIME: sum of the event durations (what adding locations up gives)
+    * DOWNTIME: time with at least one event running (true lost time)
+    * OVERLAP: time with events running at two or more locations at once
+    """
+    swept, _ = _sweep(events, by)
+    return swept.group_by(by).agg(
+        pl.col("SEGMENT").filter(pl.col("RUNNING") > 0).sum().alias("DOWNTIME"),
+        pl.col("SEGMENT").filter(pl.col("LOCATIONS_RUNNING") > 1).sum().alias("OVERLAP"),
+        (pl.col("SEGMENT") * pl.col("RUNNING")).sum().alias("EVENT_TIME"),
+    ).select(by, "EVENT_TIME", "DOWNTIME", "OVERLAP").sort(by)
+
+
+def exclusive_time(events, by="AREA"):
+    """Time each location of a group was the only one with an event running.
+
+    Returns one row per group and LOCATION with EXCLUSIVE (minutes). Per group, the
+    exclusive times of all locations plus the OVERLAP of downtime_summary add up to the
+    DOWNTIME.
+    """
+    swept, locations = _sweep(events, by)
+    return pl.concat([
+        swept.group_by(by).agg(
+            pl.lit(location).alias("LOCATION"),
+            pl.col("SEGMENT").filter(
+                (pl.col(f"RUNNING_{location}") > 0) & (pl.col("LOCATIONS_RUNNING") == 1)
+            ).sum().alias("EXCLUSIVE"),
+        )
+        for location in locations
+    ]).sort(by, "LOCATION")
@@ -0,0 +1,96 @@
+"""Compact static HTML pages of plotly figures.
+
+Most of the size of an exported plotly figure is not its data but the layout template
+(about 7 KB per figure with the default theme) and, when the page is self-contained,
+plotly.js itself. A page written here holds each distinct template and plotly.js at
+most once and draws every figure from its data and layout only. Numeric arrays are
+written the way plotly serialises numpy arrays, as base64 typed arrays (dtype/bdata),
+so the page grows with the number of bars and categories drawn, not with a fixed
+overhead per figure.
+"""
+import gzip
+import html
+import json
+
+from . import startup
+
+pio = startup.lazy_import("plotly.io")
+offline = startup.lazy_import("plotly.offline")
+
+PLOTLYJS = ("cdn", "inline")
+
+_DRAW = (
+    "function rbPlot(id, template, fig) {\n"
+    "  fig.layout.template = RB_TEMPLATES[template];\n"
+    "  Plotly.newPlot(id, fig.data, fig.layout, {responsive: true});\n"
+    "}\n"
+)
+
+
+def _script(code):
+    # Inline JSON must not close the script element it sits in
+    return "<script>" + code.replace("</", "<\\/") + "</script>"
+
+
+def split_template(fig):
+    """(figure without its layout template, template) as plain JSON-ready dicts."""
+    spec = json.loads(pio.to_json(fig, validate=False))
+    template = spec.get("layout", {}).pop("template", {})
+    return {"data": spec["data"], "layout": spec.get("layout", {})}, template
+
+
+def page(title, sections, plotlyjs="cdn"):
+    """HTML of a page with a heading per section and its figures below it.
+
+    sections is a list of (heading, [figures]). plotlyjs is "cdn" to load plotly.js from
+    cdn.plot.ly or "inline" to embed it once, so that the page also works offline.
+    """
+    if plotlyjs not in PLOTLYJS:
+        raise ValueError(f"plotlyjs must be one of {PLOTLYJS}, got {plotlyjs!r}")
+    templates = {}
+    figures = 0
+    body = [] if sections else ["<p>No rockbreaking events in this period.</p>"]
+    for heading, figs in sections:
+        body.append(f"<h2>{html.escape(heading)}</h2>")
+        for fig in figs:
+            spec, template = split_template(fig)
+            key = json.dumps(template, sort_keys=True, separators=(",", ":"))
+            index = templates.setdefault(key, len(templates))
+            fig_id = f"fig-{figures}"
+            figures += 1
+            body.append(f'<div id="{fig_id}"></div>')
+            body.append(_script(f'rbPlot("{fig_id}", {index}, {json.dumps(spec, separators=(",", ":"))});'))
+
+    if plotlyjs == "inline":
+        # Embedded as plotly.io.to_html does, plotly.js holds no closing script tag
+        library = f"<script>{offline.get_plotlyjs()}</script>"
+    else:
+        library = f'<script src="https://cdn.plot.ly/plotly-{offline.get_plotlyjs_version()}.min.js"></script>'
+    return "\n".join([
+        "<!DOCTYPE html>",
+        "<html>",
+        "<head>",
+        '<meta charset="utf-8">',
+        f"<title>{html.escape(title)}</title>",
+        library,
+        _script(f"const RB_TEMPLATES = [{','.join(templates)}];\n{_DRAW}"),
+        "</head>",
+        "<body>",
+        f"<h1>{html.escape(title)}</h1>",
+        *body,
+        "</body>",
+        "</html>",
+        "",
+    ])
+
+
+def write_page(path, title, sections, plotlyjs="cdn", compress=False):
+    """Write page(title, sections) to path, gzipped to path + '.gz' with compress; returns the path written."""
+    data = page(title, sections, plotlyjs).encode("utf-8")
+    if compress:
+        path += ".gz"
+        # mtime=0 keeps the output identical for identical reports
+        data = gzip.compress(data, mtime=0)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
@@ -0,0 +1,158 @@
+"""Updating the joined and aggregated frames after new rows were appended to the CSVs.
+
+A new tip can only change the tip matched to the events that come after it, and a new
+event only adds to the day it starts in, so after an append everything before the first
+shift-day touched by the new rows is still valid. The helpers below recompute from that
+day onwards and splice the result onto the rows that were already computed.
+
+A Pipeline ties them to the caches of a data folder: load brings the caches up to date
+(parsing only the appended tails) and remembers the first day they touch, and every
+derived frame asked of it afterwards is updated from that day rather than rebuilt:
+
+    pipeline = incremental.Pipeline(data_dir, roster)
+    tips, events = pipeline.load()                  # again whenever the CSVs grew
+    joined = pipeline.joined(events, tips, "4h")
+    rb_cube = pipeline.cube(joined)
+    truck_index = pipeline.trucks(tips, joined)
+"""
+import dataclasses
+import datetime as dt
+import os
+
+import polars as pl
+
+from . import areas, attribution, cache, cube, join, shifts, trucks
+
+# Time column of each kind of frame
+TIME_COLUMNS = ("EVENT_START", "TIP_DATETIME")
+
+# First day touched by a load that had to rebuild a cache: everything is redone
+REBUILT = dt.date.min
+
+
+def first_affected_day(*new_rows, roster=shifts.DEFAULT_ROSTER):
+    """Earliest production day touched by freshly appended tip or event rows.
+
+    Returns None when none of the frames has any rows.
+    """
+    days = []
+    for df in new_rows:
+        if df is None or df.is_empty():
+            continue
+        col = next(c for c in TIME_COLUMNS if c in df.columns)
+        days.append(df.select(shifts.shift_keys(col, roster)[0].min()).item())
+    return min(days) if days else None
+
+
+def update_joined(previous, events, tips, first_day, roster=shifts.DEFAULT_ROSTER,
+                  tolerance=join.TIP_TOLERANCE):
+    """Redo the as-of join of events onto tips (join.attach_last_tip) from first_day onwards.
+
+    events and tips are the full sorted frames of all areas, previous is the result of the
+    same join before the append.
+    """
+    if first_day is None:
+        return previous
+    since = shifts.day_start(roster, first_day)
+    joined = join.attach_last_tip(
+        events.filter(pl.col("EVENT_START") >= since), tips, tolerance
+    )
+    return pl.concat([previous.filter(pl.col("EVENT_START") < since), joined])
+
+
+def _refresh(path, kind):
+    # Rows appended to the cache of a CSV (None if it was fresh), or REBUILT
+    if cache.is_fresh(path):
+        return None
+    tail = cache.append_tail(path, kind)
+    if tail is None:
+        cache.rebuild(path, kind)
+        return REBUILT
+    return tail
+
+
+@dataclasses.dataclass
+class _Stage:
+    # Result of a derived frame, the loads it is up to date with and what it was computed from
+    result: object
+    loads: int
+    params: tuple
+    version: int
+
+
+class Pipeline:
+    """Frames of the CSVs of a data folder and the frames derived from them, kept up to date.
+
+    memo, if given, computes the frames that are built from scratch (memo.Memo, so that a
+    restart reuses them). The frames passed to joined, cube and trucks must be those of
+    the latest load (or derived from them the same way every time), as only the days
+    touched by the loads since the previous call are recomputed.
+    """
+
+    def __init__(self, data_dir, roster=shifts.DEFAULT_ROSTER, tip_files=None, event_file=areas.EVENT_FILE,
+                 memo=None):
+        self.data_dir = data_dir
+        self.roster = roster
+        self.tip_files = areas.TIP_FILES if tip_files is None else tip_files
+        self.event_file = event_file
+        self.memo = memo if memo is not None else (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+        # First day touched by every load so far (None when nothing was appended)
+        self.changes = []
+        self._stages = {}
+
+    def load(self):
+        """(tips, events) of all areas as areas.load returns them, after refreshing the caches."""
+        files = [(name, "tips") for name in self.tip_files.values()] + [(self.event_file, "events")]
+        tails = [_refresh(os.path.join(self.data_dir, name), kind) for name, kind in files]
+        if any(tail is REBUILT for tail in tails):
+            self.changes.append(REBUILT)
+        else:
+            self.changes.append(first_affected_day(*tails, roster=self.roster))
+        return areas.load(self.data_dir, tip_files=self.tip_files, event_file=self.event_file, roster=self.roster)
+
+    def version(self, name):
+        """Number of times a derived frame was built from scratch; a frame depending on it passes it in its params."""
+        stage = self._stages.get(name)
+        return stage.version if stage else 0
+
+    def stage(self, name, params, build, update):
+        """Derived frame name: build() the first time and when params change, else update(previous, first_day).
+
+        first_day is the earliest day touched by the loads since the previous call;
+        previous is returned as it is when there were none.
+        """
+        stage = self._stages.get(name)
+        days = [day for day in self.changes[stage.loads:] if day is not None] if stage else []
+        first_day = min(days) if days else None
+        if stage is None or stage.params != params or first_day == REBUILT:
+            version = stage.version + 1 if stage else 1
+            result = build()
+        else:
+            version = stage.version
+            result = stage.result if first_day is None else update(stage.result, first_day)
+        self._stages[name] = _Stage(result, len(self.changes), params, version)
+        return result
+
+    def joined(self, events, tips, tolerance=join.TIP_TOLERANCE):
+        """Events joined to the last tip before them (join.attach_last_tip)."""
+        return self.stage(
+            "joined", (tolerance,),
+            lambda: self.memo(join.attach_last_tip, events, tips, tolerance),
+            lambda previous, first_day: update_joined(previous, events, tips, first_day, self.roster, tolerance),
+        )
+
+    def cube(self, joined):
+        """Rollup cube of the joined events (cube.build_cube)."""
+        return self.stage(
+            "cube", (self.version("joined"),),
+            lambda: self.memo(cube.build_cube, joined),
+            lambda previous, first_day: cube.update_cube(previous, joined, first_day, self.roster),
+        )
+
+    def trucks(self, tips, joined, window=attribution.WINDOW, weights="recency"):
+        """Accountability index of the trucks (trucks.build)."""
+        return self.stage(
+            "trucks", (window, weights, self.version("joined")),
+            lambda: self.memo(trucks.build, tips, joined, window=window, weights=weights, roster=self.roster),
+            lambda previous, first_day: trucks.update(previous, tips, joined, first_day),
+        )
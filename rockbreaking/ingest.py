@@ -0,0 +1,60 @@
+"""Lazy ingestion of the truck tip logs (A_DATA/B_DATA) and the rockbreaking event log (RB_DATA).
+
+The CSVs are scanned with an explicit schema so the datetime columns are typed by the
+CSV reader itself and the study window is pushed down into the scan, which means only
+the rows inside the window are ever materialised.
+"""
+import polars as pl
+
+# Column types of the tip logs (A_DATA.csv, B_DATA.csv)
+TIP_SCHEMA = {
+    "TIP_DATETIME": pl.Datetime("us"),
+    "ORIGIN": pl.Categorical,
+    "MASS": pl.Float64,
+    "TRUCK_ID": pl.Categorical,
+    "ROCKY_RATIO": pl.Float64,
+}
+
+# Column types of the rockbreaking event log (RB_DATA.csv)
+EVENT_SCHEMA = {
+    "AREA": pl.Categorical,
+    "LOCATION": pl.Categorical,
+    "EVENT_START": pl.Datetime("us"),
+    "EVENT_END": pl.Datetime("us"),
+    "LENGTH": pl.Float64,
+}
+
+
+def filter_tips(lf, start_time=None, end_time=None):
+    """Keep tips with start_time <= TIP_DATETIME <= end_time.
+
+    Either bound can be None to leave that side of the window open. The bounds can be
+    python datetimes or polars expressions such as pl.datetime(2024, 7, 24, 6).
+    """
+    if start_time is not None:
+        lf = lf.filter(pl.col("TIP_DATETIME") >= start_time)
+    if end_time is not None:
+        lf = lf.filter(pl.col("TIP_DATETIME") <= end_time)
+    return lf
+
+
+def filter_events(lf, start_time=None, end_time=None):
+    """Keep events that start and end inside the window (same bounds as filter_tips)."""
+    if start_time is not None:
+        lf = lf.filter(pl.col("EVENT_START") >= start_time)
+    if end_time is not None:
+        lf = lf.filter(pl.col("EVENT_END") <= end_time)
+    return lf
+
+
+def scan_tips(path, start_time=None, end_time=None):
+    """Lazily scan a tip log, keeping tips with start_time <= TIP_DATETIME <= end_time."""
+    return filter_tips(pl.scan_csv(path, schema=TIP_SCHEMA), start_time, end_time)
+
+
+def scan_events(path, start_time=None, end_time=None):
+    """Lazily scan the event log, keeping events that start and end inside the window.
+
+    LENGTH is left in seconds, as recorded in the CSV.
+    """
+    return filter_events(pl.scan_csv(path, schema=EVENT_SCHEMA), start_time, end_time)
@@ -0,0 +1,315 @@
+"""Per-cell profile of a run of the notebook, exported as a Chrome trace.
+
+run executes the cells of a marimo app in dependency order, as app.run does, and records
+for every cell:
+
+* its wall time and the CPU time of the process (polars threads included)
+* the change of the resident set size over the cell, and the peak it added on the way
+  (sampled from /proc/self/statm)
+* the rows of the frames it defines and the type of its output
+
+Lazy stages are traced too: while the run lasts, LazyFrame.collect and pl.collect_all are
+wrapped so that every collection gets its own span within its cell, with its time, the
+rows it returned and the optimised query plan of every query collected (LazyFrame.explain).
+Nothing is wrapped outside a run, so the notebook pays nothing for it.
+
+A cell stopped by mo.stop, or failing, does not define its names and the cells that need
+them are skipped, as in marimo. The trace is written in the Chrome trace event format
+(load it in chrome://tracing or https://ui.perfetto.dev), and summary turns it into one
+row per cell, slowest first:
+
+    python -m rockbreaking.instrument -o trace.json
+    python -m rockbreaking.instrument RockBreaking_Analytics.py -o trace.json --top 10
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import polars as pl
+
+from . import startup
+
+NOTEBOOK = startup.NOTEBOOK
+
+# Default trace file of profile, next to the other derived data of the notebook
+TRACE_FILE = os.path.join(os.path.dirname(NOTEBOOK), ".rb_cache", "trace.json")
+
+# Characters of a cell's code used as its name when it defines nothing
+LABEL_LENGTH = 60
+
+
+class PeakRss:
+    """Highest resident set size of the process while the block runs, sampled in a thread."""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def current():
+        """Resident set size of the process in bytes."""
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # Not on Linux: the lifetime peak of the process is the best there is
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.base = self.peak = self.current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def _rows(value):
+    # Rows of a frame, None for anything else
+    if isinstance(value, (pl.DataFrame, pl.Series)):
+        return len(value)
+    if isinstance(value, dict) and value and all(isinstance(v, pl.DataFrame) for v in value.values()):
+        # Rollups such as the cube: {level: frame}
+        return sum(len(v) for v in value.values())
+    return None
+
+
+def _label(cell, code):
+    defs = sorted(name for name in cell.defs if not name.startswith("_"))
+    if defs:
+        return ", ".join(defs)
+    line = next((line.strip() for line in code.splitlines() if line.strip()), "")
+    return line[:LABEL_LENGTH]
+
+
+class _Tracer:
+    # Trace events of a run, with the wrappers of the polars collections
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+        self.cell = None
+
+    def now(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def span(self, name, cat, started, args):
+        self.events.append({
+            "name": name, "cat": cat, "ph": "X", "ts": started, "dur": self.now() - started,
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+        })
+
+    def _collected(self, name, queries, collect):
+        plans = []
+        for query in queries:
+            try:
+                plans.append(query.explain())
+            except Exception as e:
+                plans.append(f"(no plan: {e})")
+        started, cpu = self.now(), time.process_time()
+        result = collect()
+        frames = result if isinstance(result, list) else [result]
+        self.span(name, "polars", started, {
+            "cell": self.cell,
+            "cpu_ms": (time.process_time() - cpu) * 1000,
+            "rows": sum(len(df) for df in frames if isinstance(df, pl.DataFrame)),
+            "plans": plans,
+        })
+        return result
+
+    @contextlib.contextmanager
+    def wrap_polars(self):
+        collect, collect_all = pl.LazyFrame.collect, pl.collect_all
+
+        def traced_collect(lf, *args, **kwargs):
+            return self._collected("LazyFrame.collect", [lf], lambda: collect(lf, *args, **kwargs))
+
+        def traced_collect_all(queries, *args, **kwargs):
+            queries = list(queries)
+            return self._collected("collect_all", queries, lambda: collect_all(queries, *args, **kwargs))
+
+        pl.LazyFrame.collect, pl.collect_all = traced_collect, traced_collect_all
+        try:
+            yield
+        finally:
+            pl.LazyFrame.collect, pl.collect_all = collect, collect_all
+
+
+def _order(cells):
+    # Cells in an order where every cell comes after the cells defining what it refers to
+    definers = {name: i for i, cell in enumerate(cells) for name in cell.defs}
+    needs = [{definers[ref] for ref in cell.refs if ref in definers} for cell in cells]
+    done, order = set(), []
+    while len(order) < len(cells):
+        ready = [i for i in range(len(cells)) if i not in done and needs[i] <= done]
+        if not ready:
+            raise ValueError("the cells of the app refer to each other in a cycle")
+        order += ready
+        done.update(ready)
+    return order
+
+
+def run(app, **defs):
+    """Run the cells of a marimo app with tracing; returns (trace, defs) as app.run does (outputs, defs).
+
+    defs are extra globals given to the cells (for instance __file__ when the notebook
+    finds its data next to itself). trace is a Chrome trace dict, its traceEvents one
+    "cell" span per cell and one "polars" span per collection.
+    """
+    cell_data = list(app._cell_manager.cell_data())
+    cells = [data.cell for data in cell_data]
+    tracer = _Tracer()
+    # Names the run cannot provide because a cell stopped or failed
+    missing = set()
+    with tracer.wrap_polars():
+        for i in _order(cells):
+            cell = cells[i]
+            label = _label(cell, cell_data[i].code)
+            args = {"cell": i, "label": label, "status": "ok"}
+            if cell.refs & missing:
+                args["status"] = "skipped"
+                missing |= cell.defs
+                tracer.span(label, "cell", tracer.now(), args)
+                continue
+            tracer.cell = i
+            started, cpu = tracer.now(), time.process_time()
+            try:
+                with PeakRss() as rss:
+                    output, defined = cell.run(**{ref: defs[ref] for ref in cell.refs if ref in defs})
+            except Exception as e:
+                output, defined = None, {}
+                args["status"] = f"error: {type(e).__name__}: {e}"
+            defined = dict(defined)
+            defs.update(defined)
+            if cell.defs - defined.keys() and args["status"] == "ok":
+                args["status"] = "stopped"
+            missing |= cell.defs - defined.keys()
+            rows = [n for n in (_rows(value) for value in defined.values()) if n is not None]
+            args.update({
+                "cpu_ms": (time.process_time() - cpu) * 1000,
+                "rss_delta_mb": (rss.current() - rss.base) / 1024 ** 2,
+                "peak_mb": (rss.peak - rss.base) / 1024 ** 2,
+                "rows": sum(rows) if rows else None,
+                "output": type(output).__name__,
+            })
+            tracer.span(label, "cell", started, args)
+    tracer.cell = None
+    trace = {
+        "traceEvents": tracer.events,
+        "displayTimeUnit": "ms",
+        "otherData": {"python": sys.version.split()[0], "polars": pl.__version__},
+    }
+    return trace, defs
+
+
+def summary(trace):
+    """One row per cell of a trace, slowest first.
+
+    Columns: CELL, LABEL, STATUS, WALL_S, CPU_S, RSS_DELTA_MB, PEAK_MB, ROWS, OUTPUT,
+    COLLECTS (polars collections in the cell) and COLLECT_S (their wall time).
+    """
+    collects = {}
+    for event in trace["traceEvents"]:
+        if event["cat"] == "polars":
+            n, seconds = collects.get(event["args"]["cell"], (0, 0.0))
+            collects[event["args"]["cell"]] = (n + 1, seconds + event["dur"] / 1e6)
+    rows = []
+    for event in trace["traceEvents"]:
+        if event["cat"] != "cell":
+            continue
+        args = event["args"]
+        n, seconds = collects.get(args["cell"], (0, 0.0))
+        rows.append({
+            "CELL": args["cell"],
+            "LABEL": args["label"],
+            "STATUS": args["status"],
+            "WALL_S": event["dur"] / 1e6,
+            "CPU_S": args["cpu_ms"] / 1000 if "cpu_ms" in args else None,
+            "RSS_DELTA_MB": args.get("rss_delta_mb"),
+            "PEAK_MB": args.get("peak_mb"),
+            "ROWS": args.get("rows"),
+            "OUTPUT": args.get("output"),
+            "COLLECTS": n,
+            "COLLECT_S": seconds,
+        })
+    schema = {
+        "CELL": pl.Int64, "LABEL": pl.String, "STATUS": pl.String, "WALL_S": pl.Float64, "CPU_S": pl.Float64,
+        "RSS_DELTA_MB": pl.Float64, "PEAK_MB": pl.Float64, "ROWS": pl.Int64, "OUTPUT": pl.String,
+        "COLLECTS": pl.Int64, "COLLECT_S": pl.Float64,
+    }
+    return pl.DataFrame(rows, schema=schema).sort("WALL_S", descending=True)
+
+
+def plans(trace, cell=None):
+    """Query plans of the polars collections of a trace (of one cell if given), in run order."""
+    return [
+        plan
+        for event in trace["traceEvents"]
+        if event["cat"] == "polars" and (cell is None or event["args"]["cell"] == cell)
+        for plan in event["args"]["plans"]
+    ]
+
+
+def dumps(trace):
+    """A trace as JSON text (values JSON does not know, such as dates, as strings)."""
+    return json.dumps(trace, default=str)
+
+
+def write(trace, path):
+    """Write a trace to path as JSON, creating its directory."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(dumps(trace))
+    return path
+
+
+def profile(notebook=NOTEBOOK, out=TRACE_FILE, python=sys.executable):
+    """Trace a run of the notebook in a fresh process and return the trace.
+
+    A fresh process times the notebook as a report run sees it (nothing cached in memory)
+    and lets a running notebook profile itself.
+    """
+    subprocess.run([python, "-m", "rockbreaking.instrument", notebook, "-o", out], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True)
+    with open(out) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("notebook", nargs="?", default=NOTEBOOK)
+    parser.add_argument("-o", "--out", default="trace.json", help="Chrome trace file (default %(default)s)")
+    parser.add_argument("--top", type=int, default=None, help="cells printed, slowest first (default: all)")
+    args = parser.parse_args(argv)
+
+    from . import report
+
+    module = report.load_notebook(args.notebook)
+    # What the notebook cells print is of no use here
+    with contextlib.redirect_stdout(io.StringIO()):
+        trace, _ = run(module.app, __file__=module.__file__)
+    write(trace, args.out)
+    df = summary(trace)
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, fmt_str_lengths=LABEL_LENGTH, tbl_width_chars=200):
+        print(df.head(args.top) if args.top else df)
+    print(f"{args.out}: {df['WALL_S'].sum():.2f} s in {len(df)} cells")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
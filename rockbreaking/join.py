@@ -0,0 +1,46 @@
+"""Matching rockbreaking events to the truck tips that caused them.
+
+Every event of every area is matched to the last tip in the same area before it started,
+in a single as-of join grouped by AREA. Tips older than the tolerance are not matched at
+all, so a quiet night does not blame the last truck of the previous shift for an event.
+"""
+import polars as pl
+
+# Longest time between a tip and an event for the tip to be blamed for the event (the
+# longest gaps between tips in the shipped data are 3h14m at A and 3h07m at B, so every
+# shipped event is matched; events after a longer stop are left unmatched, see unmatched)
+TIP_TOLERANCE = "4h"
+
+
+def tip_columns(tips, events, keep=("AREA",)):
+    """Drop the columns of tips that events already has, except the keys in keep."""
+    return tips.drop([col for col in tips.columns if col in events.columns and col not in keep])
+
+
+def attach_last_tip(events, tips, tolerance=TIP_TOLERANCE):
+    """Add the columns of the last tip before each event in the same area.
+
+    events and tips must both be sorted by time (EVENT_START, TIP_DATETIME) and carry an
+    AREA column. Events with no tip within the tolerance get nulls in the tip columns.
+    tolerance is a polars duration string such as "90m" or None for no limit. Columns found
+    in both frames other than AREA (such as the shift keys) keep the value of the event.
+    """
+    return events.join_asof(
+        tip_columns(tips, events),
+        left_on="EVENT_START",
+        right_on="TIP_DATETIME",
+        by="AREA",
+        strategy="backward",
+        tolerance=tolerance,
+        # Both sides come sorted from the cache; polars cannot verify it per AREA group
+        check_sortedness=False,
+    )
+
+
+def unmatched(joined):
+    """Events of a joined frame with no tip within the tolerance (null tip columns).
+
+    They count as events and downtime everywhere, but have no truck, zone, mass or rocky
+    ratio, so the per-zone and mass figures leave them out.
+    """
+    return joined.filter(pl.col("TIP_DATETIME").is_null())
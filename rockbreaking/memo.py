@@ -0,0 +1,181 @@
+"""Memoisation of expensive notebook steps, keyed by the content of their inputs.
+
+marimo re-runs every cell downstream of a cell that ran, even when the values it passes
+on have not changed (a cosmetic edit, a widget moved back to where it was). Wrapping the
+expensive calls in a Memo returns the previous result instead of recomputing it:
+
+    memo = Memo(cache_dir=".rb_cache/memo")
+    df_all = memo(join.attach_last_tip, df_rb, data_tips, "4h")
+
+The key of a call is a hash of the function, the content of its arguments (frames are
+hashed row by row with hash_rows, which costs a few milliseconds per million rows) and the
+source of the rockbreaking package, so editing the pipeline invalidates the results it
+produced. Results are kept in memory in least recently used order within max_bytes and,
+with a cache_dir, pickled to disk within disk_bytes so that they survive a restart.
+"""
+import collections
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+
+import polars as pl
+
+# Memory budget of the results kept in memory (bytes)
+MAX_BYTES = 512 * 1024 ** 2
+
+# Budget of the results kept on disk (bytes)
+DISK_BYTES = 2 * 1024 ** 3
+
+
+def _package_version():
+    # Hash of the source of this package and the polars version the results were computed with
+    h = hashlib.blake2b(pl.__version__.encode(), digest_size=16)
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith(".py"):
+            with open(os.path.join(package_dir, name), "rb") as f:
+                h.update(name.encode() + f.read())
+    return h.digest()
+
+
+_PACKAGE_VERSION = _package_version()
+
+
+def _feed(h, obj):
+    # Add the content of obj to the hash h
+    if isinstance(obj, pl.DataFrame):
+        h.update(b"DataFrame" + repr(obj.schema).encode() + str(obj.height).encode())
+        if obj.width:
+            h.update(obj.hash_rows(seed=0).to_numpy().tobytes())
+    elif isinstance(obj, pl.Series):
+        h.update(b"Series" + obj.name.encode())
+        _feed(h, obj.to_frame())
+    elif isinstance(obj, pl.LazyFrame):
+        raise TypeError("LazyFrame arguments cannot be fingerprinted; collect them first")
+    elif isinstance(obj, dict):
+        h.update(b"dict%d" % len(obj))
+        for key in sorted(obj, key=repr):
+            _feed(h, key)
+            _feed(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(type(obj).__name__.encode() + b"%d" % len(obj))
+        for item in obj:
+            _feed(h, item)
+    elif inspect.ismethod(obj):
+        # A bound method depends on its instance too (Model.frame on the schema of the model)
+        h.update(b"method")
+        _feed(h, obj.__self__)
+        _feed(h, obj.__func__)
+    elif callable(obj) and hasattr(obj, "__code__"):
+        h.update(f"{obj.__module__}.{obj.__qualname__}".encode() + obj.__code__.co_code)
+        _feed(h, [const for const in obj.__code__.co_consts if not hasattr(const, "co_code")])
+    else:
+        h.update(type(obj).__name__.encode() + repr(obj).encode())
+
+
+def fingerprint(*objs):
+    """Hex digest of the content of objs: frames, series, containers and plain values."""
+    h = hashlib.blake2b(_PACKAGE_VERSION, digest_size=20)
+    for obj in objs:
+        _feed(h, obj)
+    return h.hexdigest()
+
+
+def size_of(value):
+    """Approximate memory taken by a result (bytes)."""
+    if isinstance(value, (pl.DataFrame, pl.Series)):
+        return value.estimated_size()
+    if isinstance(value, dict):
+        return sum(size_of(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(size_of(item) for item in value)
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class Memo:
+    """Results of function calls keyed by fingerprint, kept in memory (LRU) and on disk."""
+
+    def __init__(self, max_bytes=MAX_BYTES, cache_dir=None, disk_bytes=DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_bytes = disk_bytes
+        self._results = collections.OrderedDict()
+        self._sizes = {}
+        self.stats = collections.Counter()
+
+    @property
+    def nbytes(self):
+        """Memory taken by the results kept in memory (bytes)."""
+        return sum(self._sizes.values())
+
+    def __call__(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs), or its result from a previous call with the same inputs."""
+        key = fingerprint(fn, args, kwargs)
+        if key in self._results:
+            self._results.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._results[key]
+        found, value = self._load(key)
+        if found:
+            self.stats["disk_hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            value = fn(*args, **kwargs)
+            self._store(key, value)
+        self._keep(key, value)
+        return value
+
+    def clear(self):
+        """Forget the results kept in memory (the disk copies stay)."""
+        self._results.clear()
+        self._sizes.clear()
+
+    def _keep(self, key, value):
+        # Keep value in memory, evicting the least recently used results over budget
+        size = size_of(value)
+        if size > self.max_bytes:
+            return
+        self._results[key] = value
+        self._sizes[key] = size
+        while self.nbytes > self.max_bytes:
+            old, _ = self._results.popitem(last=False)
+            del self._sizes[old]
+            self.stats["evictions"] += 1
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return False, None
+        try:
+            with open(self._path(key), "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False, None
+        # Mark as recently used for the disk eviction
+        os.utime(self._path(key))
+        return True, value
+
+    def _store(self, key, value):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+        self._trim_disk()
+
+    def _trim_disk(self):
+        # Remove the least recently used files over the disk budget
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".pkl")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.disk_bytes:
+                break
+            total -= entry.stat().st_size
+            os.remove(entry.path)
@@ -0,0 +1,245 @@
+"""Prediction of the grizzly rockbreaking downtime from the material fed to the crushers.
+
+The tips and events of every area are rolled up into one row per area and time bucket
+(an hour by default), with the downtime of the grizzly events started in the bucket as the
+target and, as features, only what is known when the bucket starts or planned for it:
+
+* TIPS, MASS: number of tips and tonnes tipped in the bucket
+* RR_MEAN, RR_MAX: mass-weighted mean and maximum rocky ratio of the material tipped
+* ZONE_<zone>: share of the tonnes tipped coming from each zone (the zone mix)
+* MASS_<n>, EVENTS_<n>, DOWNTIME_<n>: tonnes tipped, grizzly events and downtime in the
+  previous n buckets, for n in windows
+* HOUR, SHIFT: hour of the day and shift of the roster
+* AREA_<label>: one column per area of areas.TIP_FILES
+
+Every feature is a polars expression over the whole history (rolling sums are differences
+of cumulative sums), so a year of events is rolled up in well under a second. Training is
+a grid search over a few regressors, scored with time-series cross-validation (each fold
+is validated on buckets after the ones it was fitted on) and run in parallel with n_jobs.
+
+The fitted Model keeps its feature schema (feature names and order, zones, bucket size,
+windows and roster) and builds the features of new data with it, so a model trained on
+one set of zones still predicts once new zones are mined. Retraining nightly:
+
+    python -m rockbreaking.model --days 365 -j 8 -o models/downtime.joblib
+"""
+import argparse
+import dataclasses
+import datetime as dt
+import os
+import time
+
+import polars as pl
+
+from . import areas, shifts, startup
+
+# scikit-learn is imported by the functions that fit models: finding the spec of a
+# submodule imports the sklearn package itself, so lazy_import would not defer it
+joblib = startup.lazy_import("joblib")
+
+# Size of the time buckets the downtime is predicted for
+EVERY = "1h"
+
+# Look-back windows (in buckets) of the rolling features
+WINDOWS = (1, 4, 12)
+
+# Folds of the time-series cross-validation
+N_SPLITS = 5
+
+# Name of the target column
+TARGET = "DOWNTIME"
+
+
+def zones_of(tips):
+    """Zones of a tip frame, in the order of their feature columns."""
+    return tuple(sorted(tips["ORIGIN"].drop_nulls().cast(pl.String).unique()))
+
+
+def _rolling(col, n):
+    # Sum of col over the n buckets before the current one, per area (rows sorted by AREA, BUCKET)
+    total = pl.col(col).cum_sum().over("AREA")
+    return (total.shift(1).over("AREA") - total.shift(n + 1).over("AREA").fill_null(0)).fill_null(0)
+
+
+def features(events, tips, zones=None, every=EVERY, windows=WINDOWS, roster=shifts.DEFAULT_ROSTER):
+    """One row per AREA and BUCKET with the features and the DOWNTIME target.
+
+    events are rockbreaking events (df_rb or the joined df_all) and tips the tips of the
+    same period, both with an AREA column. Every bucket between the first and last tip or
+    event of an area gets a row, empty buckets included. Rows are sorted by BUCKET then
+    AREA, the order the cross-validation folds are cut in.
+    """
+    zones = zones_of(tips) if zones is None else tuple(zones)
+    area = pl.col("AREA").cast(pl.String)
+    mass = pl.col("MASS")
+    rated = pl.col("ROCKY_RATIO").is_not_null()
+
+    fed = tips.group_by(area, pl.col("TIP_DATETIME").dt.truncate(every).alias("BUCKET")).agg(
+        pl.len().alias("TIPS"),
+        mass.sum(),
+        ((pl.col("ROCKY_RATIO") * mass).sum() / mass.filter(rated).sum()).alias("RR_MEAN"),
+        pl.col("ROCKY_RATIO").max().alias("RR_MAX"),
+        *[
+            (mass.filter(pl.col("ORIGIN").cast(pl.String) == zone).sum() / mass.sum()).alias(f"ZONE_{zone}")
+            for zone in zones
+        ],
+    )
+    broken = events.filter(pl.col("LOCATION") == "Grizzly").group_by(
+        area, pl.col("EVENT_START").dt.truncate(every).alias("BUCKET")
+    ).agg(
+        pl.len().alias("EVENTS"),
+        pl.col("LENGTH").sum().alias(TARGET),
+    )
+
+    # Every bucket of every area, so that rolling sums count empty buckets
+    keys = pl.concat([fed.select("AREA", "BUCKET"), broken.select("AREA", "BUCKET")])
+    grid = keys.group_by("AREA").agg(
+        pl.datetime_range(pl.col("BUCKET").min(), pl.col("BUCKET").max(), every).alias("BUCKET")
+    ).explode("BUCKET")
+
+    frame = (
+        grid.join(fed, on=["AREA", "BUCKET"], how="left")
+        .join(broken, on=["AREA", "BUCKET"], how="left")
+        .with_columns(pl.exclude("AREA", "BUCKET").fill_null(0))
+        .sort("AREA", "BUCKET")
+    )
+    frame = frame.with_columns(
+        *[_rolling("MASS", n).alias(f"MASS_{n}") for n in windows],
+        *[_rolling("EVENTS", n).alias(f"EVENTS_{n}") for n in windows],
+        *[_rolling(TARGET, n).alias(f"{TARGET}_{n}") for n in windows],
+        pl.col("BUCKET").dt.hour().alias("HOUR"),
+        shifts.shift_keys("BUCKET", roster)[1],
+        *[(pl.col("AREA") == name).cast(pl.Int8).alias(f"AREA_{areas.area_label(name)}") for name in areas.TIP_FILES],
+    )
+    return frame.drop("EVENTS").sort("BUCKET", "AREA")
+
+
+def feature_names(frame):
+    """Feature columns of a features() frame, in order."""
+    return tuple(col for col in frame.columns if col not in ("AREA", "BUCKET", TARGET))
+
+
+def candidates():
+    """Regressors and hyper-parameters tried by train, as a GridSearchCV param_grid."""
+    from sklearn import ensemble, linear_model
+
+    return [
+        {"model": [linear_model.LinearRegression()]},
+        {
+            # Histogram-based boosting fits a year of hourly buckets in under a second on one
+            # CPU, where a random forest of the same accuracy takes tens of seconds
+            "model": [ensemble.HistGradientBoostingRegressor(random_state=0)],
+            "model__learning_rate": [0.05, 0.1],
+            "model__max_leaf_nodes": [15, 31],
+        },
+    ]
+
+
+@dataclasses.dataclass(frozen=True)
+class Model:
+    """Fitted downtime model and the schema of the features it was fitted on."""
+    estimator: object
+    features: tuple
+    zones: tuple
+    every: str = EVERY
+    windows: tuple = WINDOWS
+    roster: shifts.Roster = shifts.DEFAULT_ROSTER
+    params: dict = dataclasses.field(default_factory=dict)
+    cv_rmse: float = None
+    trained_on: tuple = None
+
+    def frame(self, events, tips):
+        """Feature frame of new events and tips, with the schema the model was fitted on."""
+        return features(events, tips, self.zones, self.every, self.windows, self.roster)
+
+    def predict(self, frame):
+        """AREA, BUCKET and PREDICTED downtime for a frame built by Model.frame."""
+        missing = [col for col in self.features if col not in frame.columns]
+        if missing:
+            raise ValueError(f"feature frame lacks the columns {missing} the model was fitted on")
+        predicted = self.estimator.predict(frame.select(self.features).to_numpy())
+        return frame.select("AREA", "BUCKET").with_columns(
+            pl.Series("PREDICTED", predicted).clip(lower_bound=0)
+        )
+
+
+def train(events, tips, every=EVERY, windows=WINDOWS, roster=shifts.DEFAULT_ROSTER, n_splits=N_SPLITS,
+          n_jobs=-1, param_grid=None):
+    """Fit the best candidate regressor to the downtime of events and tips.
+
+    Candidates (default candidates()) are compared on the RMSE of a time-series
+    cross-validation with n_splits folds, fitted in n_jobs processes (-1 for one per
+    CPU), and the best one is refitted on all buckets. LENGTH must be in minutes, as in
+    the notebook (RB_DATA.csv records seconds), the unit the model then predicts in.
+    """
+    from sklearn import linear_model, model_selection, pipeline
+
+    frame = features(events, tips, None, every, windows, roster)
+    names = feature_names(frame)
+    search = model_selection.GridSearchCV(
+        pipeline.Pipeline([("model", linear_model.LinearRegression())]),
+        candidates() if param_grid is None else param_grid,
+        scoring="neg_root_mean_squared_error",
+        cv=model_selection.TimeSeriesSplit(n_splits=n_splits),
+        n_jobs=n_jobs,
+    )
+    search.fit(frame.select(names).to_numpy(), frame[TARGET].to_numpy())
+    return Model(
+        estimator=search.best_estimator_,
+        features=names,
+        zones=zones_of(tips),
+        every=every,
+        windows=tuple(windows),
+        roster=roster,
+        params={key: repr(value) for key, value in search.best_params_.items()},
+        cv_rmse=-search.best_score_,
+        trained_on=(frame["BUCKET"].min(), frame["BUCKET"].max()),
+    )
+
+
+def save(model, path):
+    """Write a fitted Model to path (joblib), creating its directory."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    joblib.dump(model, path)
+    return path
+
+
+def load(path):
+    """Read a Model written by save."""
+    return joblib.load(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="directory of the CSV files (default: the repository)")
+    parser.add_argument("--days", type=int, default=365, help="days of history to train on (default %(default)s)")
+    parser.add_argument("--roster", choices=shifts.ROSTERS, default=shifts.DEFAULT_ROSTER.name,
+                        help="shift roster of the site (default %(default)s)")
+    parser.add_argument("--every", default=EVERY, help="size of the predicted buckets (default %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=-1, help="worker processes (default: one per CPU)")
+    parser.add_argument("-o", "--out", default=os.path.join("models", "downtime.joblib"),
+                        help="model file to write (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    tips, events = areas.load(args.data)
+    # Minutes, as the notebook trains and applies the model on (df_rb)
+    events = events.with_columns(pl.col("LENGTH") / 60)
+    end_time = max(tips["TIP_DATETIME"].max(), events["EVENT_START"].max())
+    start_time = end_time - dt.timedelta(days=args.days)
+    tips = tips.filter(pl.col("TIP_DATETIME") >= start_time)
+    events = events.filter(pl.col("EVENT_START") >= start_time)
+
+    fitted = train(events, tips, every=args.every, roster=shifts.ROSTERS[args.roster], n_jobs=args.jobs)
+    save(fitted, args.out)
+    print(f"{args.out}: {fitted.params['model']} on {fitted.trained_on[0]:%Y-%m-%d %H:%M} to "
+          f"{fitted.trained_on[1]:%Y-%m-%d %H:%M}, CV RMSE {fitted.cv_rmse:.1f} "
+          f"({time.perf_counter() - started:.1f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    # Run from the package module, so that the pickled Model refers to rockbreaking.model, not __main__
+    from rockbreaking.model import main
+    raise SystemExit(main())
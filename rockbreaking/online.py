@@ -0,0 +1,298 @@
+"""Live risk of a grizzly rockbreak at each crusher, updated as trucks tip.
+
+The control room scores every tip as it arrives, so nothing here builds polars frames on
+the hot path. Each area keeps a small rolling state, updated in O(1) per row (amortised:
+expired rows are popped once):
+
+* the last k tips, with running sums of their tonnes, rocky ratio times tonnes and tonnes
+  of high rocky ratio material;
+* the start times of the Grizzly and Crusher events of the last window minutes.
+
+The score is the probability of a grizzly event starting within the next horizon minutes,
+from a logistic regression on the features of that state:
+
+* MASS_K, RR_MEAN_K, HIGH_RR_SHARE_K: tonnes, mass-weighted rocky ratio and share of the
+  tonnes with a ratio of at least HIGH_RR of the last k tips
+* RR_LAST, MINUTES_SINCE_TIP: rocky ratio and age of the last tip
+* GRIZZLY_RECENT, CRUSHER_RECENT: events started in the last window minutes per location
+* MINUTES_SINCE_GRIZZLY: age of the last grizzly event (window when there is none)
+
+fit replays the history through the same state to collect the features, so they are
+identical at training and scoring time, and keeps plain coefficients per area: scoring is
+a dot product and an exp, a few microseconds. Replaying the CSVs as a stream, with the
+model fitted on the first 80% of the history and its Brier score taken on the rest:
+
+    python -m rockbreaking.online --horizon 30 --holdout 0.2
+"""
+import argparse
+import collections
+import dataclasses
+import datetime as dt
+import math
+import os
+import statistics
+import time
+
+import polars as pl
+
+from . import areas
+
+# Number of recent tips the state keeps per area
+K = 10
+
+# Minutes of recent events the state keeps per area
+WINDOW = 60
+
+# Minutes ahead the probability of a grizzly event is given for
+HORIZON = 30
+
+# Rocky ratio from which material counts as high rocky ratio
+HIGH_RR = 3.0
+
+# Latest share of the history (by time) left out of the fit and used to score the model
+HOLDOUT = 0.2
+
+FEATURES = (
+    "MASS_K", "RR_MEAN_K", "HIGH_RR_SHARE_K", "RR_LAST", "MINUTES_SINCE_TIP",
+    "GRIZZLY_RECENT", "CRUSHER_RECENT", "MINUTES_SINCE_GRIZZLY",
+)
+
+
+class AreaState:
+    """Rolling feature state of one area."""
+
+    __slots__ = ("k", "window", "tips", "mass", "rr_mass", "rated_mass", "high_mass", "events", "last_grizzly")
+
+    def __init__(self, k=K, window=WINDOW):
+        self.k = k
+        self.window = window
+        self.tips = collections.deque()
+        self.mass = self.rr_mass = self.rated_mass = self.high_mass = 0.0
+        self.events = {"Grizzly": collections.deque(), "Crusher": collections.deque()}
+        self.last_grizzly = None
+
+    def add_tip(self, when, mass, rocky_ratio):
+        """Add a tip, dropping the oldest one beyond the last k."""
+        tip = (when, mass, rocky_ratio)
+        self.tips.append(tip)
+        self._count(tip, 1)
+        if len(self.tips) > self.k:
+            self._count(self.tips.popleft(), -1)
+
+    def _count(self, tip, sign):
+        _, mass, rocky_ratio = tip
+        self.mass += sign * mass
+        if rocky_ratio is not None:
+            self.rated_mass += sign * mass
+            self.rr_mass += sign * rocky_ratio * mass
+            if rocky_ratio >= HIGH_RR:
+                self.high_mass += sign * mass
+
+    def add_event(self, location, start):
+        """Add a rockbreaking event of location (Grizzly or Crusher) started at start."""
+        recent = self.events.get(location)
+        if recent is None:
+            return
+        recent.append(start)
+        if location == "Grizzly":
+            self.last_grizzly = start
+
+    def features(self, now):
+        """Feature values at time now, in FEATURES order."""
+        keep = self.window * 60
+        for recent in self.events.values():
+            while recent and (now - recent[0]).total_seconds() > keep:
+                recent.popleft()
+        last = self.tips[-1] if self.tips else None
+        since_tip = (now - last[0]).total_seconds() / 60 if last else self.window
+        since_grizzly = (now - self.last_grizzly).total_seconds() / 60 if self.last_grizzly else self.window
+        return (
+            self.mass,
+            self.rr_mass / self.rated_mass if self.rated_mass > 0 else 0.0,
+            self.high_mass / self.mass if self.mass > 0 else 0.0,
+            last[2] if last and last[2] is not None else 0.0,
+            min(since_tip, self.window),
+            len(self.events["Grizzly"]),
+            len(self.events["Crusher"]),
+            min(since_grizzly, self.window),
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class RiskModel:
+    """Logistic coefficients per area: {area: (intercept, weights in FEATURES order)}."""
+    coefficients: dict
+    k: int = K
+    window: int = WINDOW
+    horizon: int = HORIZON
+    features: tuple = FEATURES
+
+    def probability(self, area, values):
+        """Probability of a grizzly event within the horizon for the feature values of an area."""
+        try:
+            intercept, weights = self.coefficients[area]
+        except KeyError:
+            raise ValueError(f"no risk model for area {area!r}") from None
+        z = intercept + sum(w * x for w, x in zip(weights, values))
+        # Written both ways round so that exp never overflows
+        if z >= 0:
+            return 1 / (1 + math.exp(-z))
+        e = math.exp(z)
+        return e / (1 + e)
+
+
+class Scorer:
+    """Live scores per area, fed one tip or event row at a time."""
+
+    def __init__(self, risk_model):
+        self.model = risk_model
+        self.states = collections.defaultdict(lambda: AreaState(risk_model.k, risk_model.window))
+
+    def tip(self, area, when, mass, rocky_ratio):
+        """Record a tip and return the new score of its area."""
+        state = self.states[area]
+        state.add_tip(when, mass, rocky_ratio)
+        return self.model.probability(area, state.features(when))
+
+    def event(self, area, location, start):
+        """Record the start of a rockbreaking event."""
+        self.states[area].add_event(location, start)
+
+    def score(self, area, now):
+        """Probability of a grizzly event in the area within the horizon after now."""
+        return self.model.probability(area, self.states[area].features(now))
+
+
+def stream(tips, events):
+    """Tips and events of all areas as one time-ordered frame, as they would arrive live.
+
+    Columns: TIME, KIND ("tip" or "event"), AREA, MASS, ROCKY_RATIO, LOCATION. An event
+    arrives when it starts; at equal times events come before tips.
+    """
+    area = pl.col("AREA").cast(pl.String)
+    return pl.concat([
+        events.select(
+            pl.col("EVENT_START").alias("TIME"), pl.lit("event").alias("KIND"), area,
+            pl.lit(None, pl.Float64).alias("MASS"), pl.lit(None, pl.Float64).alias("ROCKY_RATIO"),
+            pl.col("LOCATION").cast(pl.String),
+        ),
+        tips.select(
+            pl.col("TIP_DATETIME").alias("TIME"), pl.lit("tip").alias("KIND"), area,
+            pl.col("MASS"), pl.col("ROCKY_RATIO"), pl.lit(None, pl.String).alias("LOCATION"),
+        ),
+    ]).sort("TIME", maintain_order=True)
+
+
+def replay_features(rows, k=K, window=WINDOW):
+    """Feature values at every tip of a stream, computed with the online state.
+
+    Returns a frame with TIME, AREA and one column per feature, one row per tip.
+    """
+    states = collections.defaultdict(lambda: AreaState(k, window))
+    out = []
+    for when, kind, area, mass, rocky_ratio, location in rows.iter_rows():
+        state = states[area]
+        if kind == "tip":
+            state.add_tip(when, mass, rocky_ratio)
+            out.append((when, area, *state.features(when)))
+        else:
+            state.add_event(location, when)
+    return pl.DataFrame(out, schema=["TIME", "AREA", *FEATURES], orient="row")
+
+
+def labels(at, events, horizon=HORIZON):
+    """Whether a grizzly event of the same area starts within horizon minutes after each row of at."""
+    grizzly = events.filter(pl.col("LOCATION") == "Grizzly").select(
+        pl.col("AREA").cast(pl.String), pl.col("EVENT_START").alias("NEXT_EVENT")
+    ).sort("NEXT_EVENT")
+    # Strictly after the tip: events at the same time are already in the features
+    return at.with_columns(pl.col("TIME") + pl.duration(microseconds=1)).join_asof(
+        grizzly, left_on="TIME", right_on="NEXT_EVENT", by="AREA", strategy="forward",
+        check_sortedness=False,
+    ).select(
+        (pl.col("NEXT_EVENT") - pl.col("TIME") < pl.duration(minutes=horizon)).fill_null(False).alias("LABEL")
+    ).to_series()
+
+
+def fit(tips, events, k=K, window=WINDOW, horizon=HORIZON):
+    """Fit a RiskModel per area to the history of tips and events."""
+    from sklearn import linear_model, pipeline, preprocessing
+
+    observed = replay_features(stream(tips, events), k, window)
+    observed = observed.with_columns(labels(observed, events, horizon))
+    coefficients = {}
+    for area, df in areas.partition(observed).items():
+        x, y = df.select(FEATURES).to_numpy(), df["LABEL"].to_numpy()
+        if y.all() or not y.any():
+            # One class only: a constant probability
+            rate = min(max(y.mean(), 1e-6), 1 - 1e-6)
+            coefficients[area] = (math.log(rate / (1 - rate)), (0.0,) * len(FEATURES))
+            continue
+        fitted = pipeline.make_pipeline(preprocessing.StandardScaler(), linear_model.LogisticRegression()).fit(x, y)
+        scaler, logistic = fitted[0], fitted[1]
+        # Standardisation folded into the coefficients, so that scoring uses the raw features
+        scale = scaler.scale_
+        weights = logistic.coef_[0] / scale
+        intercept = logistic.intercept_[0] - (weights * scaler.mean_).sum()
+        coefficients[area] = (float(intercept), tuple(float(w) for w in weights))
+    return RiskModel(coefficients, k, window, horizon)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="directory of the CSV files (default: the repository)")
+    parser.add_argument("--horizon", type=int, default=HORIZON, help="minutes ahead (default %(default)s)")
+    parser.add_argument("-k", type=int, default=K, help="recent tips kept per area (default %(default)s)")
+    parser.add_argument("--window", type=int, default=WINDOW,
+                        help="minutes of recent events kept per area (default %(default)s)")
+    parser.add_argument("--holdout", type=float, default=HOLDOUT,
+                        help="latest share of the history the model is scored on and not fitted to, "
+                             "0 to score the fit in-sample (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    tips, events = areas.load(args.data)
+    first, last = tips["TIP_DATETIME"].min(), tips["TIP_DATETIME"].max()
+    cutoff = last + dt.timedelta(microseconds=1) if args.holdout <= 0 else first + (last - first) * (1 - args.holdout)
+    risk_model = fit(
+        tips.filter(pl.col("TIP_DATETIME") < cutoff), events.filter(pl.col("EVENT_START") < cutoff),
+        args.k, args.window, args.horizon,
+    )
+
+    # Replay the CSVs row by row, timing every update (the state needs the history before the held-out part)
+    scorer = Scorer(risk_model)
+    latencies, scores = [], []
+    clock = time.perf_counter_ns
+    for when, kind, area, mass, rocky_ratio, location in stream(tips, events).iter_rows():
+        started = clock()
+        if kind == "tip":
+            scores.append((when, area, scorer.tip(area, when, mass, rocky_ratio)))
+        else:
+            scorer.event(area, location, when)
+        latencies.append(clock() - started)
+
+    scored = pl.DataFrame(scores, schema=["TIME", "AREA", "SCORE"], orient="row")
+    scored = scored.with_columns(labels(scored, events, args.horizon).cast(pl.Float64))
+    fitted, held_out = scored.filter(pl.col("TIME") < cutoff), scored.filter(pl.col("TIME") >= cutoff)
+    # Scored on the held-out tips, against the constant rate of the tips the model was fitted on
+    scored_on = fitted if held_out.is_empty() else held_out
+    base = fitted["LABEL"].mean()
+    brier = ((scored_on["SCORE"] - scored_on["LABEL"]) ** 2).mean()
+    brier_base = ((base - scored_on["LABEL"]) ** 2).mean()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{len(latencies)} rows replayed, {len(scores)} tips scored")
+    print(f"latency per row: median {quantiles[49] / 1000:.1f} us, p99 {quantiles[98] / 1000:.1f} us, "
+          f"max {max(latencies) / 1000:.1f} us")
+    if held_out.is_empty():
+        print(f"grizzly event within {args.horizon} min after {base:.1%} of the tips; "
+              f"in-sample Brier score {brier:.3f} (constant rate {brier_base:.3f})")
+    else:
+        print(f"fitted on the {fitted.height} tips before {cutoff:%Y-%m-%d %H:%M}, "
+              f"scored on the {held_out.height} after; grizzly event within {args.horizon} min after "
+              f"{held_out['LABEL'].mean():.1%} of them; held-out Brier score {brier:.3f} "
+              f"(constant rate of the fit {brier_base:.3f})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
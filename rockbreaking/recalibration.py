@@ -0,0 +1,150 @@
+"""Checking the ROCKY_RATIO of each zone against the rockbreaking it actually causes.
+
+The rocky ratio of a zone is meant to say how likely its material is to need rockbreaking,
+1 being rocky and 5 not rocky, so within an area the events per tonne of a zone should
+fall as its ratio goes up. The rate is modelled as log-linear in the ratio:
+
+    E[EVENTS] = TONNES * exp(ALPHA + SLOPE * ROCKY_RATIO)
+
+ALPHA and SLOPE are fitted per area over all its zones (the Poisson maximum likelihood
+estimate, a few Newton steps on the sums per zone), and the ratio each zone would need to
+explain its own events is (log(EVENTS / TONNES) - ALPHA) / SLOPE. The shipped logs give
+a SLOPE below 0; an area whose fit does not (too few zones, or events not falling with
+the ratio) gets no implied ratios. The confidence interval of the implied ratio comes
+from the Poisson interval of the event count (Byar's approximation, accurate to about 1%
+even for a handful of events), its bounds swapped as more events mean a rockier zone.
+The same is done with the downtime (LENGTH) instead of the event count, its interval
+using the variance of a compound Poisson sum (sum of squared event lengths).
+
+Implied ratios are clipped to the scale of the ratio (RR_SCALE): a zone that tipped
+without any event is as little rocky as the scale allows. A zone whose assigned ratio
+falls outside the interval implied by its events is flagged as MISCLASSIFIED. The
+uncertainty of the fit itself (pooled over all the zones of the area) is left out.
+
+Everything but the fit is computed with two group-bys (events and tips) and column
+expressions, so all areas and zones are recalibrated in one pass.
+"""
+import math
+import statistics
+
+import numpy as np
+import polars as pl
+
+# Range of the rocky ratio scale, 1 being rocky and 5 not rocky
+RR_SCALE = (1.0, 5.0)
+
+# Newton steps of the fit, which converges in a handful for any sensible data
+MAX_ITERATIONS = 50
+
+
+def _poisson_interval(count, z):
+    # Byar's approximation of the exact (Garwood) Poisson interval of a count
+    upper_count = count + 1
+    lower = count * (1 - 1 / (9 * count) - z / (3 * count.sqrt())) ** 3
+    upper = upper_count * (1 - 1 / (9 * upper_count) + z / (3 * upper_count.sqrt())) ** 3
+    return pl.when(count > 0).then(lower).otherwise(0.0), upper
+
+
+def fit_rate(rocky_ratio, tonnes, counts):
+    """(ALPHA, SLOPE) of the Poisson fit of log(counts / tonnes) = ALPHA + SLOPE * rocky_ratio.
+
+    The arrays hold one value per zone. counts need not be whole (the downtime is fitted
+    the same way, as a quasi-Poisson sum). Both are NaN when the fit has no solution: no
+    counts, a single rocky ratio, or counts only at one end of the ratios.
+    """
+    rocky_ratio, tonnes, counts = (np.asarray(a, dtype=float) for a in (rocky_ratio, tonnes, counts))
+    if counts.sum() <= 0 or len(np.unique(rocky_ratio)) < 2:
+        return math.nan, math.nan
+    x = np.column_stack([np.ones_like(rocky_ratio), rocky_ratio])
+    beta = np.array([math.log(counts.sum() / tonnes.sum()), 0.0])
+    with np.errstate(over="ignore", under="ignore"):
+        for _ in range(MAX_ITERATIONS):
+            mu = tonnes * np.exp(x @ beta)
+            try:
+                step = np.linalg.solve(x.T @ (mu[:, None] * x), x.T @ (counts - mu))
+            except np.linalg.LinAlgError:
+                break
+            beta += step
+            if not np.isfinite(beta).all():
+                break
+            if np.abs(step).max() < 1e-10:
+                return float(beta[0]), float(beta[1])
+    # Still moving or blown up: the maximum is at an infinite slope
+    return math.nan, math.nan
+
+
+def zone_totals(events, tips, by="AREA"):
+    """Tonnes tipped and rockbreaking caused per group and ORIGIN.
+
+    events are joined events (join.attach_last_tip) and tips the tips of the same period.
+    Returns TONNES, the assigned ROCKY_RATIO, EVENTS, LENGTH and LENGTH_SQ (sum of squared
+    event lengths); zones that tipped but caused no event have EVENTS 0.
+    """
+    tipped = tips.group_by(by, "ORIGIN").agg(
+        pl.col("MASS").sum().alias("TONNES"),
+        pl.col("ROCKY_RATIO").mean(),
+    )
+    caused = events.drop_nulls("ORIGIN").group_by(by, "ORIGIN").agg(
+        pl.len().alias("EVENTS"),
+        pl.col("LENGTH").sum(),
+        (pl.col("LENGTH") ** 2).sum().alias("LENGTH_SQ"),
+    )
+    return tipped.join(caused, on=[by, "ORIGIN"], how="left").with_columns(
+        pl.col("EVENTS").fill_null(0),
+        pl.col("LENGTH", "LENGTH_SQ").fill_null(0.0),
+    ).sort(by, "ORIGIN")
+
+
+def fit(totals, by="AREA"):
+    """ALPHA and SLOPE of the events, and ALPHA_DT and SLOPE_DT of the downtime, per group of zone_totals."""
+    rows = []
+    for (key,), df in totals.drop_nulls("ROCKY_RATIO").partition_by(by, as_dict=True, maintain_order=True).items():
+        rr, tonnes = df["ROCKY_RATIO"].to_numpy(), df["TONNES"].to_numpy()
+        rows.append((key, *fit_rate(rr, tonnes, df["EVENTS"].to_numpy()), *fit_rate(rr, tonnes, df["LENGTH"].to_numpy())))
+    schema = {by: totals.schema[by], "ALPHA": pl.Float64, "SLOPE": pl.Float64, "ALPHA_DT": pl.Float64,
+              "SLOPE_DT": pl.Float64}
+    # NaN (no fit) as null, so that the implied ratios are null too
+    return pl.DataFrame(rows, schema=schema, orient="row").fill_nan(None)
+
+
+def recalibrate(events, tips, by="AREA", confidence=0.95):
+    """Rocky ratio implied by the events and by the downtime of every zone, with intervals.
+
+    Returns the columns of zone_totals and of fit plus, per zone:
+
+    * EVENTS_PER_KT: events per thousand tonnes tipped
+    * RR_EVENTS, RR_EVENTS_LO, RR_EVENTS_HI: ratio implied by the number of events
+    * RR_DOWNTIME, RR_DOWNTIME_LO, RR_DOWNTIME_HI: ratio implied by the downtime (no
+      interval for zones without events, whose event interval is the one to go by)
+    * MISCLASSIFIED: the assigned ROCKY_RATIO is outside [RR_EVENTS_LO, RR_EVENTS_HI]
+
+    The implied ratios are null in groups whose rate does not fall with the ratio.
+    """
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    totals = zone_totals(events, tips, by)
+    totals = totals.join(fit(totals, by), on=by, how="left")
+
+    def implied(count, alpha, slope):
+        # Ratio at which the fitted rate gives count over the tonnes of the zone (count 0 gives +inf)
+        ratio = ((count / pl.col("TONNES")).log() - pl.col(alpha)) / pl.col(slope)
+        return pl.when(pl.col(slope) < 0).then(ratio.clip(*RR_SCALE))
+
+    events_lo, events_hi = _poisson_interval(pl.col("EVENTS").cast(pl.Float64), z)
+    length_sd = pl.col("LENGTH_SQ").sqrt()
+
+    return totals.with_columns(
+        (pl.col("EVENTS") / pl.col("TONNES") * 1000).alias("EVENTS_PER_KT"),
+        implied(pl.col("EVENTS"), "ALPHA", "SLOPE").alias("RR_EVENTS"),
+        # More events than counted mean a rockier zone, a lower ratio
+        implied(events_hi, "ALPHA", "SLOPE").alias("RR_EVENTS_LO"),
+        implied(events_lo, "ALPHA", "SLOPE").alias("RR_EVENTS_HI"),
+        implied(pl.col("LENGTH"), "ALPHA_DT", "SLOPE_DT").alias("RR_DOWNTIME"),
+        pl.when(pl.col("EVENTS") > 0).then(
+            implied(pl.col("LENGTH") + z * length_sd, "ALPHA_DT", "SLOPE_DT")
+        ).alias("RR_DOWNTIME_LO"),
+        pl.when(pl.col("EVENTS") > 0).then(
+            implied((pl.col("LENGTH") - z * length_sd).clip(lower_bound=0), "ALPHA_DT", "SLOPE_DT")
+        ).alias("RR_DOWNTIME_HI"),
+    ).with_columns(
+        (~pl.col("ROCKY_RATIO").is_between(pl.col("RR_EVENTS_LO"), pl.col("RR_EVENTS_HI"))).alias("MISCLASSIFIED")
+    )
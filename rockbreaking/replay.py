@@ -0,0 +1,274 @@
+"""Replay of the tip and event logs as one live feed, for testing real-time consumers.
+
+The tip log of every area (A_DATA.csv, B_DATA.csv) and the shared event log (RB_DATA.csv)
+are each sorted by time, give or take the tips the trucks report late, so they are read
+row by row, put back in order within a bounded lateness, and combined with a k-way merge
+(heapq.merge): memory only holds the rows of the last hour whatever the size of the
+files, and the first rows are out before the files have been read. At equal times events
+come before tips, as in online.stream.
+
+The merged records are released at a speed-up of real time (1000 replays a day in under
+a minute and a half) or as fast as possible, through an async generator:
+
+    async for due, record in replay.replay(replay.records(data_dir), speedup=1000):
+        ...
+
+or through a bounded asyncio.Queue drained by a consumer (run), which measures the
+throughput of the consumer and its lag: how long after its due time every record was
+handled. A consumer that keeps up is about a millisecond behind (the resolution of the
+event loop timer); one that does not falls further behind with every record:
+
+    python -m rockbreaking.replay --speedup 1000
+    python -m rockbreaking.replay --speedup 0 --consumer none     # raw merge throughput
+"""
+import argparse
+import asyncio
+import csv
+import dataclasses
+import datetime as dt
+import heapq
+import inspect
+import os
+import random
+import statistics
+import time
+import typing
+
+from . import areas
+
+# Speed-up of real time the records are released at
+SPEEDUP = 1000.0
+
+# Records waiting in the queue before the replay waits for the consumer
+QUEUE_SIZE = 10000
+
+# Most a log is out of order by: the tip logs are written by the trucks, which report
+# some tips late (up to 53 minutes in the shipped logs)
+LATENESS = dt.timedelta(hours=1)
+
+# Order of the kinds of record at equal times
+KIND_ORDER = {"event": 0, "tip": 1}
+
+# Lags kept for the quantiles: a uniform sample of the records however long the replay
+LAG_SAMPLE = 10000
+
+
+class Record(typing.NamedTuple):
+    """One row of a feed: its time, kind ("tip" or "event"), area and typed columns."""
+    time: dt.datetime
+    kind: str
+    area: str
+    data: dict
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+def read_tips(path, area):
+    """Records of a tip log, read row by row."""
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield Record(dt.datetime.fromisoformat(row["TIP_DATETIME"]), "tip", area, {
+                "ORIGIN": row["ORIGIN"],
+                "MASS": _float(row["MASS"]),
+                "TRUCK_ID": row["TRUCK_ID"],
+                "ROCKY_RATIO": _float(row["ROCKY_RATIO"]),
+            })
+
+
+def read_events(path):
+    """Records of the event log, read row by row (timed by EVENT_START)."""
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            start = dt.datetime.fromisoformat(row["EVENT_START"])
+            yield Record(start, "event", row["AREA"], {
+                "LOCATION": row["LOCATION"],
+                "EVENT_START": start,
+                "EVENT_END": dt.datetime.fromisoformat(row["EVENT_END"]),
+                "LENGTH": _float(row["LENGTH"]),
+            })
+
+
+def _order(record):
+    return record.time, KIND_ORDER[record.kind]
+
+
+def _sorted(source, name, lateness):
+    # Records of one source in time order: rows up to lateness behind the latest one read
+    # are held back in a heap and released once no earlier row can come any more
+    held = []
+    latest = None
+    for seq, record in enumerate(source):
+        if latest is None or record.time > latest:
+            latest = record.time
+        elif latest - record.time > lateness:
+            raise ValueError(f"{name} is out of order by more than {lateness}: {record.time} after {latest}")
+        heapq.heappush(held, (record.time, seq, record))
+        while held and latest - held[0][0] > lateness:
+            yield heapq.heappop(held)[2]
+    while held:
+        yield heapq.heappop(held)[2]
+
+
+def merge(sources, lateness=LATENESS):
+    """Time-ordered k-way merge of nearly sorted record iterators, given as {name: iterator}.
+
+    Each source may be out of order by at most lateness (a timedelta); rows later than
+    that raise ValueError.
+    """
+    return heapq.merge(*(_sorted(source, name, lateness) for name, source in sources.items()), key=_order)
+
+
+def records(data_dir, tip_files=None, event_file=areas.EVENT_FILE, lateness=LATENESS):
+    """Merged records of the tip logs of all areas and the event log in data_dir."""
+    tip_files = areas.TIP_FILES if tip_files is None else tip_files
+    sources = {name: read_tips(os.path.join(data_dir, name), area) for area, name in tip_files.items()}
+    sources[event_file] = read_events(os.path.join(data_dir, event_file))
+    return merge(sources, lateness)
+
+
+async def replay(source, speedup=SPEEDUP, clock=time.perf_counter):
+    """Yield (due, record) for every record of source once its time has come.
+
+    due is the clock time the record is due at: the first record is due straight away
+    and every later one (time - first time) / speedup seconds after it. With a speedup of
+    None or 0, records are due as soon as they are read.
+    """
+    started = first = None
+    for record in source:
+        now = clock()
+        if started is None:
+            started, first = now, record.time
+        due = started + (record.time - first).total_seconds() / speedup if speedup else now
+        # Hand over to the consumer even when behind schedule, as a live feed would
+        await asyncio.sleep(max(due - now, 0))
+        yield due, record
+
+
+@dataclasses.dataclass
+class ReplayStats:
+    """Throughput and lag of a consumer over a replay.
+
+    The number of records and the largest lag are exact; the lag quantiles come from a
+    uniform sample of at most LAG_SAMPLE lags (reservoir sampling), so memory stays the
+    same however long the replay runs.
+    """
+    records: int = 0
+    elapsed: float = 0.0
+    simulated: float = 0.0
+    max_queue: int = 0
+    lag_max: float = 0.0
+    lags: list = dataclasses.field(default_factory=list)
+    sample_size: int = LAG_SAMPLE
+    rng: random.Random = dataclasses.field(default_factory=lambda: random.Random(0), repr=False)
+
+    def add_lag(self, lag):
+        """Count a record handled lag seconds after its due time."""
+        self.records += 1
+        self.lag_max = max(self.lag_max, lag)
+        if len(self.lags) < self.sample_size:
+            self.lags.append(lag)
+        else:
+            # Replaces a sampled lag with probability sample_size / records
+            i = self.rng.randrange(self.records)
+            if i < self.sample_size:
+                self.lags[i] = lag
+
+    @property
+    def throughput(self):
+        """Records handled per second."""
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        """Plain dict of the statistics, lags in milliseconds."""
+        lags = sorted(self.lags) or [0.0]
+        quantiles = statistics.quantiles(lags, n=100) if len(lags) > 1 else lags * 99
+        # The sample can miss the largest lag, which is kept exactly
+        return {
+            "records": self.records,
+            "elapsed_s": self.elapsed,
+            "throughput_per_s": self.throughput,
+            "speedup_achieved": self.simulated / self.elapsed if self.elapsed else 0.0,
+            "lag_p50_ms": quantiles[49] * 1000,
+            "lag_p99_ms": quantiles[98] * 1000,
+            "lag_max_ms": self.lag_max * 1000,
+            "max_queue": self.max_queue,
+        }
+
+
+async def run(consumer, source, speedup=SPEEDUP, queue_size=QUEUE_SIZE, clock=time.perf_counter):
+    """Replay source into a queue drained by consumer(record); returns ReplayStats.
+
+    consumer can be a plain function or a coroutine function. The lag of a record is the
+    time from its due time until the consumer has handled it.
+    """
+    queue = asyncio.Queue(queue_size)
+    stats = ReplayStats()
+    is_async = inspect.iscoroutinefunction(consumer)
+    done = object()
+
+    async def produce():
+        async for item in replay(source, speedup, clock):
+            await queue.put(item)
+            stats.max_queue = max(stats.max_queue, queue.qsize())
+        await queue.put(done)
+
+    async def consume():
+        first = last = None
+        while (item := await queue.get()) is not done:
+            due, record = item
+            if is_async:
+                await consumer(record)
+            else:
+                consumer(record)
+            stats.add_lag(clock() - due)
+            first = record.time if first is None else first
+            last = record.time
+        if first is not None:
+            stats.simulated = (last - first).total_seconds()
+
+    started = clock()
+    await asyncio.gather(produce(), consume())
+    stats.elapsed = clock() - started
+    return stats
+
+
+def _scorer(data_dir):
+    # Online risk scorer fitted to the data, fed from the records
+    from . import online
+
+    tips, events = areas.load(data_dir)
+    scorer = online.Scorer(online.fit(tips, events))
+
+    def consume(record):
+        if record.kind == "tip":
+            scorer.tip(record.area, record.time, record.data["MASS"], record.data["ROCKY_RATIO"])
+        else:
+            scorer.event(record.area, record.data["LOCATION"], record.time)
+    return consume
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="directory of the CSV files (default: the repository)")
+    parser.add_argument("--speedup", type=float, default=SPEEDUP,
+                        help="speed-up of real time, 0 for as fast as possible (default %(default)s)")
+    parser.add_argument("--consumer", choices=("score", "none"), default="score",
+                        help="online risk scorer, or nothing to measure the replay itself (default %(default)s)")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE, help="queue size (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    consumer = _scorer(args.data) if args.consumer == "score" else (lambda record: None)
+    stats = asyncio.run(run(consumer, records(args.data), args.speedup, args.queue))
+    summary = stats.summary()
+    print(f"{summary['records']} records in {summary['elapsed_s']:.2f} s: "
+          f"{summary['throughput_per_s']:.0f} records/s, {summary['speedup_achieved']:.0f}x real time")
+    print(f"consumer lag: median {summary['lag_p50_ms']:.3f} ms, p99 {summary['lag_p99_ms']:.3f} ms, "
+          f"max {summary['lag_max_ms']:.3f} ms; queue up to {summary['max_queue']} records")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,249 @@
+"""Headless batch generation of the rockbreaking report for many periods and areas.
+
+The notebook is run once (app.run) for the frames every report shares: the typed tips and
+events of the full history, the joined events and the rollup cube, together with the
+parameters set in the notebook. Each report then only slices its period out of these
+frames and draws the charts (charts.py), in a pool of worker processes, writing a static
+HTML page (export.py) and, with --png, one PNG per figure (exported in one batch per
+report):
+
+    python -m rockbreaking.report --weeks 2024-07-22 2024-08-04 --area A --area B
+    python -m rockbreaking.report --period 2024-07-24 2024-07-30 --months 2024-07-01 2024-09-30 --png
+    python -m rockbreaking.report --weeks 2024-07-22 2024-08-04 --compact --plotlyjs inline --gzip
+
+Without --area a report covers all areas; with it there is one report per area and period.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import dataclasses
+import datetime as dt
+import importlib.util
+import io
+import multiprocessing
+import os
+import sys
+
+import polars as pl
+
+from . import anomaly, areas, attribution, charts, export, recalibration, startup, trucks, window
+
+NOTEBOOK = startup.NOTEBOOK
+
+# Definitions of the notebook shared by all reports
+SHARED = (
+    "roster", "data_tips", "df_rb", "df_all", "rb_cube", "rb_rolling", "attribution_window", "attribution_weights",
+)
+
+_shared = None
+
+
+@dataclasses.dataclass(frozen=True)
+class Report:
+    """One report: production days first_day to last_day of the given areas (None for all)."""
+    first_day: dt.date
+    last_day: dt.date
+    areas: tuple = None
+
+    @property
+    def name(self):
+        scope = "_".join(areas.area_label(area) for area in self.areas) if self.areas else "all"
+        return f"RB_Report_{self.first_day:%Y%m%d}_{self.last_day:%Y%m%d}_{scope}"
+
+
+def load_notebook(path=NOTEBOOK):
+    """Import the marimo notebook at path as a module (its app is module.app)."""
+    spec = importlib.util.spec_from_file_location("rockbreaking_notebook", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def shared_frames(notebook=NOTEBOOK):
+    """Run the notebook once and keep the frames and parameters every report uses."""
+    # What the notebook cells print is of no use in a batch
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, defs = load_notebook(notebook).app.run()
+    return {name: defs[name] for name in SHARED}
+
+
+def _only_areas(shared, names):
+    # Shared frames restricted to some areas
+    if not names:
+        return shared
+    keep = pl.col("AREA").cast(pl.String).is_in(list(names))
+    return shared | {
+        "data_tips": shared["data_tips"].filter(keep),
+        "df_rb": shared["df_rb"].filter(keep),
+        "df_all": shared["df_all"].filter(keep),
+        "rb_cube": {grain: df.filter(keep) for grain, df in shared["rb_cube"].items()},
+        "rb_rolling": shared["rb_rolling"].filter(keep),
+    }
+
+
+def figures(shared, report, compact=False):
+    """Sections of the report as (heading, [figures]), drawn like in the notebook.
+
+    With compact, charts with a bar per event are pre-aggregated (the drill-down into the
+    busiest day draws one bar per hour).
+    """
+    shared = _only_areas(shared, report.areas)
+    study = window.study_window(shared["roster"], report.first_day, report.last_day)
+    rb_cube, study_days, period_label = shared["rb_cube"], study["study_days"], study["period_label"]
+
+    events = window.slice_events(shared["df_rb"], study["start_time"], study["end_time"])
+    if events.is_empty():
+        return []
+    grizzly = window.slice_events(shared["df_all"], study["start_time"], study["end_time"]).filter(
+        pl.col("LOCATION") == "Grizzly"
+    )
+    df_daily = charts.grizzly_daily(rb_cube, study_days)
+
+    sections = [
+        ("Rockbreaking time per location", [
+            charts.location_totals(rb_cube, study_days, period_label),
+            charts.location_means(rb_cube, study_days, period_label),
+            *charts.location_rocky_ratio(rb_cube, study_days, period_label),
+        ]),
+        ("Overlapping rockbreaking events", [charts.true_downtime(events, period_label)]),
+        ("Daily analysis", [
+            *charts.daily(df_daily, period_label),
+            *charts.drill_down(charts.busiest_days(grizzly, df_daily), every="1h" if compact else None),
+            *charts.rolling_downtime(
+                window.sorted_slice(shared["rb_rolling"], "TIME", study["start_time"], study["end_time"]),
+                period_label,
+            ),
+        ]),
+        ("Zones", charts.zone_metrics(rb_cube, study_days, period_label)),
+        ("Abnormal days", charts.anomalies(
+            anomaly.detect(rb_cube, **study_days, roster=shared["roster"]), period_label
+        )),
+    ]
+    if not grizzly.is_empty():
+        links = attribution.attribute_events(
+            events.filter(pl.col("LOCATION") == "Grizzly"),
+            shared["data_tips"],
+            window=shared["attribution_window"],
+            weights=shared["attribution_weights"],
+        )
+        sections.append((
+            "Zones with multi-tip attribution",
+            charts.attribution_comparison(links, rb_cube, study_days, period_label),
+        ))
+        tips = window.slice_tips(shared["data_tips"], study["start_time"], study["end_time"])
+        sections.append((
+            "Rocky ratio recalibration",
+            charts.recalibration(recalibration.recalibrate(grizzly, tips), period_label),
+        ))
+        # The tips of the period and those the first events of the period are shared with
+        truck_index = trucks.build(
+            window.slice_tips(shared["data_tips"], study["start_time"] - shared["attribution_window"], study["end_time"]),
+            grizzly,
+            window=shared["attribution_window"],
+            weights=shared["attribution_weights"],
+            roster=shared["roster"],
+        )
+        sections.append(("Truck accountability", charts.truck_ranking(truck_index, study_days, period_label)))
+    return sections
+
+
+def write_pngs(figs, paths):
+    """Export figures to PNG in one batch (needs the kaleido package)."""
+    import plotly.io as pio
+
+    if figs:
+        pio.write_images(figs, paths, format="png")
+    return list(paths)
+
+
+def render(report, out_dir, png=False, plotlyjs="cdn", compress=False, compact=False):
+    """Write the files of one report to out_dir and return their paths.
+
+    plotlyjs and compress are passed on to export.write_page, compact to figures.
+    """
+    sections = figures(_shared, report, compact)
+    scope = ", ".join(areas.area_label(area) for area in report.areas) if report.areas else "all areas"
+    title = f"Rockbreaking report {window.period_label(report.first_day, report.last_day)} - {scope}"
+    paths = [export.write_page(os.path.join(out_dir, f"{report.name}.html"), title, sections, plotlyjs, compress)]
+    if png:
+        figs = [fig for _, section in sections for fig in section]
+        paths += write_pngs(figs, [os.path.join(out_dir, f"{report.name}_{i:02d}.png") for i in range(len(figs))])
+    return paths
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def generate(reports, out_dir, jobs=None, notebook=NOTEBOOK, **options):
+    """Render all reports into out_dir, jobs at a time; returns the paths written.
+
+    The shared frames are computed once here and handed to each worker process when it
+    starts, so the workers only slice and draw. options (png, plotlyjs, compress and
+    compact) are passed on to render.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    shared = shared_frames(notebook)
+    jobs = min(jobs or os.cpu_count() or 1, len(reports))
+    if jobs <= 1:
+        _init_worker(shared)
+        return [path for report in reports for path in render(report, out_dir, **options)]
+    with concurrent.futures.ProcessPoolExecutor(
+        jobs, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker, initargs=(shared,)
+    ) as pool:
+        futures = [pool.submit(render, report, out_dir, **options) for report in reports]
+        return [path for future in futures for path in future.result()]
+
+
+def _area_name(value):
+    for name in areas.TIP_FILES:
+        if value in (name, areas.area_label(name)):
+            return name
+    raise argparse.ArgumentTypeError(f"unknown area {value!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    date = dt.date.fromisoformat
+    parser.add_argument("--period", nargs=2, type=date, action="append", default=[], metavar=("FIRST", "LAST"),
+                        help="production days of one report (repeatable)")
+    parser.add_argument("--weeks", nargs=2, type=date, metavar=("FIRST", "LAST"),
+                        help="one report per Monday to Sunday week overlapping the range")
+    parser.add_argument("--months", nargs=2, type=date, metavar=("FIRST", "LAST"),
+                        help="one report per calendar month overlapping the range")
+    parser.add_argument("--area", type=_area_name, action="append", default=[],
+                        help="area name or label, one report per area (default: all areas in one report)")
+    parser.add_argument("-o", "--out", default="reports", help="output directory (default %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--png", action="store_true", help="also export every figure to PNG (needs kaleido)")
+    parser.add_argument("--plotlyjs", choices=export.PLOTLYJS, default="cdn",
+                        help="load plotly.js from the CDN or embed it once per page (default %(default)s)")
+    parser.add_argument("--gzip", action="store_true", help="write the pages gzipped (.html.gz)")
+    parser.add_argument("--compact", action="store_true",
+                        help="pre-aggregate the charts with a bar per event (one bar per hour)")
+    parser.add_argument("--notebook", default=NOTEBOOK, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    periods = [tuple(period) for period in args.period]
+    if args.weeks:
+        periods += window.weeks(*args.weeks)
+    if args.months:
+        periods += window.months(*args.months)
+    if not periods:
+        parser.error("give at least one of --period, --weeks or --months")
+    if args.png and importlib.util.find_spec("kaleido") is None:
+        parser.error("--png needs the kaleido package")
+
+    scopes = [(area,) for area in args.area] or [None]
+    reports = [Report(first, last, scope) for first, last in periods for scope in scopes]
+    for path in generate(
+        reports, args.out, args.jobs, args.notebook,
+        png=args.png, plotlyjs=args.plotlyjs, compress=args.gzip, compact=args.compact,
+    ):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
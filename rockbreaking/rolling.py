@@ -0,0 +1,179 @@
+"""Rolling event rate, downtime and tonnes per downtime minute, per area and location.
+
+The report only has whole-day bars; operators watch the last hours. For every area and
+location the events and tips are counted into fixed time buckets (every, 15 minutes by
+default), and each trailing window (periods, the last hour and the last two hours by
+default) is the sum of its last period / every buckets, taken as a difference of
+cumulative sums. The series are one row per bucket end (TIME), the window covering
+[TIME - period, TIME), with per period p:
+
+* EVENTS_<p>, EVENTS_PER_HOUR_<p>: events started in the window, and per hour
+* DOWNTIME_<p>: their total LENGTH (minutes in the notebook)
+* MASS_<p>: tonnes tipped in the area in the window
+* MASS_DT_RATIO_<p>: tonnes tipped per minute of downtime (null without downtime)
+
+Everything is one pass over the rows plus one over the buckets, O(n) for any window. A
+Rolling keeps the bucket sums, so appended rows only update the buckets they fall in and
+the series from the first of them onwards; a live dashboard never goes back to the logs:
+
+    live = rolling.Rolling()
+    live.append(events, tips)            # the history, once
+    live.append(new_events, new_tips)    # returns the rows of the series that changed
+"""
+import datetime as dt
+
+import polars as pl
+
+# Size of the buckets the rows are counted in, and the step of the series
+EVERY = dt.timedelta(minutes=15)
+
+# Trailing windows of the series
+PERIODS = (dt.timedelta(hours=1), dt.timedelta(hours=2))
+
+# Keys of the event buckets and of the series
+KEYS = ("AREA", "LOCATION")
+
+# Chunks a frame of a Rolling may grow to with appends before it is rechunked
+MAX_CHUNKS = 64
+
+
+def period_label(period):
+    """Suffix of the columns of a window: 2h, 90m or 1d."""
+    minutes = period // dt.timedelta(minutes=1)
+    if minutes % 1440 == 0:
+        return f"{minutes // 1440}d"
+    return f"{minutes // 60}h" if minutes % 60 == 0 else f"{minutes}m"
+
+
+def _buckets(events, tips, every):
+    # Sparse bucket sums of events per area and location and of tips per area
+    area = pl.col("AREA").cast(pl.String)
+    by_event = events.group_by(
+        area, pl.col("LOCATION").cast(pl.String), pl.col("EVENT_START").dt.truncate(every).alias("BUCKET")
+    ).agg(pl.len().alias("EVENTS"), pl.col("LENGTH").sum().alias("DOWNTIME"))
+    by_tip = tips.group_by(area, pl.col("TIP_DATETIME").dt.truncate(every).alias("BUCKET")).agg(
+        pl.len().alias("TIPS"), pl.col("MASS").sum()
+    )
+    return by_event, by_tip
+
+
+def _since(df, first):
+    # Rows of a frame sorted by BUCKET from bucket first on (a binary search, no scan)
+    return df.slice(df["BUCKET"].search_sorted(first))
+
+
+def _splice(df, tail, first):
+    # Rows of a frame sorted by BUCKET before bucket first, followed by tail
+    head = df.slice(0, df["BUCKET"].search_sorted(first))
+    # One chunk per append would slow down every later read
+    return pl.concat([head, tail], rechunk=df.n_chunks() >= MAX_CHUNKS)
+
+
+def _merge(old, new, keys, first):
+    # Bucket sums of old with new added in, for the buckets from first onwards, sorted by BUCKET
+    if old is None:
+        return new.sort(keys[-1], *keys[:-1])
+    tail = pl.concat([_since(old, first), new.select(old.columns)])
+    return _splice(old, tail.group_by(keys).agg(pl.exclude(keys).sum()).sort(keys[-1], *keys[:-1]), first)
+
+
+def _series(by_event, by_tip, pairs, start, end, every, periods):
+    # Series of every pair from bucket start to end, each window summed from the buckets since start
+    grid = pl.DataFrame(sorted(pairs), schema={"AREA": pl.String, "LOCATION": pl.String}, orient="row").join(
+        pl.select(pl.datetime_range(start, end, every, time_unit="us").alias("BUCKET")), how="cross"
+    )
+    frame = (
+        grid.join(by_event, on=["AREA", "LOCATION", "BUCKET"], how="left")
+        .join(by_tip, on=["AREA", "BUCKET"], how="left")
+        .with_columns(pl.col("EVENTS", "DOWNTIME", "TIPS", "MASS").fill_null(0))
+        .sort("BUCKET", *KEYS)
+    )
+    columns = []
+    for period in periods:
+        n, label = period // every, period_label(period)
+        events, downtime, tips, mass = [
+            (pl.col(col).cum_sum() - pl.col(col).cum_sum().shift(n).fill_null(0)).over(KEYS)
+            for col in ("EVENTS", "DOWNTIME", "TIPS", "MASS")
+        ]
+        # Differences of float sums leave rounding residues where the window is empty
+        downtime = pl.when(events > 0).then(downtime).otherwise(0.0)
+        mass = pl.when(tips > 0).then(mass).otherwise(0.0)
+        columns += [
+            events.alias(f"EVENTS_{label}"),
+            (events / (period / dt.timedelta(hours=1))).alias(f"EVENTS_PER_HOUR_{label}"),
+            downtime.alias(f"DOWNTIME_{label}"),
+            mass.alias(f"MASS_{label}"),
+            pl.when(events > 0).then(mass / downtime).alias(f"MASS_DT_RATIO_{label}"),
+        ]
+    return frame.select(
+        *KEYS, (pl.col("BUCKET") + every).alias("TIME"), pl.col("BUCKET"), *columns
+    ).sort("BUCKET", *KEYS)
+
+
+class Rolling:
+    """Rolling series of the events and tips appended so far, updated in place by append.
+
+    The bucket sums and the series are kept sorted by BUCKET, so that an append only
+    touches their tails (found by binary search) rather than the whole history.
+    """
+
+    def __init__(self, every=EVERY, periods=PERIODS):
+        for period in periods:
+            if period % every or period < every:
+                raise ValueError(f"every window must be a whole number of buckets of {every}, got {period}")
+        self.every = every
+        self.periods = tuple(periods)
+        self.series = None
+        self._events = self._tips = None
+        self._pairs = set()
+        self._first = self._last = None
+
+    def append(self, events, tips):
+        """Add new event and tip rows (of all areas); returns the rows of the series they changed.
+
+        The rows may come in any order and fall in buckets already counted, but each
+        batch should only hold rows not appended before.
+        """
+        by_event, by_tip = _buckets(events, tips, self.every)
+        batches = [df for df in (by_event, by_tip) if not df.is_empty()]
+        if not batches:
+            return self.series.clear() if self.series is not None else None
+        first = min(df["BUCKET"].min() for df in batches)
+        last = max(df["BUCKET"].max() for df in batches)
+        # The buckets between the end of the series and the batch are new too, even if empty
+        changed_from = first if self._last is None else min(first, self._last + self.every)
+        self._first = first if self._first is None else min(self._first, first)
+        self._last = last if self._last is None else max(self._last, last)
+        self._events = _merge(self._events, by_event, ["AREA", "LOCATION", "BUCKET"], first)
+        self._tips = _merge(self._tips, by_tip, ["AREA", "BUCKET"], first)
+        new_pairs = set(by_event.select(KEYS).unique().iter_rows()) - self._pairs
+        self._pairs |= new_pairs
+
+        # Pairs already in the series change from the first bucket of the batch, whose windows
+        # start up to the longest window before it; a new pair gets its whole series
+        parts = []
+        for pairs, since in ((self._pairs - new_pairs, changed_from), (new_pairs, self._first)):
+            if pairs:
+                start = max(since - (max(self.periods) - self.every), self._first)
+                parts.append(_series(
+                    _since(self._events, start), _since(self._tips, start),
+                    pairs, start, self._last, self.every, self.periods,
+                ).filter(pl.col("BUCKET") >= since))
+        if not parts:
+            return None
+        changed = pl.concat(parts).sort("BUCKET", *KEYS)
+        if self.series is None or new_pairs:
+            # A new pair has rows all along the series
+            self.series = changed if self.series is None else pl.concat([
+                self.series.filter(pl.col("BUCKET") < changed_from), changed
+            ]).sort("BUCKET", *KEYS)
+        else:
+            self.series = _splice(self.series, changed, changed_from)
+        return changed
+
+
+def metrics(events, tips, every=EVERY, periods=PERIODS):
+    """Rolling series of events and tips of all areas, one row per bucket, area and location."""
+    live = Rolling(every, periods)
+    live.append(events, tips)
+    return live.series
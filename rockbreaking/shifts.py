@@ -0,0 +1,99 @@
+"""Shift calendar of the site.
+
+A production day starts with the first shift of the roster (6 am in the notebook) rather
+than at midnight, and is split into the shifts of the roster. Instead of recomputing the
+production day with datetime arithmetic in every chart cell, the keys are added once to
+the tip and event frames when they are loaded:
+
+* SHIFT_DATE: production day (Date)
+* SHIFT: number of the shift within the production day (0 for the first shift)
+* SHIFT_ID: integer key unique to each shift (days since 1970-01-01 * shifts per day + SHIFT)
+
+Shift boundaries follow the local wall clock of the site, so across a daylight saving
+change a shift is an hour longer or shorter, as it is for the crews.
+"""
+import dataclasses
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import polars as pl
+
+
+@dataclasses.dataclass(frozen=True)
+class Roster:
+    """Shift pattern of a site.
+
+    starts holds the local start time of each shift, starting with the first shift of the
+    production day. timezone is the site timezone and data_timezone the timezone the naive
+    CSV timestamps are recorded in; leave both as None when the CSVs hold site local time.
+    """
+    name: str
+    starts: tuple
+    timezone: str = None
+    data_timezone: str = None
+
+    def offsets(self):
+        """Start of each shift in seconds after the start of the production day."""
+        first = _seconds(self.starts[0])
+        return [(_seconds(start) - first) % 86400 for start in self.starts]
+
+
+ROSTERS = {
+    "day": Roster("day", (dt.time(6),)),
+    "2x12": Roster("2x12", (dt.time(6), dt.time(18))),
+    "3x8": Roster("3x8", (dt.time(6), dt.time(14), dt.time(22))),
+}
+
+DEFAULT_ROSTER = ROSTERS["2x12"]
+
+
+def _seconds(time):
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+
+def local_time(col, roster=DEFAULT_ROSTER):
+    """Expression converting a naive datetime column to the site wall clock."""
+    expr = pl.col(col)
+    if roster.data_timezone and roster.timezone and roster.data_timezone != roster.timezone:
+        expr = (
+            expr.dt.replace_time_zone(roster.data_timezone, ambiguous="earliest")
+            .dt.convert_time_zone(roster.timezone)
+            .dt.replace_time_zone(None)
+        )
+    return expr
+
+
+def shift_keys(col, roster=DEFAULT_ROSTER):
+    """Expressions for the SHIFT_DATE, SHIFT and SHIFT_ID of a datetime column."""
+    # Moving the clock back to the start of the first shift makes the production day a
+    # plain calendar date, and the time of day tells the shift apart
+    shifted = local_time(col, roster) - pl.duration(seconds=_seconds(roster.starts[0]))
+    day = shifted.dt.date()
+    time_of_day = (
+        shifted.dt.hour().cast(pl.Int32) * 3600
+        + shifted.dt.minute().cast(pl.Int32) * 60
+        + shifted.dt.second().cast(pl.Int32)
+    )
+    offsets = roster.offsets()
+    shift = pl.sum_horizontal(
+        [pl.lit(0, dtype=pl.Int32)] + [(time_of_day >= offset).cast(pl.Int32) for offset in offsets[1:]]
+    )
+    return [
+        day.alias("SHIFT_DATE"),
+        shift.alias("SHIFT"),
+        (day.cast(pl.Int32).cast(pl.Int64) * len(offsets) + shift).alias("SHIFT_ID"),
+    ]
+
+
+def add_shift_keys(df, col, roster=DEFAULT_ROSTER):
+    """Add SHIFT_DATE, SHIFT and SHIFT_ID to a (lazy) frame from its datetime column col."""
+    return df.with_columns(shift_keys(col, roster))
+
+
+def day_start(roster, day):
+    """Start of a production day, as a naive datetime in the timezone of the CSV data."""
+    start = dt.datetime.combine(day, roster.starts[0])
+    if roster.data_timezone and roster.timezone and roster.data_timezone != roster.timezone:
+        start = start.replace(tzinfo=ZoneInfo(roster.timezone))
+        start = start.astimezone(ZoneInfo(roster.data_timezone)).replace(tzinfo=None)
+    return start
@@ -0,0 +1,98 @@
+"""Startup cost of the notebook: lazy imports and an import-time benchmark.
+
+Time to first render is dominated by imports, not by the data work, so the notebook only
+imports what its cells use and loads the plotting libraries on first use:
+
+    px = startup.lazy_import("plotly.express")   # loaded when px.bar is first called
+
+The benchmark runs the notebook as a script in a fresh interpreter with -X importtime,
+adds up the import time per top-level package and fails when the total is over budget:
+
+    python -m rockbreaking.startup                  # RockBreaking_Analytics.py, BUDGET
+    python -m rockbreaking.startup --budget 2.5 --top 5
+"""
+import argparse
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Import time budget of the notebook (seconds), checked by the benchmark
+BUDGET = 3.0
+
+NOTEBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "RockBreaking_Analytics.py")
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def lazy_import(name):
+    """Module that is only executed when one of its attributes is first used.
+
+    The parent packages of name are imported straight away (they are needed to find the
+    module), the module itself on first attribute access. Already imported modules are
+    returned as they are.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def parse_importtime(stderr):
+    """Cumulative import time (seconds) per top-level package from -X importtime output.
+
+    Only the imports made directly by the program are counted (nested imports are part
+    of their cumulative time), grouped by the first part of the module name.
+    """
+    times = {}
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match and not match.group(3):
+            package = match.group(4).split(".")[0]
+            times[package] = times.get(package, 0.0) + int(match.group(2)) / 1e6
+    return dict(sorted(times.items(), key=lambda item: -item[1]))
+
+
+def measure(script=NOTEBOOK, python=sys.executable):
+    """Run script in a fresh interpreter; return (import times per package, wall time)."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [python, "-X", "importtime", script],
+        cwd=os.path.dirname(os.path.abspath(script)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    return parse_importtime(result.stderr), time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("script", nargs="?", default=NOTEBOOK)
+    parser.add_argument("--budget", type=float, default=BUDGET,
+                        help="maximum total import time in seconds (default %(default)s)")
+    parser.add_argument("--top", type=int, default=10, help="packages listed (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    times, wall = measure(args.script)
+    total = sum(times.values())
+    for package, seconds in list(times.items())[:args.top]:
+        print(f"{package:<20}{seconds:8.3f} s")
+    print(f"{'imports':<20}{total:8.3f} s (budget {args.budget:.3f} s)")
+    print(f"{'run':<20}{wall:8.3f} s")
+    if total > args.budget:
+        print(f"Import time over budget by {total - args.budget:.3f} s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
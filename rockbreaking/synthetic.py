@@ -0,0 +1,309 @@
+"""Synthetic tip and event logs of any size, shaped like the shipped ones, for scale testing.
+
+The shipped logs hold a few thousand rows, too few to show how the joins and group-bys
+scale. The generator first fits a profile to them (profile) and then draws new logs from
+it, a block of whole days at a time:
+
+* tips arrive as a Poisson process at the tip rate of each area, with tonnes drawn from
+  the normal distribution of the shipped tips;
+* the trucks of an area tip in turn (every truck once per round, in a random order), and
+  each truck hauls from one zone per 12 hour shift, drawn with the zone shares of the
+  shipped tips; each zone keeps its ROCKY_RATIO;
+* every tip causes a Poisson number of events at each LOCATION, with a mean of its tonnes
+  times a rate log-linear in its ROCKY_RATIO (falling as the ratio goes up, 1 being rocky
+  and 5 not rocky, fitted per area and location as in recalibration.py), starting an
+  exponential delay after the tip, with a log-normal LENGTH whose log is linear in the
+  ROCKY_RATIO (fitted per area and location).
+
+Everything is drawn with numpy for a whole block at once, and every block is written out
+before the next one is drawn, so memory is bounded by the block size whatever the number
+of rows. The output has the schema and file names of the shipped logs (A_DATA.csv,
+B_DATA.csv, RB_DATA.csv), so areas.load reads it as it is; with parquet every log is a
+directory of part files (pl.scan_parquet("A_DATA/*.parquet")). The same seed gives the
+same files:
+
+    python -m rockbreaking.synthetic -o synthetic --scale 100 --seed 1
+    python -m rockbreaking.synthetic -o stress --scale 1000 --intensity 100 --format parquet
+"""
+import argparse
+import dataclasses
+import datetime as dt
+import math
+import os
+import time
+
+import numpy as np
+import polars as pl
+
+from . import areas, join, recalibration
+
+# Tips drawn per block (all areas), which bounds the memory used
+BLOCK_TIPS = 2_000_000
+
+# Length of a truck shift on one zone (hours)
+SHIFT_HOURS = 12
+
+FORMATS = ("csv", "parquet")
+
+# Timestamps written like the shipped CSVs (2024-07-24T00:07:23.000000)
+_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%.6f"
+
+_US = 1_000_000
+
+
+@dataclasses.dataclass(frozen=True)
+class LocationProfile:
+    """Events of one area and location: rate per tonne, delay and LENGTH.
+
+    The rate per tonne of a tip is exp(log_rate + log_rate_rr * ROCKY_RATIO), or rate for
+    a tip without a ratio.
+    """
+    rate: float
+    log_rate: float
+    log_rate_rr: float
+    delay: float
+    log_length: float
+    log_length_rr: float
+    log_length_sd: float
+
+
+@dataclasses.dataclass(frozen=True)
+class AreaProfile:
+    """Tips of one area and the events they cause per location."""
+    area: str
+    zones: tuple
+    ratios: tuple
+    shares: tuple
+    trucks: int
+    tips_per_hour: float
+    mass_mean: float
+    mass_sd: float
+    locations: dict
+
+
+def _location_profile(tips, joined):
+    # Fit of the rate, delay and log-length regression of the events of one location
+    tonnes = tips["MASS"].sum()
+    rate = len(joined) / tonnes if tonnes else 0.0
+    zones = recalibration.zone_totals(joined, tips).drop_nulls("ROCKY_RATIO")
+    log_rate, log_rate_rr = recalibration.fit_rate(zones["ROCKY_RATIO"], zones["TONNES"], zones["EVENTS"])
+    if math.isnan(log_rate_rr):
+        # No slope to be found: the same rate whatever the ratio
+        log_rate, log_rate_rr = math.log(rate) if rate else -math.inf, 0.0
+    rated = joined.drop_nulls("ROCKY_RATIO").filter(pl.col("LENGTH") > 0)
+    fit = rated.select(
+        pl.cov(pl.col("ROCKY_RATIO"), pl.col("LENGTH").log()).alias("cov"),
+        pl.col("ROCKY_RATIO").var().alias("var"),
+        pl.col("ROCKY_RATIO").mean().alias("rr"),
+        pl.col("LENGTH").log().mean().alias("log_length"),
+    ).row(0, named=True)
+    slope = fit["cov"] / fit["var"] if fit["var"] else 0.0
+    intercept = fit["log_length"] - slope * fit["rr"]
+    residual = rated.select((pl.col("LENGTH").log() - intercept - slope * pl.col("ROCKY_RATIO")).std()).item()
+    delay = joined.select((pl.col("EVENT_START") - pl.col("TIP_DATETIME")).dt.total_microseconds().mean()).item()
+    return LocationProfile(
+        rate=rate,
+        log_rate=log_rate,
+        log_rate_rr=log_rate_rr,
+        delay=(delay or 0.0) / _US,
+        log_length=intercept,
+        log_length_rr=slope,
+        log_length_sd=residual or 0.0,
+    )
+
+
+def profile(tips, events):
+    """AreaProfile of every area of the tip and event frames (areas.load)."""
+    joined = join.attach_last_tip(events, tips, tolerance=None)
+    profiles = {}
+    for area, area_tips in areas.partition(tips).items():
+        zones = area_tips.group_by(pl.col("ORIGIN").cast(pl.String)).agg(
+            pl.col("ROCKY_RATIO").first(), pl.len().alias("TIPS")
+        ).sort("ORIGIN")
+        span = (area_tips["TIP_DATETIME"].max() - area_tips["TIP_DATETIME"].min()).total_seconds() / 3600
+        area_events = joined.filter(pl.col("AREA") == area)
+        profiles[str(area)] = AreaProfile(
+            area=str(area),
+            zones=tuple(zones["ORIGIN"]),
+            ratios=tuple(zones["ROCKY_RATIO"]),
+            shares=tuple((zones["TIPS"] / zones["TIPS"].sum()).to_list()),
+            trucks=area_tips["TRUCK_ID"].n_unique(),
+            tips_per_hour=len(area_tips) / span,
+            mass_mean=area_tips["MASS"].mean(),
+            mass_sd=area_tips["MASS"].std(),
+            locations={
+                str(location): _location_profile(area_tips, located)
+                for (location,), located in area_events.partition_by("LOCATION", as_dict=True).items()
+            },
+        )
+    return profiles
+
+
+def _tips(rng, p, start, hours, intensity):
+    # Tips of one area over [start, start + hours), as numpy arrays
+    n = rng.poisson(p.tips_per_hour * intensity * hours)
+    times = start + np.sort(rng.integers(0, int(hours * 3600 * _US), n))
+
+    # Every truck once per round, in a random order within the round
+    trucks = max(1, round(p.trucks * intensity))
+    rounds = np.arange(n) // trucks
+    truck = np.argsort(np.argsort(rounds + rng.random(n), kind="stable"), kind="stable") % trucks
+
+    # One zone per truck and shift (blocks are whole days, so no shift straddles two blocks)
+    shift = times // (SHIFT_HOURS * 3600 * _US)
+    keys, inverse = np.unique(shift * trucks + truck, return_inverse=True)
+    zone = rng.choice(len(p.zones), size=len(keys), p=p.shares)[inverse]
+
+    mass = np.round(np.clip(rng.normal(p.mass_mean, p.mass_sd, n), 1.0, None), 1)
+    ratio = np.asarray(p.ratios, dtype=float)[zone]
+    return times, truck, zone, mass, ratio
+
+
+def _events(rng, p, times, mass, ratio):
+    # Events caused by the tips of one area, per location, as (location, start, length) arrays
+    out = []
+    rated = np.nan_to_num(ratio)
+    for index, (location, lp) in enumerate(sorted(p.locations.items())):
+        rate = np.where(np.isnan(ratio), lp.rate, np.exp(lp.log_rate + lp.log_rate_rr * rated))
+        counts = rng.poisson(rate * mass)
+        tip = np.repeat(np.arange(len(times)), counts)
+        start = times[tip] + (rng.exponential(lp.delay, len(tip)) * _US).astype(np.int64)
+        length = np.exp(lp.log_length + lp.log_length_rr * rated[tip] + rng.normal(0, lp.log_length_sd, len(tip)))
+        out.append((np.full(len(tip), index), start, length))
+    return out
+
+
+def _tip_frame(p, times, truck, zone, mass, ratio):
+    return pl.DataFrame({
+        "TIP_DATETIME": pl.Series(times, dtype=pl.Int64).cast(pl.Datetime("us")),
+        "ORIGIN": pl.Series(p.zones, dtype=pl.String).gather(zone),
+        "MASS": mass,
+        "TRUCK_ID": truck + 1,
+        "ROCKY_RATIO": pl.Series(ratio).fill_nan(None),
+    }).with_columns(pl.concat_str(pl.lit("DT"), pl.col("TRUCK_ID")).alias("TRUCK_ID"))
+
+
+def _event_frame(p, drawn):
+    if drawn:
+        index, start, length = (np.concatenate(parts) for parts in zip(*drawn))
+    else:
+        index, start, length = np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0)
+    return pl.DataFrame({
+        "LOCATION": pl.Series(sorted(p.locations), dtype=pl.String).gather(index),
+        "EVENT_START": pl.Series(start, dtype=pl.Int64),
+        "LENGTH": pl.Series(length, dtype=pl.Float64),
+    }).select(
+        pl.lit(p.area).alias("AREA"),
+        "LOCATION",
+        pl.col("EVENT_START").cast(pl.Datetime("us")),
+        (pl.col("EVENT_START") + (pl.col("LENGTH") * _US).cast(pl.Int64)).cast(pl.Datetime("us")).alias("EVENT_END"),
+        "LENGTH",
+    )
+
+
+class _Writer:
+    # Appends blocks of rows to one CSV file or to a directory of parquet part files
+
+    def __init__(self, path, file_format):
+        self.file_format = file_format
+        self.parts = 0
+        if file_format == "csv":
+            self.path = path
+            self.file = open(path, "wb")
+        else:
+            self.path = os.path.splitext(path)[0]
+            os.makedirs(self.path, exist_ok=True)
+            self.file = None
+
+    def write(self, df):
+        if self.file_format == "csv":
+            df.write_csv(self.file, include_header=self.parts == 0, datetime_format=_DATETIME_FORMAT)
+        elif not df.is_empty():
+            df.write_parquet(os.path.join(self.path, f"part-{self.parts:05d}.parquet"))
+        self.parts += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def generate(out_dir, profiles, start, days, seed=0, intensity=1.0, file_format="csv", block_tips=BLOCK_TIPS,
+             tip_files=None, event_file=areas.EVENT_FILE):
+    """Write days of synthetic tips and events from start (a datetime) to out_dir.
+
+    intensity multiplies the tip rate and the number of trucks of every area. Returns
+    {file name: rows written}.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"file_format must be one of {FORMATS}, got {file_format!r}")
+    tip_files = areas.TIP_FILES if tip_files is None else tip_files
+    os.makedirs(out_dir, exist_ok=True)
+    writers = {area: _Writer(os.path.join(out_dir, tip_files[area]), file_format) for area in profiles}
+    event_writer = _Writer(os.path.join(out_dir, event_file), file_format)
+    rows = dict.fromkeys([*(tip_files[area] for area in profiles), event_file], 0)
+
+    tips_per_day = 24 * intensity * sum(p.tips_per_hour for p in profiles.values())
+    block_days = max(1, int(block_tips // max(tips_per_day, 1)))
+    start_us = int((start - dt.datetime(1970, 1, 1)).total_seconds()) * _US
+    # Events starting after the end of their block are written with the next one
+    pending = pl.DataFrame(schema=_event_frame(next(iter(profiles.values())), []).schema)
+    try:
+        for block, first_day in enumerate(range(0, days, block_days)):
+            rng = np.random.default_rng([seed, block])
+            block_start = start_us + first_day * 86400 * _US
+            block_end = block_start + min(block_days, days - first_day) * 86400 * _US
+            hours = (block_end - block_start) / 3600 / _US
+            events = [pending]
+            for area, p in profiles.items():
+                times, truck, zone, mass, ratio = _tips(rng, p, block_start, hours, intensity)
+                tips = _tip_frame(p, times, truck, zone, mass, ratio)
+                writers[area].write(tips)
+                rows[tip_files[area]] += len(tips)
+                events.append(_event_frame(p, _events(rng, p, times, mass, ratio)))
+            events = pl.concat(events).sort("EVENT_START")
+            last = first_day + block_days >= days
+            cutoff = pl.lit(block_end).cast(pl.Datetime("us"))
+            ready = events if last else events.filter(pl.col("EVENT_START") < cutoff)
+            pending = events.filter(pl.col("EVENT_START") >= cutoff)
+            event_writer.write(ready)
+            rows[event_file] += len(ready)
+    finally:
+        for writer in [*writers.values(), event_writer]:
+            writer.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="directory of the CSV files the profile is fitted to (default: the repository)")
+    parser.add_argument("-o", "--out", default="synthetic", help="output directory (default %(default)s)")
+    parser.add_argument("--scale", type=float, default=100,
+                        help="multiple of the time span of the shipped logs (default %(default)s)")
+    parser.add_argument("--intensity", type=float, default=1.0,
+                        help="multiple of the tip rate and number of trucks (default %(default)s)")
+    parser.add_argument("--start", type=dt.datetime.fromisoformat, default=None,
+                        help="first day (default: the first day of the shipped logs)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default %(default)s)")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="output format (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    tips, events = areas.load(args.data)
+    profiles = profile(tips, events)
+    first = tips["TIP_DATETIME"].min()
+    shipped_days = (tips["TIP_DATETIME"].max() - first).total_seconds() / 86400
+    start = args.start or dt.datetime.combine(first.date(), dt.time())
+    days = max(1, round(shipped_days * args.scale))
+
+    started = time.perf_counter()
+    rows = generate(args.out, profiles, start, days, args.seed, args.intensity, args.format)
+    elapsed = time.perf_counter() - started
+    for name, count in rows.items():
+        print(f"{name}: {count} rows")
+    total = sum(rows.values())
+    print(f"{total} rows over {days} days in {elapsed:.1f} s ({total / elapsed:,.0f} rows/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,144 @@
+"""Event timeline that stays light whatever the length of the window.
+
+Drawing every rockbreaking event as its own SVG bar is fine for a day but not for months.
+The timeline is therefore drawn in one of three ways, depending on how many events fall
+in the visible time range:
+
+* up to webgl_threshold events: one SVG marker per event;
+* up to max_points events: one WebGL (scattergl) marker per event;
+* more: the range is cut into buckets (about one per pixel) and each bucket is drawn as a
+  single WebGL marker at its longest event, with an error bar down to its shortest event
+  and the number and total length of its events in the hover text. The minimum and
+  maximum of every bucket are kept, so no peak is lost however far the chart is zoomed
+  out.
+
+Only the events of the visible range are read (binary search on the sorted EVENT_START),
+so zooming in re-queries a short slice and the detail comes back:
+
+    plot = mo.ui.plotly(timeline.timeline(events))           # drag to select a time range
+    timeline.timeline(events, *timeline.zoom_range(plot.ranges))
+"""
+import datetime as dt
+
+import numpy as np
+import polars as pl
+
+from . import areas, startup, window
+
+go = startup.lazy_import("plotly.graph_objects")
+
+# Events in the visible range above which WebGL markers are used
+WEBGL_THRESHOLD = 1000
+
+# Events in the visible range above which the events are aggregated per bucket
+MAX_POINTS = 5000
+
+# Buckets across the visible range when aggregating (about the width of the chart in pixels)
+BUCKETS = 1000
+
+
+def aggregate(events, start, end, buckets=BUCKETS):
+    """Events of [start, end) per AREA and time bucket.
+
+    Returns BUCKET (start time of the bucket), EVENTS, LENGTH_MIN, LENGTH_MAX, LENGTH_SUM
+    and the mean ROCKY_RATIO (when the events have it) of each non-empty bucket.
+    """
+    width = max((end - start) // buckets, dt.timedelta(microseconds=1))
+    width_us = width // dt.timedelta(microseconds=1)
+    offset = (pl.col("EVENT_START") - pl.lit(start)).dt.total_microseconds() // width_us
+    aggs = [
+        pl.len().alias("EVENTS"),
+        pl.col("LENGTH").min().alias("LENGTH_MIN"),
+        pl.col("LENGTH").max().alias("LENGTH_MAX"),
+        pl.col("LENGTH").sum().alias("LENGTH_SUM"),
+    ]
+    if "ROCKY_RATIO" in events.columns:
+        aggs.append(pl.col("ROCKY_RATIO").mean())
+    return (
+        events.filter(pl.col("EVENT_START") < end)
+        .group_by("AREA", offset.alias("_BUCKET"))
+        .agg(aggs)
+        .with_columns((pl.lit(start) + pl.col("_BUCKET") * pl.duration(microseconds=width_us)).alias("BUCKET"))
+        .drop("_BUCKET")
+        .sort("AREA", "BUCKET")
+    )
+
+
+def zoom_range(ranges):
+    """(start, end) datetimes of the x range selected on a mo.ui.plotly timeline, or (None, None)."""
+    selected = (ranges or {}).get("x")
+    if not selected:
+        return None, None
+    start, end = (
+        dt.datetime.fromtimestamp(value / 1000, dt.timezone.utc).replace(tzinfo=None)
+        if isinstance(value, (int, float)) else dt.datetime.fromisoformat(str(value))
+        for value in selected
+    )
+    return min(start, end), max(start, end)
+
+
+def _marker(df):
+    # Markers coloured by rocky ratio on a colour scale shared by all areas
+    if "ROCKY_RATIO" in df.columns:
+        return dict(color=df["ROCKY_RATIO"], coloraxis="coloraxis")
+    return {}
+
+
+def timeline(events, start=None, end=None, title="Rockbreaking events", max_points=MAX_POINTS,
+             buckets=BUCKETS, webgl_threshold=WEBGL_THRESHOLD):
+    """Figure with the LENGTH of the events in [start, end) over time, one trace per area.
+
+    events must be sorted by EVENT_START; start and end default to the first and last
+    event. Dragging on the chart selects a time range (see zoom_range).
+    """
+    if events.is_empty():
+        return go.Figure().update_layout(title=f"{title} - no events")
+    start = events["EVENT_START"][0] if start is None else start
+    end = events["EVENT_START"][-1] + dt.timedelta(microseconds=1) if end is None else end
+    visible = window.sorted_slice(events, "EVENT_START", start, end).filter(pl.col("EVENT_START") < end)
+
+    aggregated = len(visible) > max_points
+    scatter = go.Scattergl if len(visible) > webgl_threshold else go.Scatter
+    traces = []
+    if aggregated:
+        for area, df in areas.partition(aggregate(visible, start, end, buckets)).items():
+            traces.append(scatter(
+                x=df["BUCKET"],
+                y=df["LENGTH_MAX"],
+                mode="markers",
+                name=areas.area_label(area),
+                marker=_marker(df),
+                # Down to the shortest event of the bucket
+                error_y=dict(type="data", symmetric=False, array=np.zeros(len(df)),
+                             arrayminus=df["LENGTH_MAX"] - df["LENGTH_MIN"], thickness=1, width=0),
+                customdata=df.select("EVENTS", "LENGTH_SUM").to_numpy(),
+                hovertemplate="%{x}<br>%{customdata[0]} events, %{customdata[1]:.1f} in total"
+                              "<br>longest %{y:.1f}<extra></extra>",
+            ))
+    else:
+        for area, df in areas.partition(visible).items():
+            traces.append(scatter(
+                x=df["EVENT_START"],
+                y=df["LENGTH"],
+                mode="markers",
+                name=areas.area_label(area),
+                marker=_marker(df),
+                customdata=df.select(pl.col("LOCATION").cast(pl.String)).to_numpy(),
+                hovertemplate="%{x}<br>%{customdata[0]}: %{y:.1f}<extra></extra>",
+            ))
+
+    if aggregated:
+        detail = f"longest event per {(end - start).total_seconds() / buckets / 60:.1f} min bucket"
+    else:
+        detail = "one marker per event"
+    fig = go.Figure(data=traces)
+    fig.update_layout(
+        title=f"{title} ({len(visible)} events, {detail})",
+        xaxis=dict(title="Event start", range=[start, end]),
+        yaxis=dict(title="Length"),
+        coloraxis=dict(colorbar=dict(title="ROCKY_RATIO")),
+        # Dragging selects a time range to zoom into instead of zooming the client-side view
+        dragmode="select",
+        selectdirection="h",
+    )
+    return fig
@@ -0,0 +1,233 @@
+"""Accountability index of the trucks: what each one tipped and the rockbreaking it caused.
+
+The joined events only keep the TRUCK_ID of the last tip before each event, and nothing
+rolls it up. The index holds one row per truck, production day of the tip, shift and
+area, built once from the tips and the joined events:
+
+* TIPS, MASS: loads tipped and their tonnes
+* RR_MASS, RATED_MASS: rocky ratio times tonnes and tonnes with a rocky ratio (their ratio
+  is the mass-weighted rocky ratio of the loads)
+* EVENTS, DOWNTIME: grizzly events and their downtime shared between the tips of the
+  look-back window before each event (attribution.py), credited to the day of the tip
+* BLAMED, BLAMED_DOWNTIME: grizzly events and downtime of the events the truck tipped last
+  before (the as-of join of join.py)
+
+The data has no loading crew, so the shift (SHIFT, the number of the shift within the
+production day, which is worked by the same crew) stands in for it: rows are also keyed by
+SHIFT and top rolls up to either.
+
+Rows are sorted by truck then day, with narrow types (UInt32 counts, Float32 sums,
+categorical keys), so a year of a fleet of 35 trucks is about 1500 rows per truck and
+2.5 MB. The row range of every truck is kept in a dict: all the rows of a truck are a
+zero-copy slice found in O(1), and ranking the fleet over a month is one filter and
+group_by over the index (a few milliseconds for a year). After new rows were
+appended to the logs, update recomputes the days they touch and splices them in
+(window.splice_days), as incremental.py does for the joined frames; a reload of the
+notebook goes through it (incremental.Pipeline.trucks):
+
+    index = trucks.build(data_tips, df_all)
+    index.top(10, start=date(2024, 7, 1), end=date(2024, 8, 1))     # most events per kt
+    index.truck("DT12", start=date(2024, 7, 1))
+"""
+import dataclasses
+import datetime as dt
+import math
+
+import polars as pl
+
+from . import attribution, shifts
+from .window import splice_days
+
+# Keys of the index rows, in sort order after TRUCK_ID
+KEYS = ("TRUCK_ID", "SHIFT_DATE", "SHIFT", "AREA")
+
+# Summed columns of the index and their types
+MEASURES = {
+    "TIPS": pl.UInt32,
+    "MASS": pl.Float32,
+    "RR_MASS": pl.Float32,
+    "RATED_MASS": pl.Float32,
+    "EVENTS": pl.Float32,
+    "DOWNTIME": pl.Float32,
+    "BLAMED": pl.UInt32,
+    "BLAMED_DOWNTIME": pl.Float32,
+}
+
+# Location of the events the trucks are held accountable for
+LOCATION = "Grizzly"
+
+# Fewest tonnes a truck (or shift) must have tipped in a period to be ranked by top
+MIN_MASS = 1000.0
+
+# Rankings top can sort by
+METRICS = ("EVENTS_PER_KT", "DOWNTIME_PER_KT", "BLAMED_PER_KT", "RR_MEAN", "EVENTS", "DOWNTIME", "MASS")
+
+
+def _day_keys(col, roster):
+    # Production day and shift of a time column
+    day, shift, _ = shifts.shift_keys(col, roster)
+    return day, shift
+
+
+def _rows(tips, joined, window, weights, roster):
+    # Index rows of the tips and of the grizzly events in joined, not yet sorted
+    day, shift = _day_keys("TIP_DATETIME", roster)
+    mass, rated = pl.col("MASS"), pl.col("ROCKY_RATIO").is_not_null()
+    tipped = tips.group_by(pl.col("TRUCK_ID"), day, shift, pl.col("AREA")).agg(
+        pl.len().alias("TIPS"),
+        mass.sum(),
+        (pl.col("ROCKY_RATIO") * mass).sum().alias("RR_MASS"),
+        mass.filter(rated).sum().alias("RATED_MASS"),
+    )
+
+    grizzly = joined.filter(pl.col("LOCATION") == LOCATION)
+    # Only the event columns: the tip columns come from the tips each event is linked to
+    links = attribution.attribute_events(
+        grizzly.select("AREA", "LOCATION", "EVENT_START", "LENGTH"),
+        tips.select("TIP_DATETIME", "TRUCK_ID", "MASS", "AREA"),
+        window=window, weights=weights,
+    )
+    shared = links.group_by(pl.col("TRUCK_ID"), day, shift, pl.col("AREA")).agg(
+        pl.col("WEIGHT").sum().alias("EVENTS"),
+        (pl.col("LENGTH") * pl.col("WEIGHT")).sum().alias("DOWNTIME"),
+    )
+    blamed = grizzly.filter(pl.col("TRUCK_ID").is_not_null()).group_by(
+        pl.col("TRUCK_ID"), day, shift, pl.col("AREA")
+    ).agg(
+        pl.len().alias("BLAMED"),
+        pl.col("LENGTH").sum().alias("BLAMED_DOWNTIME"),
+    )
+
+    rows = tipped
+    for df in (shared, blamed):
+        rows = rows.join(df, on=list(KEYS), how="full", coalesce=True)
+    return rows.select(
+        *KEYS,
+        *[pl.col(col).fill_null(0).cast(dtype) for col, dtype in MEASURES.items()],
+    )
+
+
+def _sorted(rows):
+    # Rows in index order: by truck name, then day, shift and area
+    return rows.sort(pl.col("TRUCK_ID").cast(pl.String), *KEYS[1:])
+
+
+def _ranges(frame):
+    # {truck: (first row, last row + 1)} of a frame in index order
+    bounds = frame.with_row_index("ROW").group_by(pl.col("TRUCK_ID").cast(pl.String)).agg(
+        pl.col("ROW").min().alias("LO"), (pl.col("ROW").max() + 1).alias("HI")
+    )
+    return {truck: (lo, hi) for truck, lo, hi in bounds.iter_rows()}
+
+
+def _derived():
+    # Rates of a frame of summed index columns
+    kt = pl.col("MASS") / 1000
+    return (
+        (pl.col("RR_MASS") / pl.col("RATED_MASS")).alias("RR_MEAN"),
+        (pl.col("EVENTS") / kt).alias("EVENTS_PER_KT"),
+        (pl.col("DOWNTIME") / kt).alias("DOWNTIME_PER_KT"),
+        (pl.col("BLAMED") / kt).alias("BLAMED_PER_KT"),
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class TruckIndex:
+    """Index rows in truck order and the row range of every truck, with its build parameters."""
+    frame: pl.DataFrame
+    ranges: dict
+    window: dt.timedelta = attribution.WINDOW
+    weights: str = "recency"
+    roster: shifts.Roster = shifts.DEFAULT_ROSTER
+
+    def truck(self, truck_id, start=None, end=None):
+        """Index rows of one truck (start <= SHIFT_DATE < end), empty for an unknown truck."""
+        lo, hi = self.ranges.get(truck_id, (0, 0))
+        df = self.frame.slice(lo, hi - lo)
+        if start is not None:
+            df = df.filter(pl.col("SHIFT_DATE") >= start)
+        if end is not None:
+            df = df.filter(pl.col("SHIFT_DATE") < end)
+        return df
+
+    def totals(self, by=("TRUCK_ID",), start=None, end=None, **filters):
+        """Index columns summed per group of by over start <= SHIFT_DATE < end, with the rates.
+
+        Keyword filters select key values, e.g. AREA="Primary Crushing - A" or SHIFT=[0].
+        Adds RR_MEAN and EVENTS_PER_KT, DOWNTIME_PER_KT and BLAMED_PER_KT (per 1000 t).
+        """
+        df = self.frame
+        if start is not None:
+            df = df.filter(pl.col("SHIFT_DATE") >= start)
+        if end is not None:
+            df = df.filter(pl.col("SHIFT_DATE") < end)
+        for col, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                df = df.filter(pl.col(col).cast(pl.String).is_in([str(v) for v in value]))
+            else:
+                df = df.filter(pl.col(col) == value)
+        # Summed in double precision: a year of Float32 sums would lose the last tonnes
+        return df.group_by(*by).agg(
+            *[pl.col(col).cast(pl.Float64 if dtype == pl.Float32 else dtype).sum() for col, dtype in MEASURES.items()]
+        ).with_columns(*_derived())
+
+    def top(self, k=10, start=None, end=None, metric="EVENTS_PER_KT", by=("TRUCK_ID",), min_mass=MIN_MASS,
+            **filters):
+        """The k groups of by (trucks by default) with the highest metric over the period.
+
+        Groups that tipped less than min_mass tonnes in the period are left out, as a few
+        loads give meaningless rates. See totals for the filters.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}, got {metric!r}")
+        return (
+            self.totals(by, start, end, **filters)
+            .filter(pl.col("MASS") >= min_mass)
+            .sort(metric, *by, descending=[True] + [False] * len(by), nulls_last=True)
+            .head(k)
+        )
+
+
+def build(tips, joined, window=attribution.WINDOW, weights="recency", roster=shifts.DEFAULT_ROSTER):
+    """Index of the tips and the joined events (join.attach_last_tip) of all areas.
+
+    Both frames must be sorted by time. window and weights are those of
+    attribution.attribute_events; roster gives the production days and shifts. A period
+    without tips or events gives an index without rows.
+    """
+    frame = _sorted(_rows(tips, joined, window, weights, roster))
+    return TruckIndex(frame, _ranges(frame), window, weights, roster)
+
+
+def update(index, tips, joined, first_day):
+    """Index with the days from first_day onwards recomputed from the full tips and joined events.
+
+    first_day is the earliest production day touched by new rows
+    (incremental.first_affected_day). An event is shared with the tips of the window
+    before it, so the days of the tips up to a window before first_day are redone too
+    (the join tolerance of joined is assumed to be shorter than a day as well).
+    """
+    if first_day is None:
+        return index
+    since = first_day - dt.timedelta(days=math.ceil(index.window / dt.timedelta(days=1)))
+    # Events from the first day redone, and every tip they can be linked to
+    start = shifts.day_start(index.roster, since)
+    recomputed = _rows(
+        tips.filter(pl.col("TIP_DATETIME") >= start - index.window),
+        joined.filter(pl.col("EVENT_START") >= start),
+        index.window, index.weights, index.roster,
+    ).filter(pl.col("SHIFT_DATE") >= since)
+    frame = _sorted(splice_days(index.frame, recomputed, since))
+    return dataclasses.replace(index, frame=frame, ranges=_ranges(frame))
+
+
+def save(index, path):
+    """Write the index rows to an uncompressed Arrow IPC file."""
+    index.frame.write_ipc(path, compression="uncompressed")
+    return path
+
+
+def load(path, window=attribution.WINDOW, weights="recency", roster=shifts.DEFAULT_ROSTER):
+    """Read an index written by save, given the parameters it was built with."""
+    frame = pl.read_ipc(path)
+    return TruckIndex(frame, _ranges(frame), window, weights, roster)
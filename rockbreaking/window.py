@@ -0,0 +1,98 @@
+"""Cutting the study period out of the full history.
+
+The tip and event frames are kept sorted by TIP_DATETIME and EVENT_START, so the rows of a
+study period are one contiguous block. Its bounds are found with two binary searches
+(search_sorted) and the block is returned as a slice of the full frame, which shares its
+memory instead of copying it. Moving the study period therefore costs O(log n) per frame
+instead of a filter over every row.
+"""
+import datetime as dt
+
+import polars as pl
+
+from . import shifts
+
+
+def sorted_slice(df, col, start=None, end=None):
+    """Rows with start <= col <= end of a frame sorted by col, as a zero-copy slice.
+
+    Either bound can be None to leave that side open.
+    """
+    values = df[col]
+    lo = 0 if start is None else values.search_sorted(start, side="left")
+    hi = len(values) if end is None else values.search_sorted(end, side="right")
+    return df.slice(lo, max(hi - lo, 0))
+
+
+def slice_tips(tips, start_time=None, end_time=None):
+    """Tips with start_time <= TIP_DATETIME <= end_time (tips sorted by TIP_DATETIME)."""
+    return sorted_slice(tips, "TIP_DATETIME", start_time, end_time)
+
+
+def slice_events(events, start_time=None, end_time=None):
+    """Events that start and end inside the window (events sorted by EVENT_START).
+
+    The slice on EVENT_START is exact; the few events of the last day that end after
+    end_time are then dropped from the slice.
+    """
+    events = sorted_slice(events, "EVENT_START", start_time, end_time)
+    if end_time is not None:
+        events = events.filter(pl.col("EVENT_END") <= end_time)
+    return events
+
+
+def splice_days(previous, recomputed, first_day, date_col="SHIFT_DATE"):
+    """Replace the rows of a per-day frame from first_day onwards with freshly computed ones.
+
+    Used after rows were appended to the logs (incremental.py); first_day None keeps
+    previous as it is.
+    """
+    if first_day is None:
+        return previous
+    return pl.concat([previous.filter(pl.col(date_col) < first_day), recomputed])
+
+
+def day_bounds(first_day, last_day):
+    """Cube query bounds (cube.query start/end) covering production days first_day to last_day."""
+    return {"start": first_day, "end": last_day + dt.timedelta(days=1)}
+
+
+def period_label(first_day, last_day):
+    """Study period as shown in the chart titles, e.g. '24/07 - 31/07 2024'."""
+    return f"{first_day:%d/%m} - {last_day + dt.timedelta(days=1):%d/%m %Y}"
+
+
+def study_window(roster, first_day, last_day):
+    """Everything the report needs to know about the study period of production days.
+
+    Returns start_time and end_time (from the first shift of first_day to the first shift
+    after last_day, in the timezone of the data), study_days (the cube query bounds) and
+    period_label (used in the chart titles).
+    """
+    study_days = day_bounds(first_day, last_day)
+    return {
+        "start_time": shifts.day_start(roster, first_day),
+        "end_time": shifts.day_start(roster, study_days["end"]),
+        "study_days": study_days,
+        "period_label": period_label(first_day, last_day),
+    }
+
+
+def weeks(first_day, last_day):
+    """(first, last) production days of the Monday to Sunday weeks overlapping the range."""
+    monday = first_day - dt.timedelta(days=first_day.weekday())
+    return [
+        (monday + dt.timedelta(weeks=i), monday + dt.timedelta(weeks=i, days=6))
+        for i in range((last_day - monday).days // 7 + 1)
+    ]
+
+
+def months(first_day, last_day):
+    """(first, last) production days of the calendar months overlapping the range."""
+    periods = []
+    first = first_day.replace(day=1)
+    while first <= last_day:
+        following = (first + dt.timedelta(days=32)).replace(day=1)
+        periods.append((first, following - dt.timedelta(days=1)))
+        first = following
+    return periods
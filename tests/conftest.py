@@ -0,0 +1,34 @@
+"""Shared fixtures: the shipped CSVs, copied so that their caches are built in a temporary folder."""
+import os
+import shutil
+
+import pytest
+
+from rockbreaking import areas
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CSV_FILES = [*areas.TIP_FILES.values(), areas.EVENT_FILE]
+
+
+def csv_lines(name):
+    """Lines of a shipped CSV, header first, each with its newline."""
+    with open(os.path.join(REPO_DIR, name), "rb") as f:
+        return f.read().splitlines(keepends=True)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """Folder holding a copy of the shipped CSVs."""
+    for name in CSV_FILES:
+        shutil.copy(os.path.join(REPO_DIR, name), tmp_path / name)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def shipped(tmp_path_factory):
+    """(tips, events) of the shipped CSVs, as areas.load returns them."""
+    folder = tmp_path_factory.mktemp("shipped")
+    for name in CSV_FILES:
+        shutil.copy(os.path.join(REPO_DIR, name), folder / name)
+    return areas.load(folder)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from rockbreaking import attribution
+
+MINUTE = 60_000_000
+
+
+def test_link_ranges_covers_the_tips_of_the_window():
+    tips = np.array([0, 10, 20, 30, 40]) * MINUTE
+    events = np.array([5, 30, 100]) * MINUTE
+    lo, hi = attribution.link_ranges(events, tips, 20 * MINUTE)
+    # Both ends of the window are included: a tip at the event start and one window before it
+    assert lo.tolist() == [0, 1, 5]
+    assert hi.tolist() == [1, 4, 5]
+
+
+def test_link_ranges_keeps_the_latest_max_tips():
+    tips = np.array([0, 10, 20, 30, 40]) * MINUTE
+    lo, hi = attribution.link_ranges(np.array([45]) * MINUTE, tips, 60 * MINUTE, max_tips=2)
+    assert (lo.tolist(), hi.tolist()) == ([3], [5])
+
+
+def test_expand_ranges_pairs_every_event_with_its_tips():
+    event_idx, tip_idx = attribution.expand_ranges(np.array([0, 1, 5]), np.array([1, 4, 5]))
+    assert event_idx.tolist() == [0, 1, 1, 1]
+    assert tip_idx.tolist() == [0, 1, 2, 3]
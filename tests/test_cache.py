@@ -0,0 +1,115 @@
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from rockbreaking import cache
+
+from conftest import csv_lines
+
+EVENTS = csv_lines("RB_DATA.csv")
+
+
+def cached(path):
+    return pl.read_ipc(cache.cache_paths(path)[0])
+
+
+def rebuilt(path, tmp_path):
+    # The frame a cold parse of the whole CSV gives, cached in a folder of its own
+    return cache.rebuild(path, "events", cache_dir=tmp_path / "cold")
+
+
+@pytest.fixture
+def csv(tmp_path):
+    path = tmp_path / "RB_DATA.csv"
+    path.write_bytes(b"".join(EVENTS[:101]))
+    cache.refresh(path, "events")
+    return path
+
+
+def append(path, *lines):
+    with open(path, "ab") as f:
+        f.write(b"".join(lines))
+
+
+def test_fresh_cache_is_not_read_again(csv):
+    assert cache.is_fresh(csv)
+    assert cache.refresh(csv, "events") is None
+    assert cached(csv).height == 100
+
+
+def test_append_in_order(csv, tmp_path):
+    append(csv, *EVENTS[101:111])
+    tail = cache.refresh(csv, "events")
+    assert tail.height == 10
+    assert_frame_equal(cached(csv), rebuilt(csv, tmp_path))
+    assert cache.is_fresh(csv)
+
+
+def test_append_out_of_order(csv, tmp_path):
+    # Rows of the start of the log arriving late are merged into the sorted history
+    append(csv, *EVENTS[111:121], *EVENTS[1:4])
+    tail = cache.refresh(csv, "events")
+    assert tail.height == 13
+    df = cached(csv)
+    assert df["EVENT_START"].is_sorted()
+    assert_frame_equal(df, rebuilt(csv, tmp_path))
+
+
+def test_partial_line_is_finished_by_the_next_write(csv, tmp_path):
+    line = EVENTS[101]
+    append(csv, line[:15])
+    assert cache.refresh(csv, "events").is_empty()
+    assert cached(csv).height == 100
+
+    append(csv, line[15:], EVENTS[102])
+    tail = cache.refresh(csv, "events")
+    assert tail.height == 2
+    assert_frame_equal(cached(csv), rebuilt(csv, tmp_path))
+
+
+def test_last_line_without_newline_is_kept_then_rebuilt(csv, tmp_path):
+    append(csv, EVENTS[101].rstrip(b"\n"))
+    assert cache.refresh(csv, "events").height == 1
+    assert cache.read_meta(csv)["partial"] == 1
+
+    # The next write continues that line, so the cache cannot be appended to
+    append(csv, b"\n", EVENTS[102])
+    assert cache.append_tail(csv, "events") is None
+    cache.refresh(csv, "events")
+    assert cached(csv).height == 102
+    assert_frame_equal(cached(csv), rebuilt(csv, tmp_path))
+
+
+def test_rewritten_file_is_rebuilt(csv, tmp_path):
+    # Same rows in another order, plus one more: the bytes already ingested changed
+    csv.write_bytes(b"".join([EVENTS[0], *EVENTS[50:101], *EVENTS[1:50], EVENTS[101]]))
+    assert cache.append_tail(csv, "events") is None
+    assert cache.refresh(csv, "events").height == 101
+    assert_frame_equal(cached(csv), rebuilt(csv, tmp_path))
+
+
+def test_truncated_file_is_rebuilt(csv):
+    csv.write_bytes(b"".join(EVENTS[:51]))
+    assert cache.append_tail(csv, "events") is None
+    cache.refresh(csv, "events")
+    assert cached(csv).height == 50
+
+
+def test_rows_appended_while_reading_are_not_lost(csv, monkeypatch, tmp_path):
+    read_rows = cache.read_rows
+
+    def racing(path, schema, offset=0):
+        # The dispatch system appends a row after the tail was read, before the cache is written
+        result = read_rows(path, schema, offset)
+        append(path, EVENTS[105])
+        return result
+
+    append(csv, *EVENTS[101:105])
+    monkeypatch.setattr(cache, "read_rows", racing)
+    assert cache.refresh(csv, "events").height == 4
+    monkeypatch.setattr(cache, "read_rows", read_rows)
+
+    assert not cache.is_fresh(csv)
+    assert cache.refresh(csv, "events").height == 1
+    assert cached(csv).height == 105
+    assert_frame_equal(cached(csv), rebuilt(csv, tmp_path))
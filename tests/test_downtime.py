@@ -0,0 +1,46 @@
+import datetime as dt
+
+import polars as pl
+
+from rockbreaking import downtime
+
+T0 = dt.datetime(2024, 7, 24, 6)
+
+
+def events(*rows):
+    # (area, location, start minute, end minute) rows as an event frame
+    return pl.DataFrame(
+        [(area, location, T0 + dt.timedelta(minutes=start), T0 + dt.timedelta(minutes=end))
+         for area, location, start, end in rows],
+        schema=["AREA", "LOCATION", "EVENT_START", "EVENT_END"], orient="row",
+    )
+
+
+EVENTS = events(
+    ("A", "Grizzly", 0, 10),
+    ("A", "Crusher", 5, 20),
+    ("A", "Grizzly", 30, 40),
+    ("B", "Grizzly", 0, 10),
+    ("B", "Grizzly", 5, 15),
+)
+
+
+def test_sweep_counts_the_events_running():
+    swept, locations = downtime._sweep(EVENTS, "AREA")
+    assert locations == ["Crusher", "Grizzly"]
+    area_a = swept.filter(pl.col("AREA") == "A")
+    assert area_a["RUNNING"].to_list() == [1, 2, 1, 0, 1, 0]
+    assert area_a["LOCATIONS_RUNNING"].to_list() == [1, 2, 1, 0, 1, 0]
+    assert area_a["SEGMENT"].to_list() == [5.0, 5.0, 10.0, 10.0, 10.0, 0.0]
+
+
+def test_downtime_summary_counts_overlaps_once():
+    summary = downtime.downtime_summary(EVENTS)
+    assert summary.rows() == [("A", 35.0, 30.0, 5.0), ("B", 20.0, 15.0, 0.0)]
+
+
+def test_exclusive_times_and_overlap_add_up_to_the_downtime():
+    exclusive = downtime.exclusive_time(EVENTS)
+    assert exclusive.filter(pl.col("AREA") == "A").rows() == [("A", "Crusher", 10.0), ("A", "Grizzly", 15.0)]
+    # Overlapping events at the same location are not an overlap between locations
+    assert exclusive.filter(pl.col("AREA") == "B").rows() == [("B", "Crusher", 0.0), ("B", "Grizzly", 15.0)]
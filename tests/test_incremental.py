@@ -0,0 +1,64 @@
+import datetime as dt
+
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from rockbreaking import cube, incremental, join, shifts, trucks
+
+from conftest import csv_lines
+
+ROSTER = shifts.ROSTERS["2x12"]
+
+# Rows of each CSV held back and appended in two batches
+HELD_BACK = {"A_DATA.csv": 300, "B_DATA.csv": 10, "RB_DATA.csv": 60}
+
+
+def run(pipeline):
+    tips, events = pipeline.load()
+    joined = pipeline.joined(events, tips)
+    return tips, events, joined, pipeline.cube(joined), pipeline.trucks(tips, joined)
+
+
+def test_pipeline_equals_a_cold_rebuild_after_appends(tmp_path):
+    lines = {name: csv_lines(name) for name in HELD_BACK}
+    for name, rows in lines.items():
+        (tmp_path / name).write_bytes(b"".join(rows[:len(rows) - HELD_BACK[name]]))
+    pipeline = incremental.Pipeline(tmp_path, ROSTER)
+    run(pipeline)
+
+    for half in (0, 1):
+        for name, rows in lines.items():
+            held = HELD_BACK[name]
+            with open(tmp_path / name, "ab") as f:
+                f.write(b"".join(rows[-held:-held // 2] if half == 0 else rows[-held // 2:]))
+        tips, events, joined, rb_cube, truck_index = run(pipeline)
+
+    # Only appended days were recomputed: no stage was built again from scratch
+    assert all(day not in (None, incremental.REBUILT) for day in pipeline.changes[1:])
+    assert pipeline.version("joined") == 1
+
+    full = join.attach_last_tip(events, tips)
+    assert_frame_equal(joined, full)
+    for grain, frame in cube.build_cube(full).items():
+        assert_frame_equal(rb_cube[grain], frame, check_exact=False)
+    cold = trucks.build(tips, full, roster=ROSTER)
+    assert_frame_equal(truck_index.frame, cold.frame, check_exact=False, rel_tol=1e-5)
+    assert truck_index.ranges == cold.ranges
+
+
+def test_reloading_unchanged_csvs_keeps_every_frame(data_dir):
+    pipeline = incremental.Pipeline(data_dir, ROSTER)
+    first = run(pipeline)
+    second = run(pipeline)
+    assert pipeline.changes[-1] is None
+    assert second[2] is first[2] and second[3] is first[3]
+
+
+def test_first_affected_day_is_the_production_day_of_the_earliest_row():
+    late_tip = pl.DataFrame({"TIP_DATETIME": ["2024-07-25 05:30", "2024-07-26 12:00"]}).with_columns(
+        pl.col("TIP_DATETIME").str.to_datetime()
+    )
+    # 05:30 is still in the night shift of the production day before
+    assert incremental.first_affected_day(late_tip, None, roster=ROSTER) == dt.date(2024, 7, 24)
+    assert incremental.first_affected_day(None, late_tip.clear(), roster=ROSTER) is None
+
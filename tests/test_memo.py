@@ -0,0 +1,57 @@
+import dataclasses
+
+import polars as pl
+import pytest
+
+from rockbreaking import memo
+
+FRAME = pl.DataFrame({"A": [1, 2, 3], "B": ["x", "y", "z"]})
+
+
+def test_fingerprint_follows_the_content_of_frames():
+    assert memo.fingerprint(FRAME) == memo.fingerprint(FRAME.clone())
+    assert memo.fingerprint(FRAME) != memo.fingerprint(FRAME.with_columns(pl.col("A") + 1))
+    assert memo.fingerprint(FRAME) != memo.fingerprint(FRAME.reverse())
+    assert memo.fingerprint(FRAME) != memo.fingerprint(FRAME.cast({"A": pl.Float64}))
+    assert memo.fingerprint(FRAME) != memo.fingerprint(FRAME.clear())
+
+
+def test_fingerprint_of_containers_and_values():
+    assert memo.fingerprint({"a": 1, "b": FRAME}) == memo.fingerprint({"b": FRAME, "a": 1})
+    assert memo.fingerprint((1, 2)) != memo.fingerprint([1, 2])
+    assert memo.fingerprint("2h") != memo.fingerprint("4h")
+    assert memo.fingerprint(FRAME["A"]) != memo.fingerprint(FRAME["A"].rename("C"))
+
+
+def test_fingerprint_of_functions_and_bound_methods():
+    @dataclasses.dataclass(frozen=True)
+    class Scaled:
+        factor: int
+
+        def apply(self, df):
+            return df.select(pl.col("A") * self.factor)
+
+    assert memo.fingerprint(Scaled(2).apply) == memo.fingerprint(Scaled(2).apply)
+    assert memo.fingerprint(Scaled(2).apply) != memo.fingerprint(Scaled(3).apply)
+    assert memo.fingerprint(len) != memo.fingerprint(sum)
+
+
+def test_lazy_frames_are_refused():
+    with pytest.raises(TypeError):
+        memo.fingerprint(FRAME.lazy())
+
+
+def test_memo_reuses_results_in_memory_and_on_disk(tmp_path):
+    calls = []
+
+    def total(df):
+        calls.append(df)
+        return df["A"].sum()
+
+    cached = memo.Memo(cache_dir=tmp_path)
+    assert cached(total, FRAME) == cached(total, FRAME.clone()) == 6
+    assert len(calls) == 1 and cached.stats["hits"] == 1
+
+    restarted = memo.Memo(cache_dir=tmp_path)
+    assert restarted(total, FRAME) == 6
+    assert len(calls) == 1 and restarted.stats["disk_hits"] == 1
@@ -0,0 +1,42 @@
+import datetime as dt
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from rockbreaking import rolling
+
+
+def batches(df, late):
+    # Rows of a frame split into the first half, the second half and late rows taken from
+    # the middle of the first half, each batch in time order
+    half, start = df.height // 2, df.height // 4
+    early = pl.concat([df.slice(0, start), df.slice(start + late, half - start - late)])
+    return early, df.slice(half), df.slice(start, late)
+
+
+def test_appending_in_batches_equals_the_full_series(shipped):
+    tips, events = shipped
+    live = rolling.Rolling()
+    for event_batch, tip_batch in zip(batches(events, 10), batches(tips, 50)):
+        assert not (event_batch.is_empty() or tip_batch.is_empty())
+        changed = live.append(event_batch, tip_batch)
+
+    # The late rows change the series from their first bucket on
+    first = min(event_batch["EVENT_START"].min(), tip_batch["TIP_DATETIME"].min())
+    assert changed["BUCKET"].min() == pl.Series([first]).dt.truncate(rolling.EVERY).item()
+    assert_frame_equal(live.series, rolling.metrics(events, tips), check_exact=False)
+
+
+def test_a_new_location_gets_its_whole_series(shipped):
+    tips, events = shipped
+    grizzly = events.filter(pl.col("LOCATION") == "Grizzly")
+    live = rolling.Rolling()
+    live.append(grizzly, tips)
+    live.append(events.filter(pl.col("LOCATION") != "Grizzly"), tips.clear())
+    assert_frame_equal(live.series, rolling.metrics(events, tips), check_exact=False)
+
+
+def test_windows_must_be_whole_buckets():
+    with pytest.raises(ValueError):
+        rolling.Rolling(every=dt.timedelta(minutes=15), periods=(dt.timedelta(minutes=20),))
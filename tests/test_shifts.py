@@ -0,0 +1,44 @@
+import datetime as dt
+
+import polars as pl
+
+from rockbreaking import shifts
+
+# Site on Sydney time (daylight saving from 2024-10-06 02:00, 10:00 to 11:00 ahead of
+# UTC) with the CSVs recorded in UTC
+SYDNEY = shifts.Roster("2x12", (dt.time(6), dt.time(18)), timezone="Australia/Sydney", data_timezone="UTC")
+
+
+def keys(roster, *times):
+    df = pl.DataFrame({"T": [dt.datetime.fromisoformat(t) for t in times]})
+    return shifts.add_shift_keys(df, "T", roster).select("SHIFT_DATE", "SHIFT", "SHIFT_ID").rows()
+
+
+def test_shift_keys_of_site_local_data():
+    roster = shifts.ROSTERS["2x12"]
+    (day, night, next_day) = keys(roster, "2024-07-24 06:00", "2024-07-25 05:59", "2024-07-25 06:00")
+    assert day[:2] == (dt.date(2024, 7, 24), 0)
+    assert night[:2] == (dt.date(2024, 7, 24), 1)
+    assert next_day[:2] == (dt.date(2024, 7, 25), 0)
+    assert (night[2] - day[2], next_day[2] - night[2]) == (1, 1)
+
+
+def test_shift_keys_across_the_start_of_daylight_saving():
+    # 06:00 local is 20:00 UTC the day before under standard time, 19:00 under daylight saving
+    rows = keys(SYDNEY, "2024-10-04 20:00", "2024-10-05 07:59", "2024-10-05 08:00", "2024-10-05 18:59",
+                "2024-10-05 19:00", "2024-10-06 07:00")
+    assert [row[:2] for row in rows] == [
+        (dt.date(2024, 10, 5), 0),
+        (dt.date(2024, 10, 5), 0),
+        (dt.date(2024, 10, 5), 1),
+        (dt.date(2024, 10, 5), 1),
+        (dt.date(2024, 10, 6), 0),
+        (dt.date(2024, 10, 6), 1),
+    ]
+    ids = sorted({row[2] for row in rows})
+    assert ids == list(range(ids[0], ids[0] + 4))
+
+
+def test_day_start_follows_daylight_saving():
+    assert shifts.day_start(SYDNEY, dt.date(2024, 10, 5)) == dt.datetime(2024, 10, 4, 20)
+    assert shifts.day_start(SYDNEY, dt.date(2024, 10, 6)) == dt.datetime(2024, 10, 5, 19)